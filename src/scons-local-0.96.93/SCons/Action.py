@@ -266,6 +266,12 @@ class ActionBase:
         return SCons.Executor.Executor(self, env, overrides,
                                        tlist, slist, executor_kw)
 
+    def get_batch_action(self, target, source, env):
+        """Return the action that can build the target from the source
+        as part of a batch (see CommandAction.batch_execute()), or None
+        if there isn't one."""
+        return None
+
 if SCons.Memoize.use_old_memoization():
     _Base = ActionBase
     class ActionBase(SCons.Memoize.Memoizer, _Base):
@@ -277,7 +283,7 @@ if SCons.Memoize.use_old_memoization():
 
 class _ActionAction(ActionBase):
     """Base class for actions that create output objects."""
-    def __init__(self, strfunction=_null, presub=_null, chdir=None, exitstatfunc=None, **kw):
+    def __init__(self, strfunction=_null, presub=_null, chdir=None, exitstatfunc=None, batch=None, **kw):
         if not strfunction is _null:
             self.strfunction = strfunction
         if presub is _null:
@@ -287,6 +293,7 @@ class _ActionAction(ActionBase):
         if not exitstatfunc:
             exitstatfunc = default_exitstatfunc
         self.exitstatfunc = exitstatfunc
+        self.batch = batch
 
     def print_cmd_line(self, s, target, source, env):
         sys.stdout.write(s + "\n")
@@ -497,6 +504,69 @@ class CommandAction(_ActionAction):
             cmd = str(cmd)
         return env.subst_target_source(cmd, SUBST_SIG, target, source)
 
+    def get_batch_action(self, target, source, env):
+        if self.batch and not self.chdir and \
+           env.subst(self.batch, 0, target, source):
+            return self
+        return None
+
+    def batch_execute(self, target, source, env):
+        """Build each target from the matching source with one run of
+        our batch command line (the "batch" keyword argument), for
+        compilers that take many sources at once but always put the
+        output for each one in the current directory.
+
+        The command runs in a fresh temporary directory, which it gets
+        as $BATCHDIR (so it has to refer to everything else by absolute
+        path), and we then move each output file, named after the
+        source with a $BATCHOBJSUFFIX suffix, to its target.  Sources
+        whose outputs would have the same name get built by separate
+        runs.  Returns a list of the exit status for each target.
+        """
+        import shutil
+        import tempfile
+        stat = [0] * len(target)
+        suffix = env.subst('$BATCHOBJSUFFIX')
+        pending = range(len(target))
+        while pending:
+            names = {}
+            run = []
+            rest = []
+            for i in pending:
+                name = os.path.splitext(os.path.basename(str(source[i])))[0]
+                name = os.path.normcase(name + suffix)
+                if names.has_key(name):
+                    rest.append(i)
+                else:
+                    names[name] = i
+                    run.append(i)
+            tlist = map(lambda i, t=target: t[i], run)
+            slist = map(lambda i, s=source: s[i], run)
+            tmpdir = tempfile.mktemp()
+            os.mkdir(tmpdir)
+            try:
+                benv = env.Override({'BATCHDIR' : tmpdir})
+                act = CommandAction(self.batch)
+                result = act(tlist, slist, benv)
+                if execute_actions:
+                    for name, i in names.items():
+                        out = os.path.join(tmpdir, name)
+                        if not os.path.exists(out):
+                            # The compiler didn't produce this one, and
+                            # presumably told the user why.
+                            stat[i] = result or 1
+                            continue
+                        dest = target[i].get_abspath()
+                        try:
+                            os.rename(out, dest)
+                        except OSError:
+                            shutil.copy2(out, dest)
+                            os.unlink(out)
+            finally:
+                shutil.rmtree(tmpdir, 1)
+            pending = rest
+        return stat
+
 class CommandGeneratorAction(ActionBase):
     """Class for command-generator actions."""
     def __init__(self, generator, *args, **kw):
@@ -542,6 +612,10 @@ class CommandGeneratorAction(ActionBase):
         """
         return self._generate(target, source, env, 1).get_contents(target, source, env)
 
+    def get_batch_action(self, target, source, env):
+        act = self._generate(target, source, env, 0)
+        return act.get_batch_action(target, source, env)
+
 
 
 # A LazyAction is a kind of hybrid generator and command action for
@@ -611,7 +611,7 @@ class BuilderBase:
                 env_kw = kw
         else:
             env_kw = self.overrides
-        env = env.Override(env_kw)
+        env = env._shared_override(env_kw)
         return self._execute(env, target, source, OverrideWarner(kw), ekw)
 
     def adjust_suffix(self, suff):
@@ -0,0 +1,123 @@
+"""SCons.Client
+
+The other end of "scons --server" (see SCons.Script.Server).  If a
+build server is running in the current directory, the scons script
+hands it the command line and passes on what the build prints, instead
+of loading the build engine and reading the SConscript files itself.
+
+This module is imported before anything else in SCons, so it only uses
+the standard library.
+
+"""
+
+
+#
+# Copyright (c) 2001, 2002, 2003, 2004 The SCons Foundation
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY
+# KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+__revision__ = "/home/scons/scons/branch.0/branch.96/baseline/src/engine/SCons/Client.py 0.96.93.D001 2006/11/06 08:31:54 knight"
+
+import marshal
+import os
+import os.path
+import socket
+import struct
+import sys
+
+# The Unix-domain socket the server listens on, in the top-level
+# SConstruct directory.
+socket_name = '.sconsserver'
+
+# Every message is a one-character kind and a length, followed by
+# that many bytes of data.
+REQUEST = 'q'       # client:  marshalled (arguments, directory, environ)
+STDOUT = '1'        # server:  output of the build
+STDERR = '2'        # server:  error output of the build
+EXIT = 'x'          # server:  the exit status of the build
+DECLINE = 'd'       # server:  why it won't do this build
+
+header = '>cl'
+header_size = struct.calcsize(header)
+
+def send(sock, kind, data):
+    sock.sendall(struct.pack(header, kind, len(data)) + data)
+
+def _receive(sock, size):
+    data = ''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise EOFError
+        data = data + chunk
+    return data
+
+def receive(sock):
+    """Return the kind and data of the next message on sock.  Raise
+    EOFError if the other end goes away."""
+    kind, size = struct.unpack(header, _receive(sock, header_size))
+    return kind, _receive(sock, size)
+
+def environ():
+    result = {}
+    for key, value in os.environ.items():
+        result[key] = value
+    return result
+
+def run(args):
+    """Have the build server in the current directory do the build
+    for the given command-line arguments.  Return its exit status, or
+    None if there is no server or it won't do this build, in which
+    case the caller has to build by itself."""
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    if '--server' in args or '--no-server' in args:
+        return None
+    path = os.path.join(os.getcwd(), socket_name)
+    if not os.path.exists(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(path)
+        except socket.error:
+            # A server that went away without removing its socket.
+            return None
+        send(sock, REQUEST, marshal.dumps((args, os.getcwd(), environ())))
+        while 1:
+            try:
+                kind, data = receive(sock)
+            except (EOFError, socket.error):
+                sys.stderr.write("scons: *** The build server went away.\n")
+                return 2
+            if kind == STDOUT:
+                sys.stdout.write(data)
+                sys.stdout.flush()
+            elif kind == STDERR:
+                sys.stderr.write(data)
+                sys.stderr.flush()
+            elif kind == EXIT:
+                return int(data)
+            elif kind == DECLINE:
+                sys.stderr.write("scons: The build server can't do this build (%s); building here.\n" % data)
+                return None
+    finally:
+        sock.close()
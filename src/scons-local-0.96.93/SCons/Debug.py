@@ -34,6 +34,7 @@ __revision__ = "/home/scons/scons/branch.0/branch.96/baseline/src/engine/SCons/D
 import os
 import string
 import sys
+import time
 
 # Recipe 14.10 from the Python Cookbook.
 try:
@@ -197,3 +198,88 @@ def Trace(msg, file=None, mode='w'):
             # Assume we were passed an open file pointer.
             fp = file
     fp.write(msg)
+
+
+
+# Build tracing for --trace-file.  The Taskmaster and the Job classes
+# record events on the Tracer held in the global below (when it's set),
+# and the result is written in the Trace Event Format understood by
+# chrome://tracing, Perfetto and friends:  one "thread" row for the
+# Taskmaster (tid 0) and one row for each job (tid 1..N).
+
+tracer = None
+
+def json_string(s):
+    s = string.replace(s, '\\', '\\\\')
+    s = string.replace(s, '"', '\\"')
+    s = string.replace(s, '\n', '\\n')
+    s = string.replace(s, '\r', '\\r')
+    s = string.replace(s, '\t', '\\t')
+    result = []
+    for c in s:
+        if c < ' ':
+            c = '\\u%04x' % ord(c)
+        result.append(c)
+    return '"' + string.join(result, '') + '"'
+
+def _json(value):
+    t = type(value)
+    if t == type({}):
+        items = map(lambda k, d=value: '%s: %s' % (json_string(str(k)), _json(d[k])),
+                    value.keys())
+        return '{' + string.join(items, ', ') + '}'
+    if t in (type(0), type(0L)):
+        return str(value)
+    if t == type(0.0):
+        return '%.3f' % value
+    return json_string(str(value))
+
+class Tracer:
+    """Collects timestamped build events and writes them to a file
+    as a JSON trace.
+
+    Events are appended to a plain list, which is safe to do from
+    the worker threads of a parallel build without any locking.
+    """
+    def __init__(self, file):
+        self.file = file
+        self.origin = time.time()
+        self.pid = os.getpid()
+        self.events = []
+        self.thread_name(0, 'taskmaster')
+
+    def now(self):
+        """Return the current time stamp in microseconds."""
+        return (time.time() - self.origin) * 1000000.0
+
+    def instant(self, name, tid=0, args=None):
+        self.events.append({'name' : name, 'ph' : 'i', 's' : 't',
+                            'ts' : self.now(), 'tid' : tid, 'args' : args})
+
+    def complete(self, name, start, tid=0, args=None):
+        """Record an event that started at time stamp 'start' and
+        ends now."""
+        self.events.append({'name' : name, 'ph' : 'X', 'ts' : start,
+                            'dur' : self.now() - start, 'tid' : tid,
+                            'args' : args})
+
+    def counter(self, name, value):
+        self.events.append({'name' : name, 'ph' : 'C', 'ts' : self.now(),
+                            'tid' : 0, 'args' : {name : value}})
+
+    def thread_name(self, tid, name):
+        self.events.append({'name' : 'thread_name', 'ph' : 'M', 'ts' : 0,
+                            'tid' : tid, 'args' : {'name' : name}})
+
+    def write(self):
+        fp = open(self.file, 'w')
+        fp.write('{"traceEvents": [\n')
+        events = []
+        for e in self.events:
+            e['pid'] = self.pid
+            if e['args'] is None:
+                del e['args']
+            events.append(_json(e))
+        fp.write(string.join(events, ',\n'))
+        fp.write('\n]}\n')
+        fp.close()
@@ -112,10 +112,10 @@ DirScanner = SCons.Scanner.Dir.DirScanner()
 DirEntryScanner = SCons.Scanner.Dir.DirEntryScanner()
 
 # Actions for common languages.
-CAction = SCons.Action.Action("$CCCOM", "$CCCOMSTR")
-ShCAction = SCons.Action.Action("$SHCCCOM", "$SHCCCOMSTR")
-CXXAction = SCons.Action.Action("$CXXCOM", "$CXXCOMSTR")
-ShCXXAction = SCons.Action.Action("$SHCXXCOM", "$SHCXXCOMSTR")
+CAction = SCons.Action.Action("$CCCOM", "$CCCOMSTR", batch="$CCBATCHCOM")
+ShCAction = SCons.Action.Action("$SHCCCOM", "$SHCCCOMSTR", batch="$SHCCBATCHCOM")
+CXXAction = SCons.Action.Action("$CXXCOM", "$CXXCOMSTR", batch="$CXXBATCHCOM")
+ShCXXAction = SCons.Action.Action("$SHCXXCOM", "$SHCXXCOMSTR", batch="$SHCXXBATCHCOM")
 
 ASAction = SCons.Action.Action("$ASCOM", "$ASCOMSTR")
 ASPPAction = SCons.Action.Action("$ASPPCOM", "$ASPPCOMSTR")
@@ -245,6 +245,12 @@ def _concat(prefix, list, suffix, env, f=lambda x: x, target=None, source=None):
 
     return result
 
+def _absdirs(pathlist):
+    """Like RDirs, but returns absolute path names, for command lines
+    that don't run in the top-level directory (like $CCBATCHCOM)."""
+    dirs = ConstructionEnvironment['RDirs'](pathlist) or []
+    return map(lambda d: d.get_abspath(), dirs)
+
 def _stripixes(prefix, list, suffix, stripprefix, stripsuffix, env, c=None):
     """This is a wrapper around _concat() that checks for the existence
     of prefixes or suffixes on list elements and strips them where it
@@ -365,9 +371,11 @@ ConstructionEnvironment = {
     '_concat'       : _concat,
     '_defines'      : _defines,
     '_stripixes'    : _stripixes,
+    '_absdirs'      : _absdirs,
     '_LIBFLAGS'     : '${_concat(LIBLINKPREFIX, LIBS, LIBLINKSUFFIX, __env__)}',
     '_LIBDIRFLAGS'  : '$( ${_concat(LIBDIRPREFIX, LIBPATH, LIBDIRSUFFIX, __env__, RDirs, TARGET, SOURCE)} $)',
     '_CPPINCFLAGS'  : '$( ${_concat(INCPREFIX, CPPPATH, INCSUFFIX, __env__, RDirs, TARGET, SOURCE)} $)',
+    '_CPPINCABSFLAGS' : '$( ${_concat(INCPREFIX, CPPPATH, INCSUFFIX, __env__, _absdirs, TARGET, SOURCE)} $)',
     '_CPPDEFFLAGS'  : '${_defines(CPPDEFPREFIX, CPPDEFINES, CPPDEFSUFFIX, __env__)}',
     'TEMPFILE'      : NullCmdGenerator,
     'Dir'           : Variable_Method_Caller('TARGET', 'Dir'),
@@ -39,6 +39,7 @@ import copy
 import os
 import os.path
 import popen2
+import stat
 import string
 from UserDict import UserDict
 
@@ -122,6 +123,62 @@ def our_deepcopy(x):
        copy = x
    return copy
 
+def is_mutable(value):
+    """Return true if a construction variable value is one that can be
+    modified in place (a list or dictionary)."""
+    return SCons.Util.is_Dict(value) or SCons.Util.is_List(value)
+
+def overrides_key(overrides):
+    """Return a hashable key for an overrides dictionary, or None if
+    any of the values is something other than a plain string or a
+    flat list of plain strings (a Node, a function, a dictionary...),
+    which we can't safely compare by value.  Values with a $ in them
+    don't count as plain, since Override() expands them against the
+    environment's current values."""
+    items = []
+    for key, value in overrides.items():
+        if type(value) is type(''):
+            if string.find(value, '$') != -1:
+                return None
+            items.append((key, value))
+        elif SCons.Util.is_List(value):
+            for v in value:
+                if type(v) is not type('') or string.find(v, '$') != -1:
+                    return None
+            items.append((key, getattr(value, '__class__', type(value)), tuple(value)))
+        else:
+            return None
+    items.sort()
+    return tuple(items)
+
+def shareable_keys(dict):
+    """Return a dictionary of the keys in a construction variable
+    dictionary whose values are mutable (lists or dictionaries), and
+    so must be copied before being handed out by an environment that
+    shares them with another environment."""
+    shared = {}
+    for key, value in dict.items():
+        if is_mutable(value):
+            shared[key] = 1
+    return shared
+
+def program_identity(command):
+    """Return the path and modification time of the program a command
+    line runs, as found on the PATH of the SCons process (which is
+    where the shell running the command will find it), or None if it
+    can't be found."""
+    words = string.split(command)
+    if not words:
+        return None
+    path = SCons.Util.WhereIs(words[0])
+    if not path:
+        return None
+    try:
+        mtime = os.stat(path)[stat.ST_MTIME]
+    except OSError:
+        return None
+    return (path, mtime)
+
 def apply_tools(env, tools, toolpath):
     # Store the toolpath in the Environment.
     if toolpath is not None:
@@ -278,6 +335,8 @@ class SubstitutionEnvironment:
         self.ans = SCons.Node.Alias.default_ans
         self.lookup_list = SCons.Node.arg2nodes_lookups
         self._dict = kw.copy()
+        self._shared = {}
+        self._subst_cache = {}
         self._init_special()
 
     def _init_special(self):
@@ -295,8 +354,11 @@ class SubstitutionEnvironment:
     def __delitem__(self, key):
         "__cache_reset__"
         del self._dict[key]
+        if self._shared: self._unshare(key)
+        self._reset_subst_cache()
 
     def __getitem__(self, key):
+        if self._shared: self._unshare(key)
         return self._dict[key]
 
     def __setitem__(self, key, value):
@@ -308,17 +370,61 @@ class SubstitutionEnvironment:
             if not SCons.Util.is_valid_construction_var(key):
                 raise SCons.Errors.UserError, "Illegal construction variable `%s'" % key
             self._dict[key] = value
+            if self._shared: self._unshare(key)
+        self._reset_subst_cache()
 
     def get(self, key, default=None):
         "Emulates the get() method of dictionaries."""
+        if self._shared: self._unshare(key)
         return self._dict.get(key, default)
 
     def has_key(self, key):
         return self._dict.has_key(key)
 
     def items(self):
+        self._unshare_all()
         return self._dict.items()
 
+    def _reset_subst_cache(self):
+        """Throw away the remembered expansions of construction variables.
+
+        The subst() and subst_list() methods remember how variables that
+        don't depend on the target or source expanded (see the cache
+        argument of SCons.Subst.scons_subst()).  Each remembered
+        expansion is checked against the values it read before it's
+        used, since lists and dictionaries can be changed in place, but
+        anything that sets a value calls this to start over anyway.
+        """
+        if self._subst_cache:
+            self._subst_cache = {}
+
+    def _unshare(self, key):
+        """Make sure this environment has its own copy of the value of
+        the specified construction variable.
+
+        Cloned environments start out sharing the (mutable) list and
+        dictionary values of the environment they were cloned from;
+        the keys of these values are recorded in the _shared dictionary
+        of both environments.  Before we hand a shared value to anyone
+        who might modify it in place (self['CCFLAGS'] += [...], Append(),
+        etc.), we give this environment a private copy.  A value that's
+        been replaced outright just gets dropped from the _shared list.
+        """
+        try:
+            del self._shared[key]
+        except KeyError:
+            return
+        try:
+            value = self._dict[key]
+        except KeyError:
+            pass
+        else:
+            self._dict[key] = our_deepcopy(value)
+
+    def _unshare_all(self):
+        for key in self._shared.keys():
+            self._unshare(key)
+
     def arg2nodes(self, args, node_factory=_null, lookup_list=_null):
         if node_factory is _null:
             node_factory = self.fs.File
@@ -362,6 +468,9 @@ class SubstitutionEnvironment:
         return nodes
 
     def gvars(self):
+        # Note that this doesn't copy any values this environment still
+        # shares with others.  The caller (variable substitution) only
+        # reads the values, and not having to copy them is the point.
         return self._dict
 
     def lvars(self):
@@ -380,7 +489,7 @@ class SubstitutionEnvironment:
         gvars = self.gvars()
         lvars = self.lvars()
         lvars['__env__'] = self
-        return SCons.Subst.scons_subst(string, self, raw, target, source, gvars, lvars, conv)
+        return SCons.Subst.scons_subst(string, self, raw, target, source, gvars, lvars, conv, self._subst_cache)
 
     def subst_kw(self, kw, raw=0, target=None, source=None):
         nkw = {}
@@ -397,7 +506,7 @@ class SubstitutionEnvironment:
         gvars = self.gvars()
         lvars = self.lvars()
         lvars['__env__'] = self
-        return SCons.Subst.scons_subst_list(string, self, raw, target, source, gvars, lvars, conv)
+        return SCons.Subst.scons_subst_list(string, self, raw, target, source, gvars, lvars, conv, self._subst_cache)
 
     def subst_path(self, path, target=None, source=None):
         """Substitute a path list, turning EntryProxies into Nodes
@@ -441,6 +550,32 @@ class SubstitutionEnvironment:
     subst_target_source = subst
 
     def backtick(self, command):
+        """Return the output of a command.  The output is kept in the
+        .sconsign file along with the path and modification time of the
+        program the command runs, and the command is only run again
+        once the program changes (or if it can't be found on the PATH).
+        This is meant for commands like 'pkg-config' or 'curl-config',
+        whose output only changes when the package they describe gets
+        reinstalled."""
+        identity = program_identity(command)
+        if identity is None:
+            out, err = self._backtick(command)
+        else:
+            key = 'backtick ' + command
+            sconsign = self.fs.Top.sconsign()
+            try:
+                out, err = SCons.SConsign.get_memo(sconsign, key, identity)
+            except KeyError:
+                out, err = self._backtick(command)
+                SCons.SConsign.set_memo(sconsign, key, identity, (out, err))
+        if err:
+            import sys
+            sys.stderr.write(err)
+        return out
+
+    def _backtick(self, command):
+        """Run a command and return what it wrote to its standard output
+        and error, raising OSError if it fails."""
         try:
             popen2.Popen3
         except AttributeError:
@@ -456,17 +591,17 @@ class SubstitutionEnvironment:
             out = p.fromchild.read()
             err = p.childerr.read()
             status = p.wait()
-        if err:
-            import sys
-            sys.stderr.write(err)
         if status:
+            if err:
+                import sys
+                sys.stderr.write(err)
             try:
                 if os.WIFEXITED(status):
                     status = os.WEXITSTATUS(status)
             except AttributeError:
                 pass
             raise OSError("'%s' exited %s" % (command, status))
-        return out
+        return out, err
 
     def Override(self, overrides):
         """
@@ -491,6 +626,35 @@ class SubstitutionEnvironment:
         else:
             return self
 
+    def _shared_override(self, overrides):
+        """Like Override(), but let every caller asking for the same
+        overrides share the expansions remembered by the environment
+        it gets back.
+
+        Builder calls that pass the same keyword overrides (CC='g++'
+        on every file of a library, say) each get an OverrideEnvironment
+        of their own, so an emitter or a caller changing one of them
+        doesn't change the others, but they all keep their expansions
+        in one cache instead of substituting every command line from
+        scratch.  Only overrides with plain string values are shared
+        (see overrides_key()), so the shared expansions stay right even
+        if our own values change later, and an environment stops
+        sharing them as soon as its own values change (see
+        OverrideEnvironment._unshare_override()).
+        """
+        env = self.Override(overrides)
+        if env is self or self._subst_cache is None:
+            return env
+        key = overrides_key(overrides)
+        if not key is None:
+            env.__dict__['_shared_key'] = key
+        return env
+
+    def _build_env_id(self):
+        """Return a key that's the same for build environments that
+        expand everything the same way (see Executor.get_batch())."""
+        return id(self)
+
     def ParseFlags(self, *flags):
         """
         Parse the set of flags and return a dict with the flags placed
@@ -728,10 +892,13 @@ class Base(SubstitutionEnvironment):
         self.fs = SCons.Node.FS.default_fs or SCons.Node.FS.FS()
         self.ans = SCons.Node.Alias.default_ans
         self.lookup_list = SCons.Node.arg2nodes_lookups
-        self._dict = our_deepcopy(SCons.Defaults.ConstructionEnvironment)
+        self._dict = SCons.Defaults.ConstructionEnvironment.copy()
+        self._shared = shareable_keys(self._dict)
+        self._subst_cache = {}
         self._init_special()
 
         self._dict['BUILDERS'] = BuilderDict(self._dict['BUILDERS'], self)
+        del self._shared['BUILDERS']
 
         if platform is None:
             platform = self._dict.get('PLATFORM', None)
@@ -771,6 +938,22 @@ class Base(SubstitutionEnvironment):
         # should override any values set by the tools.
         for key, val in save.items():
             self._dict[key] = val
+        self._reset_subst_cache()
+
+        # Nobody outside holds the list and dictionary values we've
+        # been set up with (the passed-in ones were copied by Replace()
+        # and the tools are done with theirs), so clones can share them
+        # until they're handed out.  The customizable options are the
+        # exception:  their values can still be held by the Options
+        # object.
+        self._shared = shareable_keys(self._dict)
+        del self._shared['BUILDERS']
+        if options:
+            for key in options.keys():
+                try:
+                    del self._shared[key]
+                except KeyError:
+                    pass
 
     #######################################################################
     # Utility methods that are primarily for internal use by SCons.
@@ -873,6 +1056,10 @@ class Base(SubstitutionEnvironment):
         __cache_reset__
         """
         self._dict.update(dict)
+        if self._shared:
+            for key in dict.keys():
+                self._unshare(key)
+        self._reset_subst_cache()
 
     def use_build_signature(self):
         try:
@@ -901,6 +1088,7 @@ class Base(SubstitutionEnvironment):
             # "continue" statements whenever we finish processing an item,
             # but Python 1.5.2 apparently doesn't let you use "continue"
             # within try:-except: blocks, so we have to nest our code.
+            if self._shared: self._unshare(key)
             try:
                 orig = self._dict[key]
             except KeyError:
@@ -950,6 +1138,7 @@ class Base(SubstitutionEnvironment):
                             update_dict(val)
                         except (AttributeError, TypeError, ValueError):
                             orig[val] = None
+        self._reset_subst_cache()
         self.scanner_map_delete(kw)
 
     def AppendENVPath(self, name, newpath, envname = 'ENV', sep = os.pathsep):
@@ -960,6 +1149,7 @@ class Base(SubstitutionEnvironment):
         variable is a list instead of a string.
         """
 
+        if self._shared: self._unshare(envname)
         orig = ''
         if self._dict.has_key(envname) and self._dict[envname].has_key(name):
             orig = self._dict[envname][name]
@@ -970,6 +1160,7 @@ class Base(SubstitutionEnvironment):
             self._dict[envname] = {}
 
         self._dict[envname][name] = nv
+        self._reset_subst_cache()
 
     def AppendUnique(self, **kw):
         """Append values to existing construction variables
@@ -977,6 +1168,7 @@ class Base(SubstitutionEnvironment):
         """
         kw = copy_non_reserved_keywords(kw)
         for key, val in kw.items():
+            if self._shared: self._unshare(key)
             if not self._dict.has_key(key) or self._dict[key] in ('', None):
                 self._dict[key] = val
             elif SCons.Util.is_Dict(self._dict[key]) and \
@@ -997,6 +1189,7 @@ class Base(SubstitutionEnvironment):
                         self._dict[key] = dk + [val]
                 else:
                     self._dict[key] = self._dict[key] + val
+        self._reset_subst_cache()
         self.scanner_map_delete(kw)
 
     def Clone(self, tools=[], toolpath=None, **kw):
@@ -1004,16 +1197,37 @@ class Base(SubstitutionEnvironment):
         copy is like a Python "deep copy"--that is, independent
         copies are made recursively of each objects--except that
         a reference is copied when an object is not deep-copyable
-        (like a function).  There are no references to any mutable
-        objects in the original Environment.
+        (like a function).  Changing a list or dictionary value of
+        one Environment in place never changes the other.
+
+        Most of the copying is done lazily:  a list or dictionary value
+        that the original is still sharing (one it was set up with by
+        its initialization or a tool, or got from the Environment it
+        was cloned from) has never been handed out to anyone, so the
+        clone shares it, too, until one of them hands it out (see
+        _unshare()), at which point that one value gets copied.  Any
+        other list or dictionary value might be held by someone who
+        could still change it, so the clone gets its own copy right
+        away (which clones of the clone can share).
         """
         clone = copy.copy(self)
-        clone._dict = our_deepcopy(self._dict)
+        clone._dict = self._dict.copy()
         try:
             cbd = clone._dict['BUILDERS']
             clone._dict['BUILDERS'] = BuilderDict(cbd, clone)
         except KeyError:
             pass
+        shared = {}
+        for key, value in clone._dict.items():
+            if key == 'BUILDERS' or not is_mutable(value):
+                continue
+            if not self._shared.has_key(key):
+                # The copy is ours alone, so clones of the clone can
+                # share it.
+                clone._dict[key] = our_deepcopy(value)
+            shared[key] = 1
+        clone._shared = shared
+        clone._subst_cache = {}
         
         apply_tools(clone, tools, toolpath)
 
@@ -1034,15 +1248,17 @@ class Base(SubstitutionEnvironment):
         """
         if not SCons.Util.is_List(progs):
             progs = [ progs ]
-        for prog in progs:
-            path = self.WhereIs(prog)
-            if path: return prog
+        path, pathext = self._search_path(None, None)
+        found = SCons.Util.WhereIsAll(progs, path, pathext)
+        for i in range(len(progs)):
+            if found[i]: return progs[i]
         return None
 
     def Dictionary(self, *args):
         if not args:
+            self._unshare_all()
             return self._dict
-        dlist = map(lambda x, s=self: s._dict[x], args)
+        dlist = map(lambda x, s=self: s[x], args)
         if len(dlist) == 1:
             dlist = dlist[0]
         return dlist
@@ -1154,6 +1370,7 @@ class Base(SubstitutionEnvironment):
             # "continue" statements whenever we finish processing an item,
             # but Python 1.5.2 apparently doesn't let you use "continue"
             # within try:-except: blocks, so we have to nest our code.
+            if self._shared: self._unshare(key)
             try:
                 orig = self._dict[key]
             except KeyError:
@@ -1203,6 +1420,7 @@ class Base(SubstitutionEnvironment):
                             update_dict(val)
                         except (AttributeError, TypeError, ValueError):
                             orig[val] = None
+        self._reset_subst_cache()
         self.scanner_map_delete(kw)
 
     def PrependENVPath(self, name, newpath, envname = 'ENV', sep = os.pathsep):
@@ -1213,6 +1431,7 @@ class Base(SubstitutionEnvironment):
         variable is a list instead of a string.
         """
 
+        if self._shared: self._unshare(envname)
         orig = ''
         if self._dict.has_key(envname) and self._dict[envname].has_key(name):
             orig = self._dict[envname][name]
@@ -1223,6 +1442,7 @@ class Base(SubstitutionEnvironment):
             self._dict[envname] = {}
 
         self._dict[envname][name] = nv
+        self._reset_subst_cache()
 
     def PrependUnique(self, **kw):
         """Append values to existing construction variables
@@ -1230,6 +1450,7 @@ class Base(SubstitutionEnvironment):
         """
         kw = copy_non_reserved_keywords(kw)
         for key, val in kw.items():
+            if self._shared: self._unshare(key)
             if not self._dict.has_key(key) or self._dict[key] in ('', None):
                 self._dict[key] = val
             elif SCons.Util.is_Dict(self._dict[key]) and \
@@ -1250,6 +1471,7 @@ class Base(SubstitutionEnvironment):
                         self._dict[key] = [val] + dk
                 else:
                     self._dict[key] = val + dk
+        self._reset_subst_cache()
         self.scanner_map_delete(kw)
 
     def Replace(self, **kw):
@@ -1303,11 +1525,27 @@ class Base(SubstitutionEnvironment):
                 toolpath = self.get('toolpath', [])
             toolpath = map(self.subst, toolpath)
             tool = apply(SCons.Tool.Tool, (tool, toolpath), kw)
+        before = self._dict.copy()
         tool(self)
+        # The lists and dictionaries the tool set up are ours alone
+        # (anything it took from us to change was copied first), so
+        # clones can share them until they're handed out.
+        for key, value in self._dict.items():
+            if key != 'BUILDERS' and is_mutable(value) and \
+               not before.get(key) is value:
+                self._shared[key] = 1
 
     def WhereIs(self, prog, path=None, pathext=None, reject=[]):
         """Find prog in the path.  __cacheable__
         """
+        path, pathext = self._search_path(path, pathext)
+        path = SCons.Util.WhereIs(prog, path, pathext, reject)
+        if path: return path
+        return None
+
+    def _search_path(self, path, pathext):
+        """Return the search path and the list of program extensions
+        to look up programs with, by default the ones in $ENV."""
         if path is None:
             try:
                 path = self['ENV']['PATH']
@@ -1322,9 +1560,7 @@ class Base(SubstitutionEnvironment):
                 pass
         elif SCons.Util.is_String(pathext):
             pathext = self.subst(pathext)
-        path = SCons.Util.WhereIs(prog, path, pathext, reject)
-        if path: return path
-        return None
+        return path, pathext
 
     #######################################################################
     # Public methods for doing real "SCons stuff" (manipulating
@@ -1635,7 +1871,7 @@ class Base(SubstitutionEnvironment):
             side_effect.side_effect = 1
             self.Precious(side_effect)
             for target in targets:
-                target.side_effects.append(side_effect)
+                target.add_side_effect(side_effect)
         return side_effects
 
     def SourceCode(self, entry, builder):
@@ -1716,6 +1952,16 @@ class OverrideEnvironment(Base):
         if __debug__: logInstanceCreation(self, 'Environment.OverrideEnvironment')
         self.__dict__['__subject'] = subject
         self.__dict__['overrides'] = overrides
+        # Don't remember any expansions in the subject's cache.  They'd
+        # be made with this object as $__env__, but the values we
+        # override can change (and then change back) behind the
+        # subject's back.  Environments handed out by the subject's
+        # _shared_override() share a cache with the others that have
+        # the same overrides, which is kept in the subject's cache (so
+        # it goes when the subject changes) and which we stop using
+        # when our own values change.
+        self.__dict__['_subst_cache'] = None
+        self.__dict__['_shared_key'] = None
 
     # Methods that make this class act like a proxy.
     def __getattr__(self, name):
@@ -1723,17 +1969,60 @@ class OverrideEnvironment(Base):
     def __setattr__(self, name, value):
         return setattr(self.__dict__['__subject'], name, value)
 
+    # Support for the environments shared by _shared_override().
+    def _shared_subst_cache(self):
+        """Return the dictionary of remembered expansions for this
+        environment, or None if it isn't shared."""
+        key = self.__dict__['_shared_key']
+        if key is None:
+            return None
+        cache = self.__dict__['__subject']._subst_cache
+        key = ('__override__', key)
+        try:
+            return cache[key]
+        except KeyError:
+            result = cache[key] = {}
+            return result
+    def _unshare_override(self):
+        # Our values are about to differ from those of the other
+        # environments with the same overrides, so stop using (and
+        # adding to) the expansions we share with them.
+        self.__dict__['_shared_key'] = None
+    def _build_env_id(self):
+        key = self.__dict__['_shared_key']
+        if key is None:
+            return id(self)
+        return (id(self.__dict__['__subject']), key)
+
+    def subst(self, string, raw=0, target=None, source=None, conv=None):
+        gvars = self.gvars()
+        lvars = self.lvars()
+        lvars['__env__'] = self
+        return SCons.Subst.scons_subst(string, self, raw, target, source, gvars, lvars, conv, self._shared_subst_cache())
+
+    subst_target_source = subst
+
+    def subst_list(self, string, raw=0, target=None, source=None, conv=None):
+        gvars = self.gvars()
+        lvars = self.lvars()
+        lvars['__env__'] = self
+        return SCons.Subst.scons_subst_list(string, self, raw, target, source, gvars, lvars, conv, self._shared_subst_cache())
+
     # Methods that make this class act like a dictionary.
     def __getitem__(self, key):
         try:
-            return self.__dict__['overrides'][key]
+            value = self.__dict__['overrides'][key]
         except KeyError:
             return self.__dict__['__subject'].__getitem__(key)
+        if is_mutable(value): self._unshare_override()
+        return value
     def __setitem__(self, key, value):
         if not SCons.Util.is_valid_construction_var(key):
             raise SCons.Errors.UserError, "Illegal construction variable `%s'" % key
+        self._unshare_override()
         self.__dict__['overrides'][key] = value
     def __delitem__(self, key):
+        self._unshare_override()
         try:
             del self.__dict__['overrides'][key]
         except KeyError:
@@ -1750,9 +2039,11 @@ class OverrideEnvironment(Base):
     def get(self, key, default=None):
         """Emulates the get() method of dictionaries."""
         try:
-            return self.__dict__['overrides'][key]
+            value = self.__dict__['overrides'][key]
         except KeyError:
             return self.__dict__['__subject'].get(key, default)
+        if is_mutable(value): self._unshare_override()
+        return value
     def has_key(self, key):
         try:
             self.__dict__['overrides'][key]
@@ -1761,6 +2052,7 @@ class OverrideEnvironment(Base):
             return self.__dict__['__subject'].has_key(key)
     def Dictionary(self):
         """Emulates the items() method of dictionaries."""
+        self._unshare_override()
         d = self.__dict__['__subject'].Dictionary().copy()
         d.update(self.__dict__['overrides'])
         return d
@@ -1773,6 +2065,7 @@ class OverrideEnvironment(Base):
         """Update an environment's values directly, bypassing the normal
         checks that occur when users try to set items.
         """
+        self._unshare_override()
         self.__dict__['overrides'].update(dict)
 
     def gvars(self):
@@ -1786,6 +2079,7 @@ class OverrideEnvironment(Base):
     # Overridden public construction environment methods.
     def Replace(self, **kw):
         kw = copy_non_reserved_keywords(kw)
+        self._unshare_override()
         self.__dict__['overrides'].update(our_deepcopy(kw))
 
 # The entry point that will be used by the external world
@@ -1816,6 +2110,10 @@ def NoSubstitutionProxy(subject):
             return getattr(self.__dict__['__subject'], name)
         def __setattr__(self, name, value):
             return setattr(self.__dict__['__subject'], name, value)
+        def __reduce__(self):
+            # This class can't be pickled by name, so pickle the call
+            # that makes one instead.
+            return (NoSubstitutionProxy, (self.__dict__['__subject'],))
         def raw_to_mode(self, dict):
             try:
                 raw = dict['raw']
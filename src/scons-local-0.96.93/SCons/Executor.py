@@ -85,7 +85,7 @@ class Executor:
 
         import SCons.Defaults
         env = self.env or SCons.Defaults.DefaultEnvironment()
-        build_env = env.Override(overrides)
+        build_env = env._shared_override(overrides)
 
         return build_env
 
@@ -100,6 +100,35 @@ class Executor:
             cwd = None
         return scanner.path(env, cwd, self.targets, self.sources)
 
+    def get_batch(self):
+        """Return a key for building this Executor's target together
+        with others, or None if it can't be.
+
+        The targets of Executors that return the same key can all be
+        built by one run of the same batch action (see execute_batch()
+        below), because their build environments expand everything
+        the same way.  Batches
+        are only made in environments that set $BATCHSIZE to more
+        than 1, which is also the largest batch we make, and which we
+        return as the last element of the key.
+        """
+        if self.pre_actions or self.post_actions or \
+           len(self.action_list) != 1 or \
+           len(self.targets) != 1 or len(self.sources) != 1:
+            return None
+        env = self.get_build_env()
+        try:
+            size = int(env.get('BATCHSIZE', 0))
+        except (TypeError, ValueError):
+            return None
+        if size < 2:
+            return None
+        act = self.action_list[0]
+        act = act.get_batch_action(self.targets, self.sources, env)
+        if act is None:
+            return None
+        return (env._build_env_id(), act.batch, size)
+
     def get_kw(self, kw={}):
         result = self.builder_kw.copy()
         result.update(kw)
@@ -235,6 +264,23 @@ class Executor:
         return map(func, self.get_unignored_sources(ignore))
 
 
+def execute_batch(executors):
+    """Build the targets of a list of Executors with the same batch key
+    (see Executor.get_batch()) at once.  Returns a list of the exit
+    status for each one."""
+    executor = executors[0]
+    env = executor.get_build_env()
+    act = executor.action_list[0].get_batch_action(executor.targets,
+                                                   executor.sources,
+                                                   env)
+    targets = []
+    sources = []
+    for e in executors:
+        targets.extend(e.targets)
+        sources.extend(e.sources)
+    return act.batch_execute(targets, sources, env)
+
+
 _Executor = Executor
 
 class Null(_Executor):
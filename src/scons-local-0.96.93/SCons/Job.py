@@ -31,18 +31,57 @@ stop, and wait on jobs.
 
 __revision__ = "/home/scons/scons/branch.0/branch.96/baseline/src/engine/SCons/Job.py 0.96.93.D001 2006/11/06 08:31:54 knight"
 
+import sys
+
+import SCons.Debug
+import SCons.Taskmaster
+
+def gather(taskmaster, task):
+    """Collect the tasks that can be built together with the specified
+    one (see SCons.Taskmaster.Batch) by fetching further tasks from the
+    taskmaster for as long as they have the same batch key.  Tasks
+    with nothing to build (their targets are up to date) come along
+    for the ride, so they don't cut the batch short.
+
+    Returns a tuple of what to execute next (the task itself, or a
+    Batch) and the first task that didn't fit in with it, if any, which
+    the caller has to execute next.
+    """
+    key = task.batch_key()
+    if key is None:
+        return task, None
+    tasks = [task]
+    count = 1
+    left = None
+    while count < key[-1]:
+        left = taskmaster.next_task()
+        if left is None:
+            break
+        if left.batch_key() == key:
+            count = count + 1
+        elif getattr(left, 'out_of_date', 1) or \
+             not left.exc_info()[0] is None:
+            break
+        tasks.append(left)
+        left = None
+    if len(tasks) == 1:
+        return task, left
+    return SCons.Taskmaster.Batch(tasks), left
+
 class Jobs:
     """An instance of this class initializes N jobs, and provides
     methods for starting, stopping, and waiting on all N jobs.
     """
 
-    def __init__(self, num, taskmaster):
+    def __init__(self, num, taskmaster, buffer_output=0):
         """
         create 'num' jobs using the given taskmaster.
 
         If 'num' is 1 or less, then a serial job will be used,
         otherwise a parallel job with 'num' worker threads will
-        be used.
+        be used.  If 'buffer_output' is true, a parallel job writes
+        out what each task prints all at once, when the task is done
+        (see TaskOutput).
 
         The 'num_jobs' attribute will be set to the actual number of jobs
         allocated.  If more than one job is requested but the Parallel
@@ -53,7 +92,7 @@ class Jobs:
         self.job = None
         if num > 1:
             try:
-                self.job = Parallel(taskmaster, num)
+                self.job = Parallel(taskmaster, num, buffer_output)
                 self.num_jobs = num
             except NameError:
                 pass
@@ -99,26 +138,48 @@ class Serial:
         fails to execute (i.e. execute() raises an exception), then the job will
         stop."""
         
+        R = SCons.Debug.tracer
+        if R: R.thread_name(1, 'job 1')
+
+        left = None
         while 1:
-            task = self.taskmaster.next_task()
+            if left is None:
+                task = self.taskmaster.next_task()
+            else:
+                task = left
 
             if task is None:
                 break
 
+            task, left = gather(self.taskmaster, task)
+
+            if R:
+                args = {'node' : str(task.get_target())}
+                start = R.now()
             try:
                 task.prepare()
                 task.execute()
             except KeyboardInterrupt:
                 raise
             except:
+                if R:
+                    R.complete('execute', start, 1, args)
+                    start = R.now()
                 task.exception_set()
                 # Let the failed() callback function arrange for the
                 # build to stop if that's appropriate.
                 task.failed()
+                if R: R.complete('failed', start, 0, args)
             else:
+                if R:
+                    R.complete('execute', start, 1, args)
+                    start = R.now()
                 task.executed()
+                if R: R.complete('executed', start, 0, args)
 
+            if R: start = R.now()
             task.postprocess()
+            if R: R.complete('postprocess', start, 0, args)
 
 
 # Trap import failure so that everything in the Job module but the
@@ -130,22 +191,98 @@ try:
 except ImportError:
     pass
 else:
+    class _TaskStream:
+        """Stands in for sys.stdout or sys.stderr for a TaskOutput."""
+        def __init__(self, output, stream):
+            self.output = output
+            self.stream = stream
+        def write(self, s):
+            self.output.write(self.stream, s)
+        def writelines(self, lines):
+            for l in lines:
+                self.write(l)
+        def flush(self):
+            if not self.output.buffering():
+                self.stream.flush()
+        def __getattr__(self, attr):
+            return getattr(self.stream, attr)
+
+    class TaskOutput:
+        """Holds what the worker threads of a parallel build write to
+        sys.stdout and sys.stderr while they execute a task, and writes
+        it all out at once when the task is done:  the command lines
+        echoed, what the commands printed (see the buffered spawn in
+        SCons.Platform.posix) and what Python actions printed.  Output
+        from different tasks then never gets mixed up.  What other
+        threads write goes straight through.
+        """
+        def __init__(self):
+            self.buffers = {}
+            self.lock = threading.Lock()
+
+        def install(self):
+            self.saved = sys.stdout, sys.stderr
+            sys.stdout = _TaskStream(self, sys.stdout)
+            sys.stderr = _TaskStream(self, sys.stderr)
+
+        def restore(self):
+            sys.stdout, sys.stderr = self.saved
+
+        def buffering(self):
+            return self.buffers.has_key(threading.currentThread())
+
+        def write(self, stream, s):
+            try:
+                buffer = self.buffers[threading.currentThread()]
+            except KeyError:
+                stream.write(s)
+            else:
+                buffer.append((stream, s))
+
+        def start_task(self):
+            self.buffers[threading.currentThread()] = []
+
+        def end_task(self):
+            thread = threading.currentThread()
+            buffer = self.buffers[thread]
+            del self.buffers[thread]
+            if not buffer:
+                return
+            self.lock.acquire()
+            try:
+                for stream, s in buffer:
+                    stream.write(s)
+                for stream in self.saved:
+                    stream.flush()
+            finally:
+                self.lock.release()
+
     class Worker(threading.Thread):
         """A worker thread waits on a task to be posted to its request queue,
         dequeues the task, executes it, and posts a tuple including the task
         and a boolean indicating whether the task executed successfully. """
 
-        def __init__(self, requestQueue, resultsQueue):
+        def __init__(self, requestQueue, resultsQueue, index=0, output=None):
             threading.Thread.__init__(self)
             self.setDaemon(1)
             self.requestQueue = requestQueue
             self.resultsQueue = resultsQueue
+            self.index = index
+            self.output = output
             self.start()
 
         def run(self):
             while 1:
                 task = self.requestQueue.get()
 
+                R = SCons.Debug.tracer
+                if R:
+                    start = R.now()
+                    # How long the task sat in the request queue
+                    # waiting for a free worker.
+                    args = {'node' : str(task.get_target()),
+                            'queued' : start - task.trace_dispatched}
+                if self.output: self.output.start_task()
                 try:
                     task.execute()
                 except KeyboardInterrupt:
@@ -156,20 +293,22 @@ else:
                     ok = 0
                 else:
                     ok = 1
+                if self.output: self.output.end_task()
 
+                if R: R.complete('execute', start, self.index, args)
                 self.resultsQueue.put((task, ok))
 
     class ThreadPool:
         """This class is responsible for spawning and managing worker threads."""
 
-        def __init__(self, num):
+        def __init__(self, num, output=None):
             """Create the request and reply queues, and 'num' worker threads."""
             self.requestQueue = Queue.Queue(0)
             self.resultsQueue = Queue.Queue(0)
 
             # Create worker threads
             for i in range(num):
-                Worker(self.requestQueue, self.resultsQueue)
+                Worker(self.requestQueue, self.resultsQueue, i+1, output)
 
         def put(self, obj):
             """Put task into request queue."""
@@ -189,7 +328,7 @@ else:
         This class is thread safe.
         """
 
-        def __init__(self, taskmaster, num):
+        def __init__(self, taskmaster, num, buffer_output=0):
             """Create a new parallel job given a taskmaster.
 
             The taskmaster's next_task() method should return the next
@@ -205,25 +344,49 @@ else:
             multiple tasks simultaneously. """
 
             self.taskmaster = taskmaster
-            self.tp = ThreadPool(num)
+            if buffer_output:
+                self.output = TaskOutput()
+            else:
+                self.output = None
+            self.tp = ThreadPool(num, self.output)
 
             self.maxjobs = num
 
+            R = SCons.Debug.tracer
+            if R:
+                for i in range(num):
+                    R.thread_name(i+1, 'job %d' % (i+1))
+
         def start(self):
             """Start the job. This will begin pulling tasks from the
             taskmaster and executing them, and return when there are no
             more tasks. If a task fails to execute (i.e. execute() raises
             an exception), then the job will stop."""
 
+            if self.output:
+                self.output.install()
+            try:
+                self.run_tasks()
+            finally:
+                if self.output:
+                    self.output.restore()
+
+        def run_tasks(self):
+            R = SCons.Debug.tracer
             jobs = 0
+            left = None
             
             while 1:
                 # Start up as many available tasks as we're
                 # allowed to.
                 while jobs < self.maxjobs:
-                    task = self.taskmaster.next_task()
+                    if left is None:
+                        task = self.taskmaster.next_task()
+                    else:
+                        task = left
                     if task is None:
                         break
+                    task, left = gather(self.taskmaster, task)
 
                     # prepare task for execution
                     try:
@@ -239,8 +402,13 @@ else:
                         continue
 
                     # dispatch task
+                    if R:
+                        task.trace_dispatched = R.now()
+                        R.instant('dispatch',
+                                  args={'node' : str(task.get_target())})
                     self.tp.put(task)
                     jobs = jobs + 1
+                    if R: R.counter('jobs', jobs)
 
                 if not task and not jobs: break
 
@@ -250,12 +418,20 @@ else:
                     task, ok = self.tp.get()
 
                     jobs = jobs - 1
+                    if R:
+                        R.counter('jobs', jobs)
+                        args = {'node' : str(task.get_target())}
+                        start = R.now()
                     if ok:
                         task.executed()
                     else:
                         task.failed()
+                    if R:
+                        R.complete(ok and 'executed' or 'failed', start, 0, args)
+                        start = R.now()
 
                     task.postprocess()
+                    if R: R.complete('postprocess', start, 0, args)
 
                     if self.tp.resultsQueue.empty():
                         break
@@ -9,7 +9,9 @@ cache, discarding any currently cached values.
 
 Note: current implementation is optimized for speed, not space.  The
 cache reset operation does not actually discard older results, and in
-fact, all cached results (and keys) are held indefinitely.
+fact, all cached results (and keys) are held indefinitely, unless
+SetLimit() has been used to bound the caches of the lookup methods
+(see the LRUCache class below).
 
 Most of the work for this is done by copying and modifying the class
 definition itself, rather than the object instances.  This will
@@ -92,6 +94,7 @@ import copy
 import os
 import string
 import sys
+import types
 
 # A flag controlling whether or not we actually use memoization.
 use_memoizer = 1
@@ -395,10 +398,191 @@ CacheCountOne = Counter()
 
 def Dump():
     items = CacheCount.items() + CacheCountSelf.items() + CacheCountOne.items()
+    for k, v in Caches:
+        if isinstance(v, LRUCache):
+            items.append((k, v))
     items.sort()
     for k, v in items:
         print "    %7d hits %7d misses   %s()" % (v.hit, v.miss, k)
 
+#
+# Size accounting.  Every cache dictionary (or LRUCache) handed out by
+# memoize_classdict() is registered here under the "Class.method" name
+# it serves, so we can report which ones are holding on to the most
+# memory.  The sizes are only computed when a report is asked for, so
+# registering costs nothing on the lookup path.
+#
+
+Caches = []
+
+try:
+    getsizeof = sys.getsizeof
+except AttributeError:
+    # Pre-2.6 Python:  make a rough guess based on the usual
+    # object header and per-item overhead on a 32-bit machine.
+    def getsizeof(obj):
+        try:
+            return 24 + 4 * len(obj)
+        except TypeError:
+            return 16
+
+_sized_types = {
+    types.StringType : None,
+    types.IntType : None,
+    types.LongType : None,
+    types.FloatType : None,
+    types.NoneType : None,
+}
+
+def cache_size(obj):
+    """Return the approximate number of bytes held by a cached value.
+
+    Strings, numbers and the containers holding them are counted in
+    full.  Any other object (a Node, an Environment) is owned by
+    something other than the cache, so only its reference is counted."""
+    t = type(obj)
+    if _sized_types.has_key(t):
+        return getsizeof(obj)
+    if t in (types.ListType, types.TupleType):
+        return getsizeof(obj) + reduce(lambda x, y: x + cache_size(y), obj, 0)
+    if t is types.DictType:
+        return getsizeof(obj) + \
+               reduce(lambda x, i: x + cache_size(i[0]) + cache_size(i[1]),
+                      obj.items(), 0)
+    return 0
+
+def Sizes():
+    """Return a list of (bytes, entries, evicted, name) tuples for
+    the registered caches, combining the caches of the same method in
+    different classes, largest first."""
+    totals = {}
+    for name, cache in Caches:
+        if isinstance(cache, LRUCache):
+            evicted = cache.evicted
+            used = cache.used
+            cache = cache.data
+            bytes = cache_size(used)
+        else:
+            evicted = 0
+            bytes = 0
+        bytes = bytes + cache_size(cache)
+        t = totals.get(name, (0, 0, 0))
+        totals[name] = (t[0] + bytes, t[1] + len(cache), t[2] + evicted)
+    result = map(lambda i: i[1] + (i[0],), totals.items())
+    result.sort()
+    result.reverse()
+    return result
+
+def DumpSizes(top=20):
+    sizes = Sizes()
+    total = reduce(lambda x, s: x + s[0], sizes, 0)
+    for bytes, entries, evicted, name in sizes[:top]:
+        if evicted:
+            e = " (%d evicted)" % evicted
+        else:
+            e = ""
+        print "    %9d bytes %7d entries   %s()%s" % (bytes, entries, name, e)
+    print "    %9d bytes total in %d caches" % (total, len(sizes))
+
+#
+# Optional bounded caches.  The caches of the methods below can grow
+# without limit on a large tree (every file looked up, every include
+# searched for, every Executor's source lists), and the old entries are
+# rarely wanted again once the nodes that asked for them have been
+# built.  SetLimit() turns each of these caches into an LRUCache that
+# holds at most the given number of entries.
+#
+
+BoundedMethods = [
+    '_doLookup',
+    'find_include',
+    'get_missing_sources',
+    'get_unignored_sources',
+    'process_sources',
+]
+
+cache_limit = None
+
+def SetLimit(entries, methods=None):
+    """Bound the caches of the named methods (by default, the ones in
+    BoundedMethods) to the given number of entries each.  Like
+    EnableCounting(), this only affects classes that are analyzed after
+    it's called."""
+    global cache_limit
+    global BoundedMethods
+    cache_limit = entries
+    if not methods is None:
+        BoundedMethods = methods
+
+class LRUCache:
+    """A memoizer cache that holds at most 'limit' entries, discarding
+    the least recently used ones when it fills up.
+
+    The data dictionary holds the cached values just like the plain
+    cache dictionaries do; the used dictionary maps each key to the
+    tick of its last lookup."""
+    def __init__(self, limit):
+        self.limit = limit
+        self.data = {}
+        self.used = {}
+        self.tick = 0
+        self.hit = 0
+        self.miss = 0
+        self.evicted = 0
+
+    def fetch(self, ckey, func, args, kw={}):
+        data = self.data
+        rval = data.get(ckey, "_MeMoIZeR")
+        if rval is "_MeMoIZeR":
+            rval = data[ckey] = apply(func, args, kw)
+            self.miss = self.miss + 1
+            if len(data) > self.limit:
+                self.evict()
+        else:
+            self.hit = self.hit + 1
+        self.tick = self.tick + 1
+        self.used[ckey] = self.tick
+        return rval
+
+    def evict(self):
+        """Discard the least recently used quarter of the entries.
+        Doing it in batches keeps the sort off the per-lookup path."""
+        used = map(lambda i: (i[1], i[0]), self.used.items())
+        used.sort()
+        used = used[:max(1, len(used)/4)]
+        data = self.data
+        for tick, ckey in used:
+            del data[ckey]
+            del self.used[ckey]
+        self.evicted = self.evicted + len(used)
+
+def LRU_cache_get(func, cache, args, kw):
+    """Called instead of name for a method with a bounded cache."""
+    obj = args[0]
+    ckey = obj._MeMoIZeR_Key + ':' + _MeMoIZeR_gen_key(args, kw)
+    return cache.fetch(ckey, func, args, kw)
+
+def LRU_cache_get_self(func, cache, self):
+    """Called instead of func(self) for a method with a bounded cache."""
+    return cache.fetch(self._MeMoIZeR_Key, func, (self,))
+
+def LRU_cache_get_one(func, cache, self, arg):
+    """Called instead of func(self, arg) for a method with a bounded
+    cache."""
+    ckey = self._MeMoIZeR_Key + ':' + \
+           (getattr(arg, "_MeMoIZeR_Key", None) or repr(arg))
+    return cache.fetch(ckey, func, (self, arg))
+
+LRU_dict = {
+    'MCG'  : LRU_cache_get,
+    'MCGS' : LRU_cache_get_self,
+    'MCGO' : LRU_cache_get_one,
+}
+
+LRU_lambda = "lambda *args, **kw: MCG(methcode, methcached, args, kw)"
+LRUS_lambda = "lambda self: MCGS(methcode, methcached, self)"
+LRUO_lambda = "lambda self, arg: MCGO(methcode, methcached, self, arg)"
+
 def Count_cache_get(name, func, cdict, args, kw):
     """Called instead of name to see if this method call's return
     value has been cached.  If it has, just return the cached
@@ -489,10 +673,23 @@ def EnableCounting():
 
 
 
+def _setstate(obj, state):
+    """Restore an object's attributes.  Most go straight into the
+    instance dictionary (so a __setattr__ method doesn't get involved),
+    but the ones kept in __slots__ have to be set through the class's
+    descriptors."""
+    klass = obj.__class__
+    d = obj.__dict__
+    for key, value in state.items():
+        if hasattr(getattr(klass, key, None), '__set__'):
+            setattr(obj, key, value)
+        else:
+            d[key] = value
+
 class _Memoizer_Simple:
 
     def __setstate__(self, state):
-        self.__dict__.update(state)
+        _setstate(self, state)
         self.__dict__['_MeMoIZeR_Key'] = Next_Memoize_Key()
         #kwq: need to call original's setstate if it had one...
 
@@ -504,7 +701,7 @@ class _Memoizer_Simple:
 class _Memoizer_Comparable:
 
     def __setstate__(self, state):
-        self.__dict__.update(state)
+        _setstate(self, state)
         self.__dict__['_MeMoIZeR_Key'] = Next_Memoize_Key()
         #kwq: need to call original's setstate if it had one...
 
@@ -595,27 +792,40 @@ def whoami(memoizer_funcname, real_funcname):
            memoizer_funcname+'-lambda<'+real_funcname+'>'
 
 def memoize_classdict(klass, modelklass, new_klassdict, cacheable, resetting):
-    new_klassdict.update(modelklass.__dict__)
+    # Leave the class's own module and docstring alone, so it can still
+    # be found (by pickle, for one) under its name in its module.
+    for name, value in modelklass.__dict__.items():
+        if not name in ['__module__', '__doc__']:
+            new_klassdict[name] = value
     new_klassdict['_MeMoIZeR_converted'] = 1
 
     for name,code in cacheable.items():
+        if cache_limit and name in BoundedMethods:
+            methcached = LRUCache(cache_limit)
+            mcg_dict = LRU_dict
+            lambdas = (LRUS_lambda, LRUO_lambda, LRU_lambda)
+        else:
+            methcached = {}
+            mcg_dict = MCG_dict
+            lambdas = (MCGS_lambda, MCGO_lambda, MCG_lambda)
+        Caches.append((klass.__name__ + '.' + name, methcached))
         eval_dict = {
             'methname' : name,
             'methcode' : code,
-            'methcached' : {},
+            'methcached' : methcached,
         }
-        eval_dict.update(MCG_dict)
+        eval_dict.update(mcg_dict)
         fc = code.func_code
         if fc.co_argcount == 1 and not fc.co_flags & 0xC:
-            compiled = compile("\n"*1 + MCGS_lambda,
+            compiled = compile("\n"*1 + lambdas[0],
                                whoami('cache_get_self', name),
                                "eval")
         elif fc.co_argcount == 2 and not fc.co_flags & 0xC:
-            compiled = compile("\n"*2 + MCGO_lambda,
+            compiled = compile("\n"*2 + lambdas[1],
                                whoami('cache_get_one', name),
                                "eval")
         else:
-            compiled = compile("\n"*3 + MCG_lambda,
+            compiled = compile("\n"*3 + lambdas[2],
                                whoami('cache_get', name),
                                "eval")
         newmethod = eval(compiled, eval_dict, {})
@@ -796,10 +1006,14 @@ else:
             init = klassdict.get('__init__', None)
             if not init:
                 # Make sure filename has os.sep+'SCons'+os.sep so that
-                # SCons.Script.find_deepest_user_frame doesn't stop here
-                import inspect # It's OK, can't get here for Python < 2.1
-                filename = inspect.getsourcefile(_MeMoIZeR_superinit)
-                if not filename:
+                # SCons.Script.find_deepest_user_frame doesn't stop here.
+                # (This is what inspect.getsourcefile() would return, but
+                # importing inspect, and tokenize with it, takes longer
+                # than anything else we do here.)
+                filename = _MeMoIZeR_superinit.func_code.co_filename
+                if string.lower(filename[-4:]) in ['.pyc', '.pyo']:
+                    filename = filename[:-1]
+                if not os.path.exists(filename):
                     # This file was compiled at a path name different from
                     # how it's invoked now, so just make up something.
                     filename = whoami('superinit', '???')
@@ -520,6 +520,11 @@ class Base(SCons.Node.Node):
     object identity comparisons.
     """
 
+    # Entries morph into Files and Dirs by changing their __class__,
+    # so those sub-classes mustn't add any slots of their own.
+    __slots__ = ('name', 'fs', 'abspath', 'path', 'tpath', 'path_elements',
+                 'dir', 'cwd', 'duplicate', '_local')
+
     def __init__(self, name, directory, fs):
         """Initialize a generic Node.FS.Base object.
         
@@ -1018,7 +1023,6 @@ class FS(LocalFS):
                 d.diskcheck_match()
 
                 directory.entries[norm] = d
-                directory.add_wkid(d)
                 directory = d
 
         directory.must_be_a_Dir()
@@ -1037,7 +1041,6 @@ class FS(LocalFS):
             result.diskcheck_match()
 
             directory.entries[last_norm] = result 
-            directory.add_wkid(result)
         else:
             result = self.__checkClass(e, fsclass)
         return result 
@@ -1761,7 +1764,6 @@ class File(Base):
 
     def _morph(self):
         """Turn a file system node into a File object.  __cache_reset__"""
-        self.scanner_paths = {}
         if not hasattr(self, '_local'):
             self._local = 0
 
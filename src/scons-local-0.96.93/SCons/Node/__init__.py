@@ -46,7 +46,6 @@ __revision__ = "/home/scons/scons/branch.0/branch.96/baseline/src/engine/SCons/N
 
 
 
-import copy
 import string
 import UserList
 
@@ -93,6 +92,81 @@ def do_nothing(node): pass
 
 Annotate = do_nothing
 
+# An ordered set of Nodes, used for the sources, explicit dependencies
+# and ignored dependencies of a Node.  It's a list (so the many places
+# that read node.sources and the like as a list still can) that also
+# looks up quickly whether a Node is already a member.  Most of these
+# lists hold only a Node or two, which are quicker to search than to
+# index, so the dictionary of members is only built once a list grows
+# past SMALL_SET entries.
+
+SMALL_SET = 8
+
+try:
+    class _NodeSetBase(list):
+        __slots__ = ()
+except TypeError:
+    # Python before 2.2 can't sub-class the built-in list type.
+    _NodeSetBase = UserList.UserList
+
+class NodeSet(_NodeSetBase):
+    __slots__ = ('members',)
+
+    def __init__(self):
+        _NodeSetBase.__init__(self)
+        self.members = None
+
+    def add(self, nodes):
+        """Append the Nodes in the list 'nodes' that aren't already
+        members, and return whether any were."""
+        added = None
+        for n in nodes:
+            members = self.members
+            if members is None:
+                if n in self:
+                    continue
+                self.append(n)
+                if len(self) > SMALL_SET:
+                    members = self.members = {}
+                    for m in self:
+                        members[m] = 1
+            elif members.has_key(n):
+                continue
+            else:
+                self.append(n)
+                members[n] = 1
+            added = 1
+        return added
+
+# Shared empty values for the Node attributes that most Nodes never
+# add anything to.  A Node allocates its own set, list or dictionary
+# the first time it adds to one that's empty, so these are never
+# modified.
+empty_set = NodeSet()
+empty_list = []
+empty_dict = {}
+
+_slot_names = {}
+
+def slot_names(klass):
+    """Return the names of the attributes kept in __slots__ by a class
+    and its bases."""
+    try:
+        return _slot_names[klass]
+    except KeyError:
+        names = []
+        for k in (klass,) + klass.__bases__:
+            if k is klass:
+                slots = k.__dict__.get('__slots__', ())
+                slots = filter(lambda n: n[:2] != '__', slots)
+            else:
+                slots = slot_names(k)
+            for n in slots:
+                if not n in names:
+                    names.append(n)
+        _slot_names[klass] = names
+        return names
+
 # Classes for signature info for Nodes.
 
 class NodeInfoBase:
@@ -166,8 +240,22 @@ class Node:
     if SCons.Memoize.use_memoizer:
         __metaclass__ = SCons.Memoize.Memoized_Metaclass
 
+    # A large tree has hundreds of thousands of Nodes, so the common
+    # attributes are kept in slots rather than in each Node's instance
+    # dictionary.  (This only has an effect when the Memoizer metaclass
+    # makes Node a new-style class.)  The instance dictionary is still
+    # there for everything else, like the Memoizer's key.
+    __slots__ = ('sources', 'depends', 'ignore', 'implicit',
+                 'waiting_parents', 'waiting_s_e', 'ref_count',
+                 'env', 'state', 'precious', 'noclean', 'always_build',
+                 'includes', 'attributes', 'side_effect', 'side_effects',
+                 'linked', 'builder', 'executor',
+                 '__dict__', '__weakref__')
+
     class Attrs:
-        pass
+        # A new-style class where possible, so the instance dictionary
+        # is only allocated when something is actually stored.
+        __metaclass__ = type
 
     def __init__(self):
         if __debug__: logInstanceCreation(self, 'Node.Node')
@@ -177,37 +265,26 @@ class Node:
         # canonical example being a builder to fetch a file from a
         # source code system like CVS or Subversion).
 
-        # Each list of children that we maintain is accompanied by a
-        # dictionary used to look up quickly whether a node is already
-        # present in the list.  Empirical tests showed that it was
-        # fastest to maintain them as side-by-side Node attributes in
-        # this way, instead of wrapping up each list+dictionary pair in
-        # a class.  (Of course, we could always still do that in the
-        # future if we had a good reason to...).
-        self.sources = []       # source files used to build node
-        self.sources_dict = {}
-        self.depends = []       # explicit dependencies (from Depends)
-        self.depends_dict = {}
-        self.ignore = []        # dependencies to ignore
-        self.ignore_dict = {}
+        # The sets of children and the other collections below start
+        # out as the shared empty values and are replaced when the
+        # first member is added.
+        self.sources = empty_set        # source files used to build node
+        self.depends = empty_set        # explicit dependencies (from Depends)
+        self.ignore = empty_set         # dependencies to ignore
         self.implicit = None    # implicit (scanned) dependencies (None means not scanned yet)
-        self.waiting_parents = {}
-        self.waiting_s_e = {}
+        self.waiting_parents = empty_dict
+        self.waiting_s_e = empty_dict
         self.ref_count = 0
-        self.wkids = None       # Kids yet to walk, when it's an array
 
         self.env = None
         self.state = no_state
         self.precious = None
         self.noclean = 0
         self.always_build = None
-        self.found_includes = {}
         self.includes = None
         self.attributes = self.Attrs() # Generic place to stick information about the Node.
         self.side_effect = 0 # true iff this node is a side effect
-        self.side_effects = [] # the side effects of building this target
-        self.pre_actions = []
-        self.post_actions = []
+        self.side_effects = empty_list # the side effects of building this target
         self.linked = 0 # is this node linked to the build directory?
 
         # Let the interface in which the build engine is embedded
@@ -215,6 +292,17 @@ class Node:
         # what line in what file created the node, for example).
         Annotate(self)
 
+    def __getstate__(self):
+        """Return all of the Node's attributes, including the ones held
+        in slots, as a dictionary."""
+        state = self.__dict__.copy()
+        for name in slot_names(self.__class__):
+            try:
+                state[name] = getattr(self, name)
+            except AttributeError:
+                pass
+        return state
+
     def disambiguate(self):
         return self
 
@@ -329,11 +417,20 @@ class Node:
             self.store_info(self.binfo)
 
     def add_to_waiting_s_e(self, node):
+        if not self.waiting_s_e:
+            self.waiting_s_e = {}
         self.waiting_s_e[node] = 1
 
     def add_to_waiting_parents(self, node):
+        if not self.waiting_parents:
+            self.waiting_parents = {}
         self.waiting_parents[node] = 1
 
+    def add_side_effect(self, node):
+        if not self.side_effects:
+            self.side_effects = []
+        self.side_effects.append(node)
+
     def call_for_all_waiting_parents(self, func):
         func(self)
         for parent in self.waiting_parents.keys():
@@ -343,7 +440,7 @@ class Node:
         """Clean up anything we don't need to hang onto after we've
         been built."""
         self.executor_cleanup()
-        self.waiting_parents = {}
+        self.waiting_parents = empty_dict
 
     def clear(self):
         """Completely clear a Node of all its cached state (so that it
@@ -358,7 +455,6 @@ class Node:
         except AttributeError:
             pass
         self.includes = None
-        self.found_includes = {}
         self.implicit = None
 
     def visited(self):
@@ -516,10 +612,9 @@ class Node:
 
     def add_to_implicit(self, deps):
         if not hasattr(self, 'implicit') or self.implicit is None:
-            self.implicit = []
-            self.implicit_dict = {}
+            self.implicit = empty_set
             self._children_reset()
-        self._add_child(self.implicit, self.implicit_dict, deps)
+        self._add_child('implicit', deps)
 
     def scan(self):
         """Scan this node's dependents for implicit dependencies."""
@@ -528,8 +623,7 @@ class Node:
         # Don't scan again, if we already have scanned.
         if not self.implicit is None:
             return
-        self.implicit = []
-        self.implicit_dict = {}
+        self.implicit = empty_set
         self._children_reset()
         if not self.has_builder():
             return
@@ -555,15 +649,14 @@ class Node:
                         pass
                     else:
                         nodes.append(n)
-                self._add_child(self.implicit, self.implicit_dict, nodes)
+                self._add_child('implicit', nodes)
                 calc = build_env.get_calculator()
                 if implicit_deps_unchanged or self.current(calc):
                     return
                 # one of this node's sources has changed, so
                 # we need to recalculate the implicit deps,
                 # and the bsig:
-                self.implicit = []
-                self.implicit_dict = {}
+                self.implicit = empty_set
                 self._children_reset()
                 self.del_binfo()
 
@@ -794,7 +887,7 @@ class Node:
     def add_dependency(self, depend):
         """Adds dependencies."""
         try:
-            self._add_child(self.depends, self.depends_dict, depend)
+            self._add_child('depends', depend)
         except TypeError, e:
             e = e.args[0]
             if SCons.Util.is_List(e):
@@ -806,7 +899,7 @@ class Node:
     def add_ignore(self, depend):
         """Adds dependencies to ignore."""
         try:
-            self._add_child(self.ignore, self.ignore_dict, depend)
+            self._add_child('ignore', depend)
         except TypeError, e:
             e = e.args[0]
             if SCons.Util.is_List(e):
@@ -818,7 +911,7 @@ class Node:
     def add_source(self, source):
         """Adds sources."""
         try:
-            self._add_child(self.sources, self.sources_dict, source)
+            self._add_child('sources', source)
         except TypeError, e:
             e = e.args[0]
             if SCons.Util.is_List(e):
@@ -827,28 +920,23 @@ class Node:
                 s = str(e)
             raise SCons.Errors.UserError("attempted to add a non-Node as source of %s:\n\t%s is a %s, not a Node" % (str(self), s, type(e)))
 
-    def _add_child(self, collection, dict, child):
-        """Adds 'child' to 'collection', first checking 'dict' to see
-        if it's already present."""
+    def _add_child(self, name, child):
+        """Adds 'child' to the NodeSet in the attribute 'name', if it's
+        not already present."""
         if type(child) is not type([]):
             child = [child]
         for c in child:
             if not isinstance(c, Node):
                 raise TypeError, c
-        added = None
-        for c in child:
-            if not dict.has_key(c):
-                collection.append(c)
-                dict[c] = 1
-                added = 1
-        if added:
+        collection = getattr(self, name)
+        if not collection:
+            if not child:
+                return
+            collection = NodeSet()
+            setattr(self, name, collection)
+        if collection.add(child):
             self._children_reset()
 
-    def add_wkid(self, wkid):
-        """Add a node to the list of kids waiting to be evaluated"""
-        if self.wkids != None:
-            self.wkids.append(wkid)
-
     def _children_reset(self):
         "__cache_reset__"
         # We need to let the Executor clear out any calculated
@@ -1012,29 +1100,75 @@ class Node:
         old = self.get_stored_info()
         if old is None:
             return None
-        old.prepare_dependencies()
 
-        def dictify(result, kids, sigs):
-            for k, s in zip(kids, sigs):
-                result[k] = s
+        lines = self.explain_changes(old)
+        if lines is None:
+            return "Cannot explain why `%s' is being rebuilt: No previous build information found\n" % self
+
+        if len(lines) == 0:
+            return "rebuilding `%s' for unknown reasons\n" % self
+
+        preamble = "rebuilding `%s' because" % self
+        if len(lines) == 1:
+            return "%s %s"  % (preamble, lines[0])
+        else:
+            lines = ["%s:\n" % preamble] + lines
+            return string.join(lines, ' '*11)
+
+    def stale_reason(self):
+        """Return a one-line reason why this Node is out of date (the
+        first thing explain() would report), or None if there's no
+        stored information to compare against."""
+        if self.always_build:
+            return "is always built"
+        if not self.exists():
+            return "doesn't exist"
+        old = self.get_stored_info()
+        if old is None:
+            return None
+        lines = self.explain_changes(old)
+        if lines is None:
+            return "no previous build information"
+        if len(lines) == 0:
+            return None
+        reason = string.split(lines[0], '\n')[0]
+        if reason[-1:] == ':':
+            reason = reason[:-1]
+        if len(lines) > 1:
+            reason = reason + " (and %d more)" % (len(lines) - 1)
+        return reason
+
+    def explain_changes(self, old):
+        """Compare the stored build information 'old' with this Node's
+        current build information, and return a list of the changes
+        (each a string ending in a newline) that explain() reports, or
+        None if 'old' has no dependency information."""
+        # The stored dependencies are left as the paths (relative to
+        # this target's directory) that they're kept as in the .sconsign
+        # file, and the new ones are turned into the same paths, so the
+        # two can be compared without looking up a Node for every one
+        # of them.  Only the ones that get reported are looked up.
+        def keys(kids, rel_path=self.rel_path, is_String=SCons.Util.is_String):
+            return map(lambda k, r=rel_path, s=is_String: s(k) and k or r(k),
+                       kids)
 
         try:
-            osig = {}
-            dictify(osig, old.bsources, old.bsourcesigs)
-            dictify(osig, old.bdepends, old.bdependsigs)
-            dictify(osig, old.bimplicit, old.bimplicitsigs)
+            old_kids = old.bsources + old.bdepends + old.bimplicit
+            old_keys = keys(old_kids)
+            osig = dependency_map(old_keys,
+                                  [old.bsourcesigs, old.bdependsigs,
+                                   old.bimplicitsigs],
+                                  [old.bsources, old.bdepends, old.bimplicit])
         except AttributeError:
-            return "Cannot explain why `%s' is being rebuilt: No previous build information found\n" % self
+            return None
 
         new = self.get_binfo()
-
-        nsig = {}
-        dictify(nsig, new.bsources, new.bsourcesigs)
-        dictify(nsig, new.bdepends, new.bdependsigs)
-        dictify(nsig, new.bimplicit, new.bimplicitsigs)
-
-        old_bkids = old.bsources + old.bdepends + old.bimplicit
-        new_bkids = new.bsources + new.bdepends + new.bimplicit
+        new_kids = new.bsources + new.bdepends + new.bimplicit
+        new_keys = keys(new_kids)
+        nsig = dependency_map(new_keys,
+                              [new.bsourcesigs, new.bdependsigs,
+                               new.bimplicitsigs],
+                              [new.bsources, new.bdepends, new.bimplicit])
 
         # The sources and dependencies we'll want to report are all stored
         # as relative paths to this target's directory, but we want to
@@ -1044,24 +1178,23 @@ class Node:
         # its string.
         stringify = lambda s, E=self.dir.Entry: str(E(s))
 
-        lines = []
+        kid = {}
+        for k, n in map(None, old_keys, old_kids) + map(None, new_keys, new_kids):
+            kid[k] = n
 
-        removed = filter(lambda x, nk=new_bkids: not x in nk, old_bkids)
-        if removed:
-            removed = map(stringify, removed)
-            fmt = "`%s' is no longer a dependency\n"
-            lines.extend(map(lambda s, fmt=fmt: fmt % s, removed))
-
-        for k in new_bkids:
-            if not k in old_bkids:
-                lines.append("`%s' is a new dependency\n" % stringify(k))
-            elif osig[k] != nsig[k]:
-                lines.append("`%s' changed\n" % stringify(k))
+        lines = []
+        for change, k in diff_dependencies(old_keys, osig, new_keys, nsig):
+            if change == 'removed':
+                lines.append("`%s' is no longer a dependency\n" % stringify(kid[k]))
+            elif change == 'added':
+                lines.append("`%s' is a new dependency\n" % stringify(kid[k]))
+            else:
+                lines.append("`%s' changed\n" % stringify(kid[k]))
 
-        if len(lines) == 0 and old_bkids != new_bkids:
+        if len(lines) == 0 and old_keys != new_keys:
             lines.append("the dependency order changed:\n" +
-                         "%sold: %s\n" % (' '*15, map(stringify, old_bkids)) +
-                         "%snew: %s\n" % (' '*15, map(stringify, new_bkids)))
+                         "%sold: %s\n" % (' '*15, map(stringify, old_kids)) +
+                         "%snew: %s\n" % (' '*15, map(stringify, new_kids)))
 
         if len(lines) == 0:
             def fmt_with_title(title, strlines):
@@ -1077,15 +1210,7 @@ class Node:
                                  fmt_with_title('old: ', old.bact) +
                                  fmt_with_title('new: ', new.bact))
 
-        if len(lines) == 0:
-            return "rebuilding `%s' for unknown reasons\n" % self
-
-        preamble = "rebuilding `%s' because" % self
-        if len(lines) == 1:
-            return "%s %s"  % (preamble, lines[0])
-        else:
-            lines = ["%s:\n" % preamble] + lines
-            return string.join(lines, ' '*11)
+        return lines
 
 l = [1]
 ul = UserList.UserList([2])
@@ -1109,6 +1234,42 @@ if SCons.Memoize.use_old_memoization():
             SCons.Memoize.Memoizer.__init__(self)
 
 
+def dependency_map(keys, siglists, kidlists):
+    """Return a dictionary mapping each of the dependency 'keys' to its
+    signature.  The keys are for the concatenated 'kidlists'; the
+    signatures come from the matching 'siglists', which (like the
+    lists stored by old versions) may be shorter than their kid lists."""
+    result = {}
+    i = 0
+    for sigs, kids in map(None, siglists, kidlists):
+        for j in xrange(min(len(sigs), len(kids))):
+            result[keys[i + j]] = sigs[j]
+        i = i + len(kids)
+    return result
+
+def diff_dependencies(old_keys, old_sigs, new_keys, new_sigs):
+    """Compare two lists of dependency keys, with dictionaries mapping
+    the keys to their signatures.  Return the differences as a list
+    of (change, key) tuples, where change is 'removed', 'added' or
+    'changed':  first the removed keys in their old order, then the
+    rest in their new order."""
+    old = {}
+    for k in old_keys:
+        old[k] = 1
+    new = {}
+    for k in new_keys:
+        new[k] = 1
+    result = []
+    for k in old_keys:
+        if not new.has_key(k):
+            result.append(('removed', k))
+    for k in new_keys:
+        if not old.has_key(k):
+            result.append(('added', k))
+        elif old_sigs.get(k) != new_sigs.get(k):
+            result.append(('changed', k))
+    return result
+
 def get_children(node, parent): return node.children()
 def ignore_cycle(node, stack): pass
 def do_nothing(node, parent): pass
@@ -1126,6 +1287,9 @@ class Walker:
 
     This class does not get caught in node cycles caused, for example,
     by C header file include loops.
+
+    All of the state of the walk is kept in the Walker itself, not in
+    the Nodes, so any number of walks can be going on at once.
     """
     def __init__(self, node, kids_func=get_children,
                              cycle_func=ignore_cycle,
@@ -1133,8 +1297,11 @@ class Walker:
         self.kids_func = kids_func
         self.cycle_func = cycle_func
         self.eval_func = eval_func
-        node.wkids = copy.copy(kids_func(node, None))
-        self.stack = [node]
+        # Each stack entry is [node, its children, index of the next
+        # child to walk].  Stepping through the children with an index
+        # (instead of popping them off the front of a copy of the list)
+        # keeps each step constant-time.
+        self.stack = [[node, kids_func(node, None), 0]]
         self.history = {} # used to efficiently detect and avoid cycles
         self.history[node] = None
 
@@ -1145,23 +1312,27 @@ class Walker:
         to sidestep any issues of stack size limitations.
         """
 
-        while self.stack:
-            if self.stack[-1].wkids:
-                node = self.stack[-1].wkids.pop(0)
-                if not self.stack[-1].wkids:
-                    self.stack[-1].wkids = None
-                if self.history.has_key(node):
-                    self.cycle_func(node, self.stack)
+        stack = self.stack
+        history = self.history
+        while stack:
+            entry = stack[-1]
+            kids = entry[1]
+            i = entry[2]
+            if kids and i < len(kids):
+                entry[2] = i + 1
+                node = kids[i]
+                if history.has_key(node):
+                    self.cycle_func(node, map(lambda e: e[0], stack))
                 else:
-                    node.wkids = copy.copy(self.kids_func(node, self.stack[-1]))
-                    self.stack.append(node)
-                    self.history[node] = None
+                    stack.append([node, self.kids_func(node, entry[0]), 0])
+                    history[node] = None
             else:
-                node = self.stack.pop()
-                del self.history[node]
+                node = entry[0]
+                del stack[-1]
+                del history[node]
                 if node:
-                    if self.stack:
-                        parent = self.stack[-1]
+                    if stack:
+                        parent = stack[-1][0]
                     else:
                         parent = None
                     self.eval_func(node, parent)
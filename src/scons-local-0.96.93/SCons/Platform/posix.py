@@ -32,13 +32,21 @@ selection method.
 
 __revision__ = "/home/scons/scons/branch.0/branch.96/baseline/src/engine/SCons/Platform/posix.py 0.96.93.D001 2006/11/06 08:31:54 knight"
 
+import errno
+import fcntl
 import os
 import os.path
 import popen2
+import re
 import string
 import sys
 import select
 
+try:
+    import threading
+except ImportError:
+    threading = None
+
 import SCons.Util
 from SCons.Platform import TempFileMunge
 
@@ -58,6 +66,40 @@ def escape(arg):
 
     return '"' + arg + '"'
 
+# Characters that mean something to the shell anywhere in a word
+# (quoting, expansion, redirection, globbing, command separators), and
+# ones that only do at the start of a word.
+_shell_special = re.compile('[\\s|&;<>()$`\\\\"\'*?[{]')
+_shell_special_start = '#~'
+
+# Shell reserved words and built-in commands that have no executable of
+# their own (or that behave differently when run as one).
+_shell_words = {}
+for w in ['!', '{', '}', '.', ':', 'alias', 'bg', 'break', 'case', 'cd',
+          'command', 'continue', 'do', 'done', 'elif', 'else', 'esac',
+          'eval', 'exec', 'exit', 'export', 'fg', 'fi', 'for', 'getopts',
+          'hash', 'if', 'in', 'jobs', 'read', 'readonly', 'return', 'set',
+          'shift', 'then', 'times', 'trap', 'type', 'ulimit', 'umask',
+          'unalias', 'unset', 'until', 'wait', 'while']:
+    _shell_words[w] = 1
+del w
+
+def simple_argv(args):
+    """Return the list of arguments to execute directly if a command
+    line doesn't need anything from the shell, or None if it does.
+
+    The arguments have already been escaped for the shell, so anything
+    that needed quoting (including an argument with spaces in it)
+    still shows up here as needing the shell.  Empty arguments get
+    dropped, just like the shell would."""
+    argv = filter(None, map(str, args))
+    if not argv or _shell_words.has_key(argv[0]) or '=' in argv[0]:
+        return None
+    for arg in argv:
+        if _shell_special.search(arg) or arg[0] in _shell_special_start:
+            return None
+    return argv
+
 def exec_system(l, env):
     stat = os.system(string.join(l))
     if stat & 0xff:
@@ -97,33 +139,215 @@ def _get_env_command(sh, escape, cmd, args, env):
         s = string.join(l)
     return s
 
+# The spawn functions execute simple command lines (see simple_argv())
+# directly, which saves starting a shell for every compile.
+
 def env_spawn(sh, escape, cmd, args, env):
+    if buffering():
+        return buffered_spawn(sh, escape, cmd, args, env)
+    argv = simple_argv(args)
+    if argv:
+        return exec_fork(argv, env)
     return exec_system([_get_env_command( sh, escape, cmd, args, env)], env)
 
 def spawnvpe_spawn(sh, escape, cmd, args, env):
+    if buffering():
+        return buffered_spawn(sh, escape, cmd, args, env)
+    argv = simple_argv(args)
+    if argv:
+        return exec_fork(argv, env)
     return exec_spawnvpe([sh, '-c', string.join(args)], env)
 
 def fork_spawn(sh, escape, cmd, args, env):
+    if buffering():
+        return buffered_spawn(sh, escape, cmd, args, env)
+    argv = simple_argv(args)
+    if argv:
+        return exec_fork(argv, env)
     return exec_fork([sh, '-c', string.join(args)], env)
 
+# Buffered output for parallel builds.
+#
+# When commands run at the same time, their output would get mixed
+# up if they all wrote straight to our stdout and stderr.  So when
+# we're called from one of the worker threads of a parallel build
+# (the main thread runs everything in a serial build), we give each
+# command its own pipes.  A single thread reads the pipes of all the
+# commands that are running with select(), so no command ever blocks
+# on a full pipe, and keeps each command's output in a buffer until
+# the command is done.  Then the whole buffer gets written to sys.stdout
+# and sys.stderr, where a parallel build keeps it with the rest of the
+# task's output (see SCons.Job.TaskOutput) until the task is done.
+
+if threading:
+    _main_thread = threading.currentThread()
+    _output_lock = threading.Lock()
+    # Held from creating a command's pipes until it's forked, so no
+    # other thread's command can be forked in between and inherit them
+    # before they're marked close-on-exec.
+    _fork_lock = threading.Lock()
+
+def buffering():
+    """Return true if the output of commands we spawn should be
+    buffered:  that is, if we're in a worker thread of a parallel
+    build."""
+    return threading and threading.currentThread() is not _main_thread
+
+def _set_cloexec(fd):
+    # Don't let the commands that other threads start at the same
+    # time inherit our pipes, or we won't see end-of-file on them
+    # until those commands are done, too.
+    flags = fcntl.fcntl(fd, fcntl.F_GETFD)
+    fcntl.fcntl(fd, fcntl.F_SETFD, flags | fcntl.FD_CLOEXEC)
+
+class _Capture:
+    """The buffered output of a single command, as a list of
+    (stream name, data) tuples in the order it was read."""
+    def __init__(self, count):
+        self.chunks = []
+        self.count = count
+        self.done = threading.Event()
+
+    def eof(self):
+        self.count = self.count - 1
+        if self.count == 0:
+            self.done.set()
+
+    def write(self):
+        _output_lock.acquire()
+        try:
+            for name, data in self.chunks:
+                stream = getattr(sys, name)
+                stream.write(data)
+                stream.flush()
+        finally:
+            _output_lock.release()
+
+class OutputMultiplexer:
+    """Reads the output pipes of all the running commands in a
+    single thread.
+
+    The thread gets started the first time a command is watched.  It
+    select()s on the pipes of every command it knows about, plus one
+    of its own that watch() writes to so the thread will add the new
+    pipes to the list.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pipes = {}
+        self.wakeup_read, self.wakeup_write = os.pipe()
+        _set_cloexec(self.wakeup_read)
+        _set_cloexec(self.wakeup_write)
+        self.thread = None
+
+    def watch(self, pipes):
+        """Start reading a command's output.  The pipes argument is a
+        list of (file descriptor, stream name) tuples.  Returns the
+        _Capture that will hold the output."""
+        capture = _Capture(len(pipes))
+        self.lock.acquire()
+        try:
+            for fd, name in pipes:
+                self.pipes[fd] = (capture, name)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run)
+                self.thread.setDaemon(1)
+                self.thread.start()
+        finally:
+            self.lock.release()
+        os.write(self.wakeup_write, 'x')
+        return capture
+
+    def run(self):
+        while 1:
+            self.lock.acquire()
+            fds = self.pipes.keys()
+            self.lock.release()
+            try:
+                ready = select.select([self.wakeup_read] + fds, [], [])[0]
+            except select.error, e:
+                if e[0] == errno.EINTR:
+                    continue
+                raise
+            for fd in ready:
+                if fd == self.wakeup_read:
+                    os.read(fd, 512)
+                    continue
+                data = os.read(fd, 8192)
+                capture, name = self.pipes[fd]
+                if data:
+                    capture.chunks.append((name, data))
+                else:
+                    self.lock.acquire()
+                    del self.pipes[fd]
+                    self.lock.release()
+                    os.close(fd)
+                    capture.eof()
+
+_multiplexer = None
+
+def exec_buffered_fork(l, env):
+    global _multiplexer
+    if _multiplexer is None:
+        _output_lock.acquire()
+        try:
+            if _multiplexer is None:
+                _multiplexer = OutputMultiplexer()
+        finally:
+            _output_lock.release()
+    _fork_lock.acquire()
+    try:
+        (rFdOut, wFdOut) = os.pipe()
+        (rFdErr, wFdErr) = os.pipe()
+        for fd in (rFdOut, wFdOut, rFdErr, wFdErr):
+            _set_cloexec(fd)
+        pid = os.fork()
+    finally:
+        _fork_lock.release()
+    if not pid:
+        # Child process.
+        os.dup2(wFdOut, 1)
+        os.dup2(wFdErr, 2)
+        exitval = 127
+        try:
+            os.execvpe(l[0], l, env)
+        except OSError, e:
+            exitval = exitvalmap.get(e[0], e[0])
+            os.write(2, "scons: %s: %s\n" % (l[0], e[1]))
+        os._exit(exitval)
+    else:
+        # Parent process.
+        os.close(wFdOut)
+        os.close(wFdErr)
+        capture = _multiplexer.watch([(rFdOut, 'stdout'), (rFdErr, 'stderr')])
+        capture.done.wait()
+        pid, stat = os.waitpid(pid, 0)
+        capture.write()
+        if stat & 0xff:
+            return stat | 0x80
+        return stat >> 8
+
+def buffered_spawn(sh, escape, cmd, args, env):
+    argv = simple_argv(args)
+    if not argv:
+        argv = [sh, '-c', string.join(args)]
+    return exec_buffered_fork(argv, env)
+
 def process_cmd_output(cmd_stdout, cmd_stderr, stdout, stderr):
-    stdout_eof = stderr_eof = 0
-    while not (stdout_eof and stderr_eof):
-        (i,o,e) = select.select([cmd_stdout, cmd_stderr], [], [])
-        if cmd_stdout in i:
-            str = cmd_stdout.read()
+    # Read whatever there is on each pipe with os.read(), instead of
+    # reading one of them to the end while the command may be stuck
+    # writing to the other.
+    pipes = {cmd_stdout.fileno() : stdout}
+    if not cmd_stderr is cmd_stdout:
+        pipes[cmd_stderr.fileno()] = stderr
+    while pipes:
+        (i,o,e) = select.select(pipes.keys(), [], [])
+        for fd in i:
+            str = os.read(fd, 8192)
             if len(str) == 0:
-                stdout_eof = 1
-            elif stdout != None:
-                stdout.write(str)
-        if cmd_stderr in i:
-            str = cmd_stderr.read()
-            if len(str) == 0:
-                #sys.__stderr__.write( "stderr_eof=1\n" )
-                stderr_eof = 1
-            else:
-                #sys.__stderr__.write( "str(stderr) = %s\n" % str )
-                stderr.write(str)
+                del pipes[fd]
+            elif pipes[fd] != None:
+                pipes[fd].write(str)
 
 def exec_popen3(l, env, stdout, stderr):
     proc = popen2.Popen3(string.join(l), 1)
@@ -164,7 +388,6 @@ def exec_piped_fork(l, env, stdout, stderr):
         os._exit(exitval)
     else:
         # Parent process
-        pid, stat = os.waitpid(pid, 0)
         os.close( wFdOut )
         if stdout != stderr:
             os.close( wFdErr )
@@ -173,10 +396,13 @@ def exec_piped_fork(l, env, stdout, stderr):
             childErr = os.fdopen( rFdErr )
         else:
             childErr = childOut
+        # Drain the pipes before waiting, or a command that writes
+        # more than a pipe's worth of output would never finish.
         process_cmd_output(childOut, childErr, stdout, stderr)
-        os.close( rFdOut )
+        pid, stat = os.waitpid(pid, 0)
+        childOut.close()
         if stdout != stderr:
-            os.close( rFdErr )
+            childErr.close()
         if stat & 0xff:
             return stat | 0x80
         return stat >> 8
@@ -185,14 +411,19 @@ def piped_env_spawn(sh, escape, cmd, args, env, stdout, stderr):
     # spawn using Popen3 combined with the env command
     # the command name and the command's stdout is written to stdout
     # the command's stderr is written to stderr
+    argv = simple_argv(args)
+    if argv:
+        return exec_piped_fork(argv, env, stdout, stderr)
     return exec_popen3([_get_env_command(sh, escape, cmd, args, env)],
                        env, stdout, stderr)
 
 def piped_fork_spawn(sh, escape, cmd, args, env, stdout, stderr):
     # spawn using fork / exec and providing a pipe for the command's
     # stdout / stderr stream
-    return exec_piped_fork([sh, '-c', string.join(args)],
-                           env, stdout, stderr)
+    argv = simple_argv(args)
+    if not argv:
+        argv = [sh, '-c', string.join(args)]
+    return exec_piped_fork(argv, env, stdout, stderr)
 
 
 
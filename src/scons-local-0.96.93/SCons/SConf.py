@@ -28,8 +28,11 @@ Autoconf-like configuration support.
 
 __revision__ = "/home/scons/scons/branch.0/branch.96/baseline/src/engine/SCons/SConf.py 0.96.93.D001 2006/11/06 08:31:54 knight"
 
+import copy
+import cPickle
 import os
 import re
+import stat
 import string
 import StringIO
 import sys
@@ -40,11 +43,17 @@ import SCons.Action
 import SCons.Builder
 import SCons.Errors
 import SCons.Node.FS
+import SCons.SConsign
 import SCons.Taskmaster
 import SCons.Util
 import SCons.Warnings
 import SCons.Conftest
 
+try:
+    import threading
+except ImportError:
+    threading = None
+
 # Turn off the Conftest error logging
 SCons.Conftest.LogInputFiles = 0
 SCons.Conftest.LogErrorMessages = 0
@@ -166,6 +175,60 @@ class SConfBuildInfo(SCons.Node.FS.FileBuildInfo):
         self.ninfo.bsig = sig
 
 
+# The construction variables whose expanded values go into the toolchain
+# fingerprint of a cached custom test.
+fingerprint_vars = ['CC', 'CXX', 'LINK', 'CCFLAGS', 'CFLAGS', 'CXXFLAGS',
+                    'CPPFLAGS', '_CPPDEFFLAGS', 'CPPPATH', 'LINKFLAGS',
+                    'LIBPATH', 'LIBS']
+
+def _program_fingerprint(program, path):
+    if path is None:
+        path = SCons.Util.WhereIs(program)
+    else:
+        path = path(program)
+    mtime = None
+    if path:
+        try:
+            mtime = os.stat(path)[stat.ST_MTIME]
+        except OSError:
+            pass
+    return (program, path, mtime)
+
+def toolchain_fingerprint(env, tools=[]):
+    """Return a fingerprint of everything the result of a custom test
+    is assumed to depend on:  the compiler and linker command lines,
+    where the compiler and linker programs are found in the
+    environment's $ENV['PATH'] and when they were last modified, and
+    the same for the listed tools, which are looked up in the PATH
+    of the SCons process itself (the way os.system() and friends would
+    find them)."""
+    fingerprint = []
+    for var in fingerprint_vars:
+        fingerprint.append(env.subst('$' + var))
+    for var in ['CC', 'CXX', 'LINK']:
+        words = string.split(env.subst('$' + var))
+        if words:
+            fingerprint.append(_program_fingerprint(words[0], env.WhereIs))
+    for tool in tools:
+        fingerprint.append(_program_fingerprint(tool, None))
+    return fingerprint
+
+def _test_key(name, args, kw):
+    """Return the name under which we keep the result of a custom test
+    called with the specified arguments in the .sconsign file.  Only
+    plain strings and numbers count; for anything else (like a
+    configure context that gets passed back in), just its type does."""
+    def arg_key(a):
+        if type(a) in [types.StringType, types.IntType, types.FloatType]:
+            return repr(a)
+        return type(a).__name__
+    args = map(arg_key, args)
+    keys = kw.keys()
+    keys.sort()
+    for k in keys:
+        args.append(k + '=' + arg_key(kw[k]))
+    return name + '(' + string.join(args, ', ') + ')'
+
 class Streamer:
     """
     'Sniffer' for a file-like writable object. Similar to the unix tool tee.
@@ -188,6 +251,38 @@ class Streamer:
         Return everything written to orig since the Streamer was created.
         """
         return self.s.getvalue()
+
+class ThreadStreamer:
+    """
+    Stands in for stdout / stderr and the log file while configure tests
+    are being built in parallel (see SConf.CheckAll). Whatever a thread
+    writes goes to the Streamer of the test it is building, if any, and
+    is dropped otherwise, so the log only gets written when the tests
+    are checked again one at a time.
+    """
+    def __init__(self):
+        self.streamers = {}
+
+    def add(self, streamer):
+        self.streamers[threading.currentThread()] = streamer
+
+    def remove(self):
+        del self.streamers[threading.currentThread()]
+
+    def write(self, str):
+        try:
+            streamer = self.streamers[threading.currentThread()]
+        except KeyError:
+            pass
+        else:
+            streamer.write(str)
+
+    def writelines(self, lines):
+        for l in lines:
+            self.write(l + '\n')
+
+    def flush(self):
+        pass
         
 
 class SConfBuildTask(SCons.Taskmaster.Task):
@@ -235,6 +330,10 @@ class SConfBuildTask(SCons.Taskmaster.Task):
             apply(excepthook, self.exc_info())
         return SCons.Taskmaster.Task.failed(self)
 
+    def building(self, sconf):
+        """Called just before the targets actually get built."""
+        sconf.cached = 0
+
     def collect_node_states(self):
         # returns (is_up_to_date, cached_error, cachable)
         # where is_up_to_date is 1, if the node(s) are up_to_date
@@ -286,16 +385,16 @@ class SConfBuildTask(SCons.Taskmaster.Task):
             raise ConfigureDryRunError(self.targets[0])
         else:
             # note stdout and stderr are the same here
-            s = sys.stdout = sys.stderr = Streamer(sys.stdout)
+            s = sconf.start_capture()
             try:
                 env = self.targets[0].get_build_env()
                 env['PSTDOUT'] = env['PSTDERR'] = s
                 try:
-                    sconf.cached = 0
+                    self.building(sconf)
                     self.targets[0].build()
                 finally:
-                    sys.stdout = sys.stderr = env['PSTDOUT'] = \
-                                 env['PSTDERR'] = sconf.logstream
+                    sconf.end_capture()
+                    env['PSTDOUT'] = env['PSTDERR'] = sconf.logstream
             except KeyboardInterrupt:
                 raise
             except SystemExit:
@@ -315,6 +414,50 @@ class SConfBuildTask(SCons.Taskmaster.Task):
                     binfo = SConfBuildInfo(t,0,string,sig)
                     t.dir.sconsign().set_entry(t.name, binfo)
 
+class SConfPrebuildTask(SConfBuildTask):
+    """
+    Builds the test programs of SConf.CheckAll in parallel. A test
+    program that fails to build is just a negative test result, so we
+    keep going with the others.
+    """
+    def failed(self):
+        self.fail_continue()
+
+    def building(self, sconf):
+        # Several of these run at once, so there's no telling which
+        # test sconf.cached is about.  Note the test program instead.
+        for t in self.targets:
+            sconf.prebuilt_now[t] = 1
+
+def _reset_nodes(nodes, env):
+    """Prepare the derived nodes of a test program from a parallel
+    prebuild to be checked again when the test itself runs:  clear the
+    state the build left on them, and have them use the environment as
+    it is now.  If that changed the command lines, the signatures won't
+    match and the test program just gets rebuilt."""
+    nodes = nodes[:]
+    seen = {}
+    while nodes:
+        n = nodes.pop()
+        if seen.has_key(n) or not n.has_builder():
+            continue
+        seen[n] = 1
+        n.env_set(env)
+        n.get_executor().env = env
+        n.clear()
+        n.set_state(SCons.Node.no_state)
+        nodes.extend(n.children(scan=0))
+
+def _parse_check(check):
+    """Split an entry of the list given to SConf.CheckAll into the
+    name of the test, its arguments and its keyword arguments."""
+    if SCons.Util.is_String(check):
+        return check, (), {}
+    check = tuple(check)
+    if check[1:] and type(check[-1]) is types.DictType:
+        return check[0], check[1:-1], check[-1]
+    return check[0], check[1:], {}
+
 class SConf:
     """This is simply a class to represent a configure context. After
     creating a SConf object, you can call any tests. After finished with your
@@ -326,15 +469,28 @@ class SConf:
     (SConf.TryLink), the compiler is only called, if the program dependencies
     have changed. However, if the program could not be compiled in a former
     SConf run, we need to explicitely cache this error.
+    Custom tests that do their work outside of SCons (running programs
+    with os.system() and the like) can't be cached that way. Their
+    results can be kept in the .sconsign file instead, along with a
+    fingerprint of the toolchain (see the cached_tests argument). A test
+    gets run again only if that fingerprint changes, or if --config=force
+    is used.
     """
 
     def __init__(self, env, custom_tests = {}, conf_dir='$CONFIGUREDIR',
-                 log_file='$CONFIGURELOG', config_h = None, _depth = 0): 
+                 log_file='$CONFIGURELOG', config_h = None, _depth = 0,
+                 cached_tests = {}): 
         """Constructor. Pass additional tests in the custom_tests-dictinary,
         e.g. custom_tests={'CheckPrivate':MyPrivateTest}, where MyPrivateTest
         defines a custom test.
         Note also the conf_dir and log_file arguments (you may want to
         build tests in the BuildDir, not in the SourceDir)
+        The results of the custom tests named in the cached_tests
+        dictionary are kept from one run to the next. The values are
+        lists of the external programs each test runs, e.g.
+        cached_tests={'CheckPrivate':['private-config']}; their paths and
+        modification times are part of the toolchain fingerprint. A cached
+        test's return value has to be something that can be pickled.
         """
         global SConfFS
         if not SConfFS:
@@ -362,6 +518,12 @@ class SConf:
                  'CheckLib'           : CheckLib,
                  'CheckLibWithHeader' : CheckLibWithHeader
                }
+        self.cached_tests = cached_tests
+        self.prebuild_tests = default_tests
+        self.recording = None # list of test builds, when recording them
+        self.prebuilt = {}
+        self.prebuilt_now = {} # test programs _prebuild() just built
+        self.capture = None
         self.AddTests(default_tests)
         self.AddTests(custom_tests)
         self.confdir = SConfFS.Dir(env.subst(conf_dir))
@@ -377,7 +539,100 @@ class SConf:
         self._shutdown()
         return self.env
 
-    def BuildNodes(self, nodes):
+    def CheckAll(self, checks, num_jobs = None):
+        """Runs a list of independent tests and returns the list of their
+        results. Each test is given by its name, or by a tuple of its name
+        and arguments (a dictionary at the end holds keyword arguments):
+        conf.CheckAll(['CheckCHeader', ('CheckLib', 'm', {'autoadd':0})]).
+
+        The test programs of the built-in tests get built in parallel
+        first, with num_jobs jobs (by default, the -j value). Then the
+        tests are run in order, as usual, and find their test programs
+        up to date. If the command line of a test program changed in
+        between (say, an earlier CheckLib added its library to $LIBS),
+        that test program just gets built again, so the results come
+        out the same as when the tests are called one by one. Use
+        autoadd=0 with CheckLib to keep the link tests independent.
+        The log file gets written while the tests are run in order, so
+        it doesn't depend on the order the parallel builds finish in.
+        """
+        checks = map(_parse_check, checks)
+        if num_jobs is None:
+            try:
+                import SCons.Script.Main
+                num_jobs = SCons.Script.Main.ssoptions.get('num_jobs')
+            except AttributeError:
+                num_jobs = 1
+        if num_jobs > 1 and threading and not dryrun and cache_mode != CACHE:
+            self._prebuild(checks, num_jobs)
+        results = []
+        try:
+            for name, args, kw in checks:
+                results.append(apply(getattr(self, name), args, kw))
+        finally:
+            self.prebuilt = {}
+        return results
+
+    def _prebuild(self, checks, num_jobs):
+        """Collects the test programs that the given tests build (running
+        the tests in recording mode, where every TryBuild just creates the
+        nodes and fails) and builds them in parallel."""
+        self.recording = []
+        try:
+            for name, args, kw in checks:
+                if self.prebuild_tests.has_key(name):
+                    apply(getattr(self, name), args, kw)
+            recorded = self.recording
+        finally:
+            self.recording = None
+            self.cached = 0
+
+        nodes = []
+        for key, nodesToBeBuilt, targets in recorded:
+            nodes.extend(nodesToBeBuilt)
+        if nodes:
+            save_logstream = self.logstream
+            self.logstream = self.capture = ThreadStreamer()
+            self.prebuilt_now = {}
+            try:
+                self.BuildNodes(nodes, num_jobs, SConfPrebuildTask)
+            finally:
+                self.logstream = save_logstream
+                self.capture = None
+
+        # Remember which test programs got built (or failed to build)
+        # just now: they look up to date when the tests are run in
+        # order, but their results mustn't be reported as cached.
+        for key, nodesToBeBuilt, targets in recorded:
+            built = 0
+            for n in nodesToBeBuilt:
+                if self.prebuilt_now.has_key(n):
+                    built = 1
+                    break
+            entry = (nodesToBeBuilt, targets, built)
+            try:
+                self.prebuilt[key].append(entry)
+            except KeyError:
+                self.prebuilt[key] = [entry]
+        self.prebuilt_now = {}
+
+    def start_capture(self):
+        """Starts capturing the output of a test build, returning the
+        Streamer it goes to."""
+        if self.capture is None:
+            s = sys.stdout = sys.stderr = Streamer(sys.stdout)
+        else:
+            s = Streamer(None)
+            self.capture.add(s)
+        return s
+
+    def end_capture(self):
+        if self.capture is None:
+            sys.stdout = sys.stderr = self.logstream
+        else:
+            self.capture.remove()
+
+    def BuildNodes(self, nodes, num_jobs = 1, tasker = SConfBuildTask):
         """
         Tries to build the given nodes immediately. Returns 1 on success,
         0 on error.
@@ -400,9 +655,9 @@ class SConf:
             # ToDo: use user options for calc
             save_max_drift = SConfFS.get_max_drift()
             SConfFS.set_max_drift(0)
-            tm = SCons.Taskmaster.Taskmaster(nodes, SConfBuildTask)
-            # we don't want to build tests in parallel
-            jobs = SCons.Job.Jobs(1, tm )
+            tm = SCons.Taskmaster.Taskmaster(nodes, tasker)
+            # we only build tests in parallel for CheckAll
+            jobs = SCons.Job.Jobs(num_jobs, tm )
             jobs.run()
             for n in nodes:
                 state = n.get_state()
@@ -456,27 +711,57 @@ class SConf:
         pref = self.env.subst( builder.builder.prefix )
         suff = self.env.subst( builder.builder.suffix )
         target = self.confdir.File(pref + f + suff)
+        # The builder's id(), since Builders compare by value and
+        # can't be hashed when the Memoizer is disabled.
+        key = (id(builder.builder), text, extension)
 
         try:
             # Slide our wrapper into the construction environment as
             # the SPAWN function.
             self.env['SPAWN'] = self.pspawn_wrapper
-            sourcetext = self.env.Value(text)
-
-            if text != None:
-                textFile = self.confdir.File(f + extension)
-                textFileNode = self.env.SConfSourceBuilder(target=textFile,
-                                                           source=sourcetext)
-                nodesToBeBuilt.extend(textFileNode)
-                source = textFileNode
-            else:
-                source = None
 
-            nodes = builder(target = target, source = source)
-            if not SCons.Util.is_List(nodes):
-                nodes = [nodes]
-            nodesToBeBuilt.extend(nodes)
-            result = self.BuildNodes(nodesToBeBuilt)
+            try:
+                prebuilt = self.prebuilt[key]
+            except KeyError:
+                prebuilt = None
+            built = 0
+            if prebuilt:
+                # CheckAll already built this test program (see there).
+                nodesToBeBuilt, nodes, built = prebuilt.pop(0)
+                _reset_nodes(nodesToBeBuilt, self.env)
+            else:
+                env = self.env
+                if not self.recording is None:
+                    # Build with a snapshot of the environment, since the
+                    # test will undo anything it changes when it "fails".
+                    env = env.Clone()
+                    builder = copy.copy(builder)
+                    builder.env = env
+                sourcetext = env.Value(text)
+
+                if text != None:
+                    textFile = self.confdir.File(f + extension)
+                    textFileNode = env.SConfSourceBuilder(target=textFile,
+                                                          source=sourcetext)
+                    nodesToBeBuilt.extend(textFileNode)
+                    source = textFileNode
+                else:
+                    source = None
+
+                nodes = builder(target = target, source = source)
+                if not SCons.Util.is_List(nodes):
+                    nodes = [nodes]
+                nodesToBeBuilt.extend(nodes)
+
+            if self.recording is None:
+                result = self.BuildNodes(nodesToBeBuilt)
+                if built:
+                    # It was up to date because CheckAll built it in
+                    # this run, not in an earlier one.
+                    self.cached = 0
+            else:
+                self.recording.append((key, nodesToBeBuilt, nodes))
+                result = 0
 
         finally:
             self.env['SPAWN'] = save_spawn
@@ -540,24 +825,68 @@ class SConf:
 
     class TestWrapper:
         """A wrapper around Tests (to ensure sanity)"""
-        def __init__(self, test, sconf):
+        def __init__(self, test, sconf, name = None, tools = None):
             self.test = test
             self.sconf = sconf
+            self.name = name
+            self.tools = tools
         def __call__(self, *args, **kw):
             if not self.sconf.active:
                 raise (SCons.Errors.UserError,
                        "Test called after sconf.Finish()")
             context = CheckContext(self.sconf)
-            ret = apply(self.test, (context,) +  args, kw)
+            if self.tools is None:
+                ret = apply(self.test, (context,) +  args, kw)
+            else:
+                ret = self.cached_call(context, args, kw)
+            if not self.sconf.recording is None:
+                return ret
             if not self.sconf.config_h is None:
                 self.sconf.config_h_text = self.sconf.config_h_text + context.config_h
             context.Result("error: no result")
             return ret
+        def cached_call(self, context, args, kw):
+            """Calls a cached test, or replays its results from the
+            .sconsign file if the toolchain hasn't changed since the last
+            time it ran."""
+            key = _test_key(self.name, args, kw)
+            fingerprint = toolchain_fingerprint(self.sconf.env, self.tools)
+            sconsign = self.sconf.confdir.sconsign()
+            if cache_mode != FORCE:
+                try:
+                    memo = SCons.SConsign.get_memo(sconsign, key, fingerprint)
+                except KeyError:
+                    memo = None
+                if not memo is None:
+                    result, messages, config_h = memo
+                    for i in range(len(messages)):
+                        # Mark the result (the last message) as cached,
+                        # the way the built-in tests show it.
+                        self.sconf.cached = (i == len(messages) - 1)
+                        context.Display(messages[i])
+                    context.did_show_result = 1
+                    context.config_h = config_h
+                    return result
+            context.messages = []
+            ret = apply(self.test, (context,) +  args, kw)
+            try:
+                cPickle.dumps(ret, 1)
+            except (cPickle.PicklingError, TypeError):
+                SCons.Warnings.warn(SConfWarning,
+                    "Can't cache the result of %s; it can't be pickled." % key)
+            else:
+                memo = (ret, context.messages, context.config_h)
+                SCons.SConsign.set_memo(sconsign, key, fingerprint, memo)
+            return ret
 
     def AddTest(self, test_name, test_instance):
         """Adds test_class to this SConf instance. It can be called with
         self.test_name(...)"""
-        setattr(self, test_name, SConf.TestWrapper(test_instance, self))
+        tools = self.cached_tests.get(test_name)
+        if not tools is None and not SCons.Util.is_List(tools):
+            tools = [tools]
+        setattr(self, test_name, SConf.TestWrapper(test_instance, self,
+                                                   test_name, tools))
 
     def AddTests(self, tests):
         """Adds all the tests given in the tests dictionary to this SConf
@@ -663,6 +992,7 @@ class CheckContext:
         """Constructor. Pass the corresponding SConf instance."""
         self.sconf = sconf
         self.did_show_result = 0
+        self.messages = None # displayed messages, if a cached test
 
         # for Conftest.py:
         self.vardict = {}
@@ -752,6 +1082,10 @@ class CheckContext:
         return oldLIBS
 
     def Display(self, msg):
+        if not self.sconf.recording is None:
+            return
+        if not self.messages is None:
+            self.messages.append(msg)
         if self.sconf.cached:
             # We assume that Display is called twice for each test here
             # once for the Checking for ... message and once for the result.
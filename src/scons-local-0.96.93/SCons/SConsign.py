@@ -143,6 +143,68 @@ class Base:
     def do_not_set_entry(self, filename, obj):
         pass
 
+    def restore_entries(self):
+        """Undo what converting the entries for writing them out did
+        to them, so they can still be used (and written again) by a
+        process that keeps building, like scons --watch."""
+        for key, entry in self.entries.items():
+            entry.convert_from_sconsign(self.dir, key)
+
+class Memo:
+    """
+    Something SCons worked out once and keeps in a .sconsign file
+    along with a signature of what it was worked out from (a file's
+    contents, the program a command runs, a toolchain), so it can be
+    reused for as long as that signature stays the same.
+    """
+    def __init__(self, sig, value):
+        self.sig = sig
+        self.value = value
+
+    def convert_to_sconsign(self):
+        pass
+
+    def convert_from_sconsign(self, dir, name):
+        pass
+
+def get_memo(sconsign, key, sig):
+    """Return the value kept under a key in a directory's .sconsign
+    entries if it was worked out from the given signature, or raise
+    KeyError if it wasn't (or there isn't one)."""
+    try:
+        memo = sconsign.get_entry(key)
+    except KeyError:
+        memo = None
+    if isinstance(memo, Memo) and memo.sig == sig:
+        return memo.value
+    raise KeyError, key
+
+def set_memo(sconsign, key, sig, value):
+    """Keep a value under a key in a directory's .sconsign entries,
+    along with the signature of what it was worked out from."""
+    sconsign.set_entry(key, Memo(sig, value))
+
+def file_memo(node, kind, func):
+    """Return func(node) for a file Node.  Unless the file gets built,
+    the result is kept in the top directory's .sconsign file (under
+    the kind of result and the file's path) along with the file's
+    content signature, and func is only called again once the file's
+    contents change."""
+    if node.has_builder():
+        # Asking a file that gets built for its content signature
+        # this early would store build information for it before
+        # it's built, so just call func.
+        return func(node)
+    csig = node.get_csig()
+    key = kind + ' ' + node.path
+    sconsign = node.fs.Top.sconsign()
+    try:
+        return get_memo(sconsign, key, csig)
+    except KeyError:
+        value = func(node)
+        set_memo(sconsign, key, csig, value)
+        return value
+
 class DB(Base):
     """
     A Base subclass that reads and writes signature information
@@ -202,6 +264,7 @@ class DB(Base):
         for key, entry in self.entries.items():
             entry.convert_to_sconsign()
         db[path] = cPickle.dumps(self.entries, 1)
+        self.restore_entries()
 
         if sync:
             try:
@@ -292,6 +355,7 @@ class DirFile(Dir):
                 entry.convert_to_sconsign()
             cPickle.dump(self.entries, file, 1)
             file.close()
+            self.restore_entries()
             if fname != self.sconsign:
                 try:
                     mode = os.stat(self.sconsign)[0]
@@ -82,10 +82,21 @@ class FindPathDirs:
     def __call__(self, env, dir, target=None, source=None, argument=None):
         # The goal is that we've made caching this unnecessary
         # because the caching takes place at higher layers.
+        #
+        # We fetch the value the way variable substitution does, not
+        # with env[self.variable]:  we only read it, and handing out a
+        # list value that way makes an overridden build environment
+        # stop sharing its remembered expansions with the others like
+        # it (see Environment._shared_override()), and makes an
+        # environment copy a value it still shares with its clones.
+        lvars = env.lvars()
         try:
-            path = env[self.variable]
+            path = lvars[self.variable]
         except KeyError:
-            return ()
+            try:
+                path = env.gvars()[self.variable]
+            except KeyError:
+                return ()
 
         path = env.subst_path(path, target=target, source=source)
         path_tuple = tuple(env.fs.Rfindalldirs(path, dir))
@@ -39,11 +39,17 @@ __revision__ = "/home/scons/scons/branch.0/branch.96/baseline/src/engine/SCons/S
 import os
 import os.path
 import random
+import shutil
 import string
 import sys
 import time
 import traceback
 
+try:
+    import threading
+except ImportError:
+    threading = None
+
 # Strip the script directory from sys.path() so on case-insensitive
 # (Windows) systems Python doesn't think that the "scons" script is the
 # "SCons" package.  Replace it with our own version directory so, if
@@ -58,12 +64,14 @@ import SCons.Defaults
 import SCons.Environment
 import SCons.Errors
 import SCons.Job
+import SCons.Memoize
 import SCons.Node
 import SCons.Node.FS
 from SCons.Optik import OptionParser, SUPPRESS_HELP, OptionValueError
 import SCons.SConf
 import SCons.Sig
 import SCons.Taskmaster
+import SCons.Tool
 import SCons.Util
 import SCons.Warnings
 
@@ -96,6 +104,17 @@ class BuildTask(SCons.Taskmaster.Task):
             if self.top and target.has_builder():
                 display("scons: `%s' is up to date." % str(self.node))
 
+    def batch_key(self):
+        if len(self.targets) != 1 or print_time:
+            return None
+        target = self.targets[0]
+        if target.get_state() != SCons.Node.executing or \
+           target.side_effects or not target.has_builder() or \
+           hasattr(target.builder, 'status') or \
+           not self.exc_info()[0] is None:
+            return None
+        return target.get_executor().get_batch()
+
     def do_failed(self, status=2):
         global exit_status
         if ignore_errors:
@@ -181,14 +200,11 @@ class BuildTask(SCons.Taskmaster.Task):
         if self.top:
             t = self.targets[0]
             if print_tree:
-                print
-                SCons.Util.print_tree(t, get_all_children)
+                print_node_tree(t, get_all_children)
             if print_stree:
-                print
-                SCons.Util.print_tree(t, get_all_children, showtags=2)
+                print_node_tree(t, get_all_children, showtags=2)
             if print_dtree:
-                print
-                SCons.Util.print_tree(t, get_derived_children)
+                print_node_tree(t, get_derived_children)
             if print_includes:
                 tree = t.render_include_tree()
                 if tree:
@@ -219,21 +235,31 @@ class CleanTask(SCons.Taskmaster.Task):
         try:
             if os.path.exists(path):
                 if os.path.isfile(path):
-                    if remove: os.unlink(path)
-                    display("Removed " + path)
+                    self.fs_remove('file', path, remove)
                 elif os.path.isdir(path) and not os.path.islink(path):
                     # delete everything in the dir
                     for p in self.dir_index(path):
                         if os.path.isfile(p):
-                            if remove: os.unlink(p)
-                            display("Removed " + p)
+                            self.fs_remove('file', p, remove)
                         else:
                             self.fs_delete(p, remove)
                     # then delete dir itself
-                    if remove: os.rmdir(path)
-                    display("Removed directory " + path)
+                    self.fs_remove('dir', path, remove)
         except (IOError, OSError), e:
-            print "scons: Could not remove '%s':" % str(path), e.strerror
+            if remove:
+                clean_plan.add('error', path, e.strerror)
+            else:
+                print "scons: Could not remove '%s':" % str(path), e.strerror
+
+    def fs_remove(self, kind, path, remove):
+        """Add a file or directory to the clean plan, or (if we're
+        just showing what would be removed) say it would be removed."""
+        if remove:
+            clean_plan.add(kind, path)
+        elif kind == 'dir':
+            display("Removed directory " + path)
+        else:
+            display("Removed " + path)
 
     def show(self):
         target = self.targets[0]
@@ -247,21 +273,12 @@ class CleanTask(SCons.Taskmaster.Task):
                 self.fs_delete(str(f), 0)
 
     def remove(self):
+        # Nothing is removed here:  the targets go into the clean plan,
+        # which removes them all once the Taskmaster is done.
         target = self.targets[0]
         if (target.has_builder() or target.side_effect) and not target.noclean:
             for t in self.targets:
-                try:
-                    removed = t.remove()
-                except OSError, e:
-                    # An OSError may indicate something like a permissions
-                    # issue, an IOError would indicate something like
-                    # the file not existing.  In either case, print a
-                    # message and keep going to try to remove as many
-                    # targets aa possible.
-                    print "scons: Could not remove '%s':" % str(t), e.strerror
-                else:
-                    if removed:
-                        display("Removed " + str(t))
+                clean_plan.add('node', t)
         if SCons.Environment.CleanTargets.has_key(target):
             files = SCons.Environment.CleanTargets[target]
             for f in files:
@@ -277,6 +294,239 @@ class CleanTask(SCons.Taskmaster.Task):
     def prepare(self):
         pass
 
+def _clean_node(node):
+    try:
+        return node.remove()
+    except OSError, e:
+        # An OSError may indicate something like a permissions
+        # issue, an IOError would indicate something like
+        # the file not existing.  In either case, report it and
+        # keep going to try to remove as many targets as possible.
+        return e
+
+def _clean_file(path):
+    try:
+        os.unlink(path)
+    except (IOError, OSError), e:
+        return e
+    return 1
+
+def _clean_dir(path):
+    try:
+        os.rmdir(path)
+    except (IOError, OSError), e:
+        return e
+    return 1
+
+def _clean_tree(path):
+    try:
+        shutil.rmtree(path)
+    except (IOError, OSError), e:
+        return e
+    return 1
+
+class CleanPlan:
+    """The files and directories that a clean (-c) is going to remove.
+
+    The clean tasks just add to the plan; execute() then removes
+    everything at once.  A directory where everything (recursively) is
+    to go is removed with one shutil.rmtree(), and the remaining
+    files are unlinked in batches by worker threads when there's more
+    than one job, so the removals overlap on slow file systems.  The
+    "Removed" messages come out afterwards, in the order things were
+    added, the same as a serial clean would print them.
+    """
+    def __init__(self, num_jobs=1):
+        self.num_jobs = num_jobs
+        # Entries are (kind, what[, error]) tuples, where kind is
+        # 'node' (a target Node), 'file' or 'dir' (a path added by
+        # Clean()), or 'error' (a path Clean() couldn't look at).
+        self.entries = []
+
+    def add(self, kind, what, error=None):
+        self.entries.append((kind, what, error))
+
+    def execute(self):
+        entries = self.entries
+        self.entries = []
+        top = os.path.join(os.getcwd(), '')
+
+        # The paths of the files that are going to be removed, and all
+        # of the directories (below the top directory) that they're in.
+        planned = {}
+        dirs = {}
+        paths = [None] * len(entries)
+        for i in range(len(entries)):
+            kind, what, error = entries[i]
+            if kind == 'node':
+                if not isinstance(what, SCons.Node.FS.File) or \
+                   not (what.exists() or what.islink()):
+                    continue
+                path = what.abspath
+            elif kind == 'file':
+                path = os.path.abspath(what)
+            elif kind == 'dir':
+                paths[i] = os.path.abspath(what)
+                continue
+            else:
+                continue
+            paths[i] = path
+            planned[path] = 1
+            d = os.path.dirname(path)
+            while d[:len(top)] == top and len(d) > len(top) and \
+                  not dirs.has_key(d):
+                dirs[d] = None
+                d = os.path.dirname(d)
+
+        # Find the directories where everything is going, and keep
+        # the topmost of them.
+        keys = dirs.keys()
+        keys.sort()
+        trees = []
+        for d in keys:
+            if trees and d[:len(trees[-1])+1] == trees[-1] + os.sep:
+                continue
+            if self.covered(d, planned, dirs):
+                trees.append(d)
+
+        def tree_of(path, trees=trees):
+            for t in trees:
+                if path == t or path[:len(t)+1] == t + os.sep:
+                    return t
+            return None
+
+        # What removes each entry:  an index into 'work', or the tree
+        # whose removal takes it along.
+        work = map(lambda t: (_clean_tree, t), trees)
+        tree_index = {}
+        for i in range(len(trees)):
+            tree_index[trees[i]] = i
+        last_entry = {}
+        how = [None] * len(entries)
+        dir_entries = []
+        for i in range(len(entries)):
+            kind, what, error = entries[i]
+            t = paths[i] and trees and tree_of(paths[i])
+            if t:
+                how[i] = t
+                last_entry[t] = i
+            elif kind == 'node':
+                how[i] = len(work)
+                work.append((_clean_node, what))
+            elif kind == 'file':
+                how[i] = len(work)
+                work.append((_clean_file, what))
+            elif kind == 'dir':
+                dir_entries.append(i)
+
+        results = self.run(work)
+        # The entries after which to say a whole tree was removed.
+        last = {}
+        for t, i in last_entry.items():
+            last[i] = last.get(i, []) + [t]
+
+        # If a whole tree couldn't be removed, go back to removing what's
+        # in it one by one, to report what's left.
+        failed = {}
+        for t in trees:
+            if results[tree_index[t]] != 1:
+                failed[t] = 1
+        if failed:
+            for i in range(len(entries)):
+                if failed.has_key(how[i]):
+                    kind, what, error = entries[i]
+                    if kind == 'node':
+                        how[i] = len(results)
+                        results.append(_clean_node(what))
+                    elif kind == 'file':
+                        how[i] = len(results)
+                        results.append(_clean_file(what))
+                    elif kind == 'dir':
+                        dir_entries.append(i)
+            dir_entries.sort()
+
+        # Directories from Clean() go last, when what's in them is gone.
+        for i in dir_entries:
+            how[i] = len(results)
+            results.append(_clean_dir(entries[i][1]))
+
+        for i in range(len(entries)):
+            kind, what, error = entries[i]
+            h = how[i]
+            if kind == 'error':
+                result = error
+            elif h is None:
+                continue
+            elif type(h) == type(''):
+                result = 1
+            else:
+                result = results[h]
+            if result == 1:
+                if kind == 'dir':
+                    display("Removed directory " + what)
+                else:
+                    display("Removed " + str(what))
+            elif result:
+                if not SCons.Util.is_String(result):
+                    result = result.strerror
+                print "scons: Could not remove '%s':" % str(what), result
+            for t in last.get(i, []):
+                if not failed.has_key(t) and paths[i] != t:
+                    display("Removed directory " + t[len(top):])
+
+    def covered(self, d, planned, dirs):
+        """Return whether everything in directory 'd' is in 'planned'
+        or is a directory in 'dirs' that's covered itself.  'dirs' maps
+        each directory to 1 or 0 once it's known, None before."""
+        if dirs[d] is None:
+            dirs[d] = 0
+            try:
+                names = os.listdir(d)
+            except (IOError, OSError):
+                return 0
+            for n in names:
+                p = os.path.join(d, n)
+                if not planned.has_key(p) and \
+                   not (dirs.has_key(p) and self.covered(p, planned, dirs)):
+                    return 0
+            dirs[d] = 1
+        return dirs[d]
+
+    def run(self, work):
+        """Call each (function, argument) pair in 'work' and return a
+        list of the results.  With more than one job, the calls are
+        made by worker threads, each taking a batch at a time."""
+        results = [None] * len(work)
+        if self.num_jobs < 2 or len(work) < 2 or not threading:
+            for i in range(len(work)):
+                func, arg = work[i]
+                results[i] = func(arg)
+            return results
+
+        batch = max(1, min(64, len(work) / (self.num_jobs * 4)))
+        lock = threading.Lock()
+        next = [0]
+        def worker(work=work, results=results, lock=lock, next=next,
+                   batch=batch):
+            while 1:
+                lock.acquire()
+                start = next[0]
+                next[0] = start + batch
+                lock.release()
+                if start >= len(work):
+                    break
+                for i in range(start, min(start + batch, len(work))):
+                    func, arg = work[i]
+                    results[i] = func(arg)
+        threads = []
+        for n in range(min(self.num_jobs, len(work))):
+            t = threading.Thread(target=worker)
+            t.start()
+            threads.append(t)
+        for t in threads:
+            t.join()
+        return results
+
 class QuestionTask(SCons.Taskmaster.Task):
     """An SCons task for the -q (question) option."""
     def prepare(self):
@@ -291,6 +541,50 @@ class QuestionTask(SCons.Taskmaster.Task):
     def executed(self):
         pass
 
+class StaleTask(SCons.Taskmaster.Task):
+    """An SCons task for the --list-stale option.
+
+    This finds every target that's out of date, and why, without
+    building anything or stopping at the first one.  Each Node is
+    evaluated once no matter how many targets depend on it, and a
+    target is stale if its own signatures say so or any of its
+    children are stale."""
+    def prepare(self):
+        pass
+
+    def make_ready(self):
+        self.out_of_date = []
+        for t in self.targets:
+            t = t.disambiguate()
+            if t.current():
+                reason = self.stale_child(t)
+            else:
+                reason = t.stale_reason() or self.stale_child(t) or \
+                         "unknown reasons"
+            if reason:
+                stale_nodes[t] = reason
+                self.out_of_date.append(t)
+                t.set_state(SCons.Node.executing)
+            else:
+                t.set_state(SCons.Node.up_to_date)
+
+    def stale_child(self, node):
+        for c in node.children():
+            if stale_nodes.has_key(c):
+                return "`%s' is out of date" % c
+        return None
+
+    def execute(self):
+        pass
+
+    def executed(self):
+        # Nothing was built, so just let the parents go ahead without
+        # storing any new build information.
+        for t in self.targets:
+            if t.get_state() == SCons.Node.executing:
+                t.set_state(SCons.Node.executed)
+        self.tm.executed(self.node)
+
 # Global variables
 
 keep_going_on_error = 0
@@ -303,6 +597,12 @@ print_stacktrace = 0
 print_stree = 0
 print_time = 0
 print_tree = 0
+tree_format = 'text'
+tree_depth = None
+tree_prune = 0
+tree_output = None
+clean_plan = None
+stale_nodes = {}
 ignore_errors = 0
 sconscript_time = 0
 command_time = 0
@@ -387,6 +687,55 @@ class MemStats(Stats):
 
 memory_stats = MemStats()
 
+class StartupStats(Stats):
+    """Where the time goes before the first node gets evaluated:  each
+    label names the stretch of time ending when it was appended.  The
+    SConscript files read (and the tool modules loaded while reading
+    them) get timed separately."""
+    def __init__(self):
+        Stats.__init__(self)
+        self.sconscript = self.do_nothing
+        self.sconscript_done = self.do_nothing
+    def enable(self, outfp):
+        Stats.enable(self, outfp)
+        self.sconscript = self.do_sconscript
+        self.sconscript_done = self.do_sconscript_done
+        self.sconscripts = []
+        self.reading = []
+        # We only find out we're timing things once the command line
+        # has been parsed, so fill in what happened up until then.
+        self.stats = [SCons.Script.start_time, imported_time]
+        self.labels = ['importing SCons modules']
+        self.do_append('parsing the command line')
+    def do_append(self, label):
+        self.labels.append(label)
+        self.stats.append(time.time())
+    def do_sconscript(self, path):
+        # [depth, path, start time, total time, time of nested files]
+        entry = [len(self.reading), path, time.time(), 0, 0]
+        self.sconscripts.append(entry)
+        self.reading.append(entry)
+    def do_sconscript_done(self):
+        entry = self.reading.pop()
+        entry[3] = time.time() - entry[2]
+        if self.reading:
+            self.reading[-1][4] = self.reading[-1][4] + entry[3]
+    def do_print(self):
+        fmt = 'Startup %-52s %8.3f\n'
+        for i in range(len(self.labels)):
+            self.outfp.write(fmt % (self.labels[i],
+                                    self.stats[i+1] - self.stats[i]))
+            if self.labels[i] == 'reading SConscript files':
+                for depth, path, start, total, children in self.sconscripts:
+                    label = '  ' * (depth + 1) + path
+                    self.outfp.write(fmt % (label, total - children))
+                label = '  loading tool modules (%d)' % SCons.Tool.load_count
+                self.outfp.write(fmt % (label, SCons.Tool.load_time))
+        self.outfp.write(fmt % ('total', self.stats[-1] - self.stats[0]))
+
+startup_stats = StartupStats()
+imported_time = None
+
 # utility functions
 
 def get_all_children(node): return node.all_children()
@@ -395,6 +744,58 @@ def get_derived_children(node):
     children = node.all_children(None)
     return filter(lambda x: x.has_builder(), children)
 
+def print_node_tree(node, child_func, showtags=0):
+    """Print the dependency tree of a node for the --debug=tree,
+    stree and dtree options, in the --tree-format chosen."""
+    file = tree_output or sys.stdout
+    if tree_format == 'text':
+        file.write('\n')
+        SCons.Util.print_tree(node, child_func, tree_prune, showtags,
+                              file, tree_depth)
+    else:
+        SCons.Util.print_tree_graph(node, child_func, tree_format,
+                                    showtags, file, tree_depth)
+    file.flush()
+
+def list_stale(nodes):
+    """Print every stale target that the StaleTasks found among 'nodes'
+    and the derived Nodes they depend on, each with the reason it's
+    stale, and set the exit status if there are any.
+
+    A Node's dependencies are listed before the Node itself, so the
+    targets that are out of date for reasons of their own come ahead
+    of the ones that are only stale because of them.  Nodes that
+    aren't stale can't have stale children, so we don't look below
+    them."""
+    global exit_status
+    seen = {}
+    for node in nodes:
+        node = node.disambiguate()
+        if seen.has_key(node):
+            continue
+        seen[node] = 1
+        # Walk the stale Nodes below this one depth-first, keeping
+        # our own stack so deep dependency chains don't run into the
+        # recursion limit.  Each entry is a Node, its children and the
+        # index of the next child to look at.
+        stack = [[node, node.children(), 0]]
+        while stack:
+            entry = stack[-1]
+            parent, children, i = entry
+            if i < len(children):
+                entry[2] = i + 1
+                child = children[i]
+                if seen.has_key(child):
+                    continue
+                seen[child] = 1
+                if stale_nodes.has_key(child) and child.has_builder():
+                    stack.append([child, child.children(), 0])
+                continue
+            del stack[-1]
+            if stale_nodes.has_key(parent):
+                print "%s: %s" % (parent, stale_nodes[parent])
+                exit_status = 1
+
 def _scons_syntax_error(e):
     """Handle syntax errors. Print out a message and show where the error
     occurred.
@@ -541,7 +942,8 @@ def _set_globals(options):
     global print_explanations, print_includes, print_memoizer
     global print_objects, print_stacktrace, print_stree
     global print_time, print_tree
-    global memory_stats
+    global tree_format, tree_depth, tree_prune, tree_output
+    global memory_stats, startup_stats
 
     keep_going_on_error = options.keep_going
     try:
@@ -571,13 +973,29 @@ def _set_globals(options):
             SCons.Action.print_actions_presub = 1
         if "stacktrace" in debug_values:
             print_stacktrace = 1
+        if "startup" in debug_values:
+            startup_stats.enable(sys.stdout)
         if "stree" in debug_values:
             print_stree = 1
         if "time" in debug_values:
             print_time = 1
         if "tree" in debug_values:
             print_tree = 1
+    tree_format = options.tree_format
+    tree_depth = options.tree_depth
+    tree_prune = options.tree_prune
+    if options.tree_file and (print_tree or print_stree or print_dtree):
+        tree_output = open(options.tree_file, 'w')
+    else:
+        tree_output = None
     ignore_errors = options.ignore_errors
+    if not options.memoizer_limit is None and \
+       SCons.Memoize.cache_limit != options.memoizer_limit:
+        # The limit has to be found before the Memoized classes are
+        # analyzed (see SCons/Script/__init__.py), which only works
+        # when the option is spelled out in full.
+        raise SCons.Errors.UserError, \
+              "--memoizer-limit must be given in full, as --memoizer-limit=N or --memoizer-limit N."
 
 def _create_path(plist):
     path = '.'
@@ -673,8 +1091,8 @@ class OptParser(OptionParser):
         debug_options = ["count", "dtree", "explain", "findlibs",
                          "includes", "memoizer", "memory",
                          "nomemoizer", "objects",
-                         "pdb", "presub", "stacktrace", "stree",
-                         "time", "tree"]
+                         "pdb", "presub", "stacktrace", "startup",
+                         "stree", "time", "tree"]
 
         def opt_debug(option, opt, value, parser, debug_options=debug_options):
             if value in debug_options:
@@ -722,6 +1140,11 @@ class OptParser(OptionParser):
                         action="append", nargs=1,
                         help="Read FILE as the top-level SConstruct file.")
 
+        self.add_option('--graph-snapshot', action="store_true", default=0,
+                        dest="graph_snapshot",
+                        help="Reuse the dependency graph from the last run "
+                             "if the SConscript files are unchanged.")
+
         self.add_option('-h', '--help', action="store_true", default=0,
                         dest="help_msg",
                         help="Print defined help message, or this one.")
@@ -760,10 +1183,19 @@ class OptParser(OptionParser):
                         dest='keep_going',
                         help="Keep going when a target can't be made.")
 
+        self.add_option('--list-stale', action="store_true", default=0,
+                        dest='list_stale',
+                        help="Don't build; list the targets that are out "
+                             "of date, and why.")
+
         self.add_option('--max-drift', type="int", action="store",
                         dest='max_drift', metavar="N",
                         help="Set maximum system clock drift to N seconds.")
 
+        self.add_option('--memoizer-limit', type="int", action="store",
+                        dest='memoizer_limit', metavar="N",
+                        help="Hold at most N entries in each lookup cache.")
+
         self.add_option('-n', '--no-exec', '--just-print', '--dry-run',
                         '--recon', action="store_true", dest='noexec',
                         default=0, help="Don't build; just print commands.")
@@ -782,6 +1214,15 @@ class OptParser(OptionParser):
         self.add_option('--random', dest="random", action="store_true",
                         default=0, help="Build dependencies in random order.")
 
+        self.add_option('--server', action="store_true", default=0,
+                        dest="server",
+                        help="Read the SConscript files once, then keep "
+                             "building for scons commands run here.")
+
+        self.add_option('--no-server', action="store_true", default=0,
+                        dest="no_server",
+                        help="Build here even if a build server is running.")
+
         self.add_option('-s', '--silent', '--quiet', action="store_true",
                         default=0, help="Don't print commands.")
 
@@ -789,6 +1230,38 @@ class OptParser(OptionParser):
                         dest="taskmastertrace_file", metavar="FILE",
                         help="Trace Node evaluation to FILE.")
 
+        self.add_option('--trace-file', action="store",
+                        dest="trace_file", metavar="FILE",
+                        help="Write a JSON timeline of the build to FILE.")
+
+        tree_formats = ["text", "json", "dot"]
+
+        def opt_tree_format(option, opt, value, parser, tree_formats=tree_formats):
+            if value in tree_formats:
+                parser.values.tree_format = value
+            else:
+                raise OptionValueError("Warning:  %s is not a valid tree format" % value)
+        self.add_option('--tree-format', action="callback", type="string",
+                        callback=opt_tree_format, nargs=1,
+                        dest="tree_format", default="text", metavar="FORMAT",
+                        help="Print --debug=tree, stree and dtree output as "
+                             "%s (json puts each tree on one line)." %
+                             string.join(tree_formats, ", "))
+
+        self.add_option('--tree-depth', type="int", action="store",
+                        dest="tree_depth", metavar="N",
+                        help="Stop --debug=tree output N levels below "
+                             "each target.")
+
+        self.add_option('--tree-file', action="store",
+                        dest="tree_file", metavar="FILE",
+                        help="Write --debug=tree output to FILE.")
+
+        self.add_option('--tree-prune', action="store_true",
+                        dest="tree_prune", default=0,
+                        help="Show each node only once in --debug=tree "
+                             "output.")
+
         self.add_option('-u', '--up', '--search-up', action="store_const",
                         dest="climb_up", default=0, const=1,
                         help="Search up directory tree for SConstruct,       "
@@ -806,6 +1279,11 @@ class OptParser(OptionParser):
                         metavar="WARNING-SPEC",
                         help="Enable or disable warnings.")
 
+        self.add_option('--watch', action="store_true", default=0,
+                        dest="watch",
+                        help="Build again whenever something the targets "
+                             "depend on changes (Linux only).")
+
         self.add_option('-Y', '--repository', nargs=1, action="append",
                         help="Search REPOSITORY for source and target files.")
 
@@ -944,17 +1422,24 @@ class SConscriptSettableOptions:
         self.settable[name] = value
     
 
-def _main(args, parser):
-    # Here's where everything really happens.
+def _set_cache_options(fs, options):
+    if options.cache_debug:
+        fs.CacheDebugEnable(options.cache_debug)
+    if options.cache_disable:
+        def disable(self): pass
+        fs.CacheDir = disable
+    if options.cache_force:
+        fs.cache_force = 1
+    if options.cache_show:
+        fs.cache_show = 1
 
-    # First order of business:  set up default warnings and and then
-    # handle the user's warning options, so we can warn about anything
-    # that happens appropriately.
+def _setup_warnings(options):
     default_warnings = [ SCons.Warnings.CorruptSConsignWarning,
                          SCons.Warnings.DeprecatedWarning,
                          SCons.Warnings.DuplicateEnvironmentWarning,
                          SCons.Warnings.MissingSConscriptWarning,
                          SCons.Warnings.NoParallelSupportWarning,
+                         SCons.Warnings.SnapshotWarning,
                          SCons.Warnings.MisleadingKeywordsWarning, ]
     for warning in default_warnings:
         SCons.Warnings.enableWarningClass(warning)
@@ -962,6 +1447,46 @@ def _main(args, parser):
     if options.warn:
         _setup_warn(options.warn)
 
+def _set_build_options(fs, options):
+    _set_globals(options)
+    SCons.Node.implicit_cache = options.implicit_cache
+    SCons.Node.implicit_deps_changed = options.implicit_deps_changed
+    SCons.Node.implicit_deps_unchanged = options.implicit_deps_unchanged
+    if options.noexec:
+        SCons.SConf.dryrun = 1
+        SCons.Action.execute_actions = None
+        CleanTask.execute = CleanTask.show
+    if options.question or options.list_stale:
+        SCons.SConf.dryrun = 1
+    SCons.SConf.SetCacheMode(options.config)
+    SCons.SConf.SetProgressDisplay(progress_display)
+
+    if options.no_progress or options.silent:
+        progress_display.set_mode(0)
+    if options.silent:
+        display.set_mode(0)
+    if options.silent:
+        SCons.Action.print_actions = None
+
+    _set_cache_options(fs, options)
+
+def _restart():
+    """Start over in a new process running the same command, so the
+    SConscript files get read again."""
+    os.chdir(SCons.Script._SConscript.launch_dir)
+    command = "import sys; sys.path = %s; sys.argv = %s; import SCons.Script; SCons.Script.main()" % (repr(sys.path), repr(sys.argv))
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.execv(sys.executable, [sys.executable, '-c', command])
+
+def _main(args, parser):
+    # Here's where everything really happens.
+
+    # First order of business:  set up default warnings and and then
+    # handle the user's warning options, so we can warn about anything
+    # that happens appropriately.
+    _setup_warnings(options)
+
     # Next, we want to create the FS object that represents the outside
     # world's file system, as that's central to a lot of initialization.
     # To do this, however, we need to be in the directory from which we
@@ -1033,35 +1558,7 @@ def _main(args, parser):
     global ssoptions
     ssoptions = SConscriptSettableOptions(options)
 
-    _set_globals(options)
-    SCons.Node.implicit_cache = options.implicit_cache
-    SCons.Node.implicit_deps_changed = options.implicit_deps_changed
-    SCons.Node.implicit_deps_unchanged = options.implicit_deps_unchanged
-    if options.noexec:
-        SCons.SConf.dryrun = 1
-        SCons.Action.execute_actions = None
-        CleanTask.execute = CleanTask.show
-    if options.question:
-        SCons.SConf.dryrun = 1
-    SCons.SConf.SetCacheMode(options.config)
-    SCons.SConf.SetProgressDisplay(progress_display)
-
-    if options.no_progress or options.silent:
-        progress_display.set_mode(0)
-    if options.silent:
-        display.set_mode(0)
-    if options.silent:
-        SCons.Action.print_actions = None
-
-    if options.cache_debug:
-        fs.CacheDebugEnable(options.cache_debug)
-    if options.cache_disable:
-        def disable(self): pass
-        fs.CacheDir = disable
-    if options.cache_force:
-        fs.cache_force = 1
-    if options.cache_show:
-        fs.cache_show = 1
+    _set_build_options(fs, options)
 
     if options.include_dir:
         sys.path = options.include_dir + sys.path
@@ -1076,6 +1573,15 @@ def _main(args, parser):
             xmit_args.append(a)
         else:
             targets.append(a)
+    if options.server:
+        # Each build asks the server for its own targets, so the
+        # SConscript files have to be read without any.
+        if targets:
+            raise SCons.Errors.UserError, "Targets can't be given with --server; give them to the builds instead."
+        if not hasattr(os, 'fork'):
+            raise SCons.Errors.UserError, "--server is not supported on this platform."
+        if options.watch:
+            raise SCons.Errors.UserError, "--server and --watch can't be used together."
     SCons.Script._Add_Targets(targets)
     SCons.Script._Add_Arguments(xmit_args)
 
@@ -1095,24 +1601,50 @@ def _main(args, parser):
 
     progress_display("scons: Reading SConscript files ...")
 
+    startup_stats.append('processing the options')
+
     start_time = time.time()
-    try:
-        for script in scripts:
-            SCons.Script._SConscript._SConscript(fs, script)
-    except SCons.Errors.StopError, e:
-        # We had problems reading an SConscript file, such as it
-        # couldn't be copied in to the BuildDir.  Since we're just
-        # reading SConscript files and haven't started building
-        # things yet, stop regardless of whether they used -i or -k
-        # or anything else.
-        global exit_status
-        sys.stderr.write("scons: *** %s  Stop.\n" % e)
-        exit_status = 2
-        sys.exit(exit_status)
+    snapshot = None
+    snapshot_fs = None
+    if options.graph_snapshot:
+        from SCons.Script.Snapshot import Snapshot
+        snapshot = Snapshot(os.path.join(fs.SConstruct_dir.abspath,
+                                         '.sconsgraph'),
+                            options, args)
+        snapshot_fs = snapshot.load(ssoptions)
+    if snapshot_fs:
+        # Everything the SConscript files set up came back with the
+        # snapshot, except for what the command line says to do with
+        # the file system.
+        fs = snapshot_fs
+        _set_cache_options(fs, options)
+    else:
+        if snapshot:
+            snapshot.record()
+        try:
+            for script in scripts:
+                SCons.Script._SConscript._SConscript(fs, script)
+        except SCons.Errors.StopError, e:
+            # We had problems reading an SConscript file, such as it
+            # couldn't be copied in to the BuildDir.  Since we're just
+            # reading SConscript files and haven't started building
+            # things yet, stop regardless of whether they used -i or -k
+            # or anything else.
+            global exit_status
+            sys.stderr.write("scons: *** %s  Stop.\n" % e)
+            exit_status = 2
+            sys.exit(exit_status)
     global sconscript_time
     sconscript_time = time.time() - start_time
-    SCons.SConf.CreateConfigHBuilder(SCons.Defaults.DefaultEnvironment())
-    progress_display("scons: done reading SConscript files.")
+    if snapshot_fs:
+        progress_display("scons: done loading the dependency graph snapshot.")
+        startup_stats.append('loading the dependency graph snapshot')
+    else:
+        SCons.SConf.CreateConfigHBuilder(SCons.Defaults.DefaultEnvironment())
+        if snapshot:
+            snapshot.save(fs, ssoptions)
+        progress_display("scons: done reading SConscript files.")
+        startup_stats.append('reading SConscript files')
 
     # Tell the Node.FS subsystem that we're all done reading the
     # SConscript files and calling Repository() and BuildDir() and the
@@ -1125,6 +1657,21 @@ def _main(args, parser):
 
     fs.chdir(fs.Top)
 
+    if options.server:
+        from SCons.Script.Server import Server
+        Server(fs, options, xmit_args, target_top).serve()
+    elif options.watch:
+        from SCons.Script.Watch import watch
+        def build(fs=fs, options=options, parser=parser, targets=targets,
+                  target_top=target_top):
+            _build_targets(fs, options, parser, targets, target_top)
+        watch(fs, build)
+    else:
+        _build_targets(fs, options, parser, targets, target_top)
+
+def _build_targets(fs, options, parser, targets, target_top):
+    global clean_plan
+
     if options.help_msg:
         help_text = SCons.Script.help_text
         if help_text is None:
@@ -1225,6 +1772,12 @@ def _main(args, parser):
         failure_message = "building terminated because of errors."
     if options.question:
         task_class = QuestionTask
+    if options.list_stale:
+        task_class = StaleTask
+        opening_message = "Looking for stale targets ..."
+        closing_message = "done looking for stale targets."
+        failure_message = closing_message
+        stale_nodes.clear()
     try:
         if ssoptions.get('clean'):
             task_class = CleanTask
@@ -1259,10 +1812,16 @@ def _main(args, parser):
         tmtrace = open(options.taskmastertrace_file, 'wb')
     else:
         tmtrace = None
+
+    if options.trace_file:
+        SCons.Debug.tracer = SCons.Debug.Tracer(options.trace_file)
+
     taskmaster = SCons.Taskmaster.Taskmaster(nodes, task_class, order, tmtrace)
 
     nj = ssoptions.get('num_jobs')
-    jobs = SCons.Job.Jobs(nj, taskmaster)
+    if task_class is CleanTask and not options.noexec:
+        clean_plan = CleanPlan(nj)
+    jobs = SCons.Job.Jobs(nj, taskmaster, buffer_output=1)
     if nj > 1 and jobs.num_jobs == 1:
         msg = "parallel builds are unsupported by this version of Python;\n" + \
               "\tignoring -j or num_jobs option.\n"
@@ -1270,10 +1829,19 @@ def _main(args, parser):
 
     memory_stats.append('before building targets:')
     count_stats.append(('pre-', 'build'))
+    startup_stats.append('finding the targets to build')
 
     try:
         jobs.run()
+        if clean_plan:
+            clean_plan.execute()
+        if task_class is StaleTask:
+            list_stale(nodes)
     finally:
+        clean_plan = None
+        if SCons.Debug.tracer:
+            SCons.Debug.tracer.write()
+            SCons.Debug.tracer = None
         if exit_status:
             progress_display("scons: " + failure_message)
         else:
@@ -1285,6 +1853,9 @@ def _main(args, parser):
     count_stats.append(('post-', 'build'))
 
 def _exec_main():
+    global imported_time
+    imported_time = time.time()
+
     all_args = sys.argv[1:]
     try:
         all_args = string.split(os.environ['SCONSFLAGS']) + all_args
@@ -1321,11 +1892,11 @@ def _exec_main():
     else:
         _main(args, parser)
 
-def main():
+def main(run=_exec_main):
     global exit_status
     
     try:
-        _exec_main()
+        run()
     except SystemExit, s:
         if s:
             exit_status = s
@@ -1347,6 +1918,7 @@ def main():
 
     memory_stats.print_stats()
     count_stats.print_stats()
+    startup_stats.print_stats()
 
     if print_objects:
         SCons.Debug.listLoggedInstances('*')
@@ -1355,6 +1927,8 @@ def main():
     if print_memoizer:
         print "Memoizer (memory cache) hits and misses:"
         SCons.Memoize.Dump()
+        print "Memoizer (memory cache) sizes:"
+        SCons.Memoize.DumpSizes()
 
     # Dump any development debug info that may have been enabled.
     # These are purely for internal debugging during development, so
@@ -131,6 +131,10 @@ class Frame:
 # the SConstruct/SConscript call stack:
 call_stack = []
 
+# The SConscript files that have been read (None for standard input),
+# so a snapshot of what they built can tell when it's out of date.
+sconscript_files = []
+
 # For documentation on the methods in this file, see the scons man-page
 
 def Return(*vars):
@@ -163,6 +167,7 @@ def _SConscript(fs, *files, **kw):
         try:
             SCons.Script.sconscript_reading = SCons.Script.sconscript_reading + 1
             if fn == "-":
+                sconscript_files.append(None)
                 exec sys.stdin in call_stack[-1].globals
             else:
                 if isinstance(fn, SCons.Node.Node):
@@ -240,9 +245,13 @@ def _SConscript(fs, *files, **kw):
                         del call_stack[-1].globals['__file__']
                     except KeyError:
                         pass
+                    sconscript_files.append(_file_.name)
+                    startup_stats = SCons.Script.Main.startup_stats
+                    startup_stats.sconscript(f.path)
                     try:
                         exec _file_ in call_stack[-1].globals
                     finally:
+                        startup_stats.sconscript_done()
                         if old_file is not None:
                             call_stack[-1].globals.update({__file__:old_file})
                 else:
@@ -0,0 +1,355 @@
+"""SCons.Script.Server
+
+This module implements "scons --server":  read the SConscript files
+once, then do the builds that scons commands run in the same directory
+ask for (see SCons.Client), without reading the SConscript files again.
+
+Each build is done in a fork of the server, so it starts from the
+dependency graph just as it was read, and nothing a build does to the
+Nodes has to be undone for the next one; the server just reads the
+.sconsign information again after each build.  Before each build, the
+server checks the SConscript files and everything else a --graph-snapshot
+depends on (see SCons.Script.Snapshot); if any of it changed, it hands
+that build back to the client and starts over in a new process that
+reads the SConscript files again.
+
+A build is also handed back if it's run in a different directory, with
+different options for reading the SConscript files, different
+ARGUMENTS, or a different external environment than the server.  The
+SConscript files are read without any targets, so they shouldn't look
+at COMMAND_LINE_TARGETS.  This needs os.fork() and Unix-domain sockets.
+
+"""
+
+
+#
+# Copyright (c) 2001, 2002, 2003, 2004 The SCons Foundation
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY
+# KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+__revision__ = "/home/scons/scons/branch.0/branch.96/baseline/src/engine/SCons/Script/Server.py 0.96.93.D001 2006/11/06 08:31:54 knight"
+
+import cStringIO
+import errno
+import marshal
+import os
+import os.path
+import select
+import signal
+import socket
+import string
+import sys
+import time
+import traceback
+
+import SCons.Client
+import SCons.Errors
+import SCons.Node.FS
+import SCons.Script
+import SCons.Script.Main
+import SCons.Script.Snapshot
+import SCons.SConsign
+import SCons.Util
+
+from SCons.Client import send, receive
+
+# The options that decide which SConscript files are read, and how.
+# A build has to be asked for with the same ones as the server.
+reading_options = ['file', 'include_dir', 'repository', 'climb_up',
+                   'config', 'duplicate', 'diskcheck']
+
+# Variables of the external environment that differ from one shell to
+# the next without making any difference to a build.
+ignored_environ = ['_', 'OLDPWD', 'PWD', 'SHLVL', 'SCONSFLAGS']
+
+def _directory(cwd, options):
+    if options.directory:
+        cwd = os.path.join(cwd, SCons.Script.Main._create_path(options.directory))
+    return os.path.normpath(cwd)
+
+def _environ(environ):
+    result = environ.copy()
+    for name in ignored_environ:
+        if result.has_key(name):
+            del result[name]
+    return result
+
+def _directories(fs):
+    result = []
+    stack = fs.Root.values()
+    while stack:
+        dir = stack.pop()
+        result.append(dir)
+        for name, entry in dir.entries.items():
+            if name != '.' and name != '..' and \
+               isinstance(entry, SCons.Node.FS.Dir):
+                stack.append(entry)
+    return result
+
+def _terminate(signum, frame):
+    sys.exit(0)
+
+def _exit_status(code):
+    if code is None:
+        return 0
+    if type(code) is type(0):
+        return code
+    sys.stderr.write(str(code) + '\n')
+    return 1
+
+class Server:
+    """Does the builds that clients ask for, of the dependency graph
+    read into fs."""
+
+    def __init__(self, fs, options, arguments, target_top):
+        self.fs = fs
+        self.options = options
+        self.arguments = arguments
+        self.target_top = target_top
+        self.directory = _directory(SCons.Script._SConscript.launch_dir,
+                                    options)
+        self.environ = _environ(SCons.Client.environ())
+        self.dependencies = SCons.Script.Snapshot.dependencies()
+        if self.dependencies is None:
+            raise SCons.Errors.UserError, "--server can't be used with an SConscript file read from standard input."
+        self.programs = SCons.Script.Snapshot.programs()
+        self.path = os.path.join(fs.SConstruct_dir.abspath,
+                                 SCons.Client.socket_name)
+        self.sock = None
+
+    def listen(self):
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                try:
+                    probe.connect(self.path)
+                except socket.error:
+                    # Left behind by a server that was killed.
+                    os.remove(self.path)
+                else:
+                    raise SCons.Errors.UserError, "A build server is already running in %s." % os.path.dirname(self.path)
+            finally:
+                probe.close()
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        self.sock.listen(5)
+
+    def close(self):
+        self.sock.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def serve(self):
+        """Do builds until interrupted."""
+        self.listen()
+        # Remove the socket when killed, too.
+        signal.signal(signal.SIGTERM, _terminate)
+        try:
+            # Keep what reading the SConscript files stored in the
+            # .sconsign information (Configure results, for example),
+            # the way a build would.
+            if not self.options.noexec:
+                SCons.SConsign.write()
+            self.reload_signatures()
+            SCons.Script.Main.progress_display("scons: Serving builds in %s ..." % os.path.dirname(self.path))
+            while 1:
+                conn, addr = self.sock.accept()
+                try:
+                    try:
+                        self.handle(conn)
+                    except (EOFError, socket.error):
+                        # The client went away.
+                        pass
+                finally:
+                    conn.close()
+        finally:
+            self.close()
+
+    def handle(self, conn):
+        kind, data = receive(conn)
+        if kind != SCons.Client.REQUEST:
+            return
+        argv, cwd, environ = marshal.loads(data)
+
+        # Look the programs up again, and everything the builds look
+        # up too, in case they've been installed or removed since the
+        # last request.
+        SCons.Util.clear_where_is_cache()
+        if not SCons.Script.Snapshot.is_current(self.dependencies) or \
+           not SCons.Script.Snapshot.programs_are_current(self.programs):
+            send(conn, SCons.Client.DECLINE,
+                 "the SConscript files changed; reloading them")
+            conn.close()
+            self.reload()
+
+        parser = SCons.Script.Main.OptParser()
+        args = argv
+        if environ.has_key('SCONSFLAGS'):
+            args = string.split(environ['SCONSFLAGS']) + args
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout = sys.stderr = cStringIO.StringIO()
+        try:
+            try:
+                options, args = parser.parse_args(args)
+            except SystemExit:
+                # A bad option, or one like --version that does its
+                # own thing and exits; the client can do that itself.
+                send(conn, SCons.Client.DECLINE,
+                     "its options need the command line")
+                return
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+
+        reason = self.check(options, args, cwd, environ)
+        if reason:
+            send(conn, SCons.Client.DECLINE, reason)
+            return
+        SCons.Script.Main.progress_display("scons: Building for `%s' ..." % string.join(['scons'] + argv))
+        status = self.build(conn, parser, options, args)
+        send(conn, SCons.Client.EXIT, str(status))
+
+    def check(self, options, args, cwd, environ):
+        """Return why the server can't do the build that was asked
+        for, or None if it can."""
+        if options.server or options.no_server:
+            return "it was asked not to"
+        if options.profile_file or \
+           (options.debug and "pdb" in options.debug):
+            return "it's being profiled or debugged"
+        if _directory(cwd, options) != self.directory:
+            return "it's run in a different directory"
+        for name in reading_options:
+            if getattr(options, name) != getattr(self.options, name):
+                return "the SConscript files were read with different options"
+        if filter(lambda a: '=' in a, args) != self.arguments:
+            return "it sets different ARGUMENTS"
+        if _environ(environ) != self.environ:
+            return "its environment is different"
+        return None
+
+    def build(self, conn, parser, options, args):
+        """Do a build in a fork of the server, passing what it prints
+        on to the client, and return its exit status."""
+        output = os.pipe()
+        error = os.pipe()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            status = 2
+            try:
+                try:
+                    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                    conn.close()
+                    self.sock.close()
+                    null = os.open('/dev/null', os.O_RDONLY)
+                    os.dup2(null, 0)
+                    os.dup2(output[1], 1)
+                    os.dup2(error[1], 2)
+                    map(os.close, [null, output[0], output[1],
+                                   error[0], error[1]])
+                    status = self.run(parser, options, args)
+                except:
+                    traceback.print_exc()
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(status)
+
+        os.close(output[1])
+        os.close(error[1])
+        pipes = {output[0] : SCons.Client.STDOUT,
+                 error[0] : SCons.Client.STDERR}
+        while pipes:
+            try:
+                ready = select.select(pipes.keys(), [], [])[0]
+            except select.error, e:
+                if e[0] == errno.EINTR:
+                    continue
+                raise
+            for fd in ready:
+                data = os.read(fd, 4096)
+                if not data:
+                    os.close(fd)
+                    del pipes[fd]
+                elif conn:
+                    try:
+                        send(conn, pipes[fd], data)
+                    except socket.error:
+                        # The client went away (it was interrupted,
+                        # most likely), so stop the build, too.
+                        os.kill(pid, signal.SIGINT)
+                        conn = None
+        pid, status = os.waitpid(pid, 0)
+        self.reload_signatures()
+        if conn is None:
+            raise EOFError
+        if os.WIFEXITED(status):
+            return os.WEXITSTATUS(status)
+        return 2
+
+    def run(self, parser, options, args):
+        """Do the build that was asked for (in the forked process),
+        the way SCons.Script.Main.main() would after reading the
+        SConscript files, and return the exit status."""
+        Main = SCons.Script.Main
+        SCons.Script.start_time = time.time()
+        Main.sconscript_time = 0
+        Main.options = options
+        Main.ssoptions.options = options
+        targets = filter(lambda a: not '=' in a, args)
+        if targets:
+            # The SConscript files were read without any targets, so
+            # BUILD_TARGETS only holds the Default() ones.
+            del SCons.Script.BUILD_TARGETS[:]
+            del SCons.Script._build_plus_default[:]
+            SCons.Script._Add_Targets(targets)
+
+        def build(self=self, parser=parser, options=options,
+                  targets=targets, Main=Main):
+            Main._setup_warnings(options)
+            Main._set_build_options(self.fs, options)
+            Main._build_targets(self.fs, options, parser, targets,
+                                self.target_top)
+        try:
+            Main.main(build)
+        except SystemExit, e:
+            return _exit_status(e.code)
+        return 0
+
+    def reload_signatures(self):
+        """Forget the .sconsign information read so far and read it
+        again, so that each build starts from what the last one
+        wrote."""
+        SCons.SConsign.Reset()
+        SCons.SConsign.DataBase.clear()
+        for dir in _directories(self.fs):
+            dir._sconsign = None
+        self.fs.Top.sconsign()
+
+    def reload(self):
+        """Start over in a new process that reads the SConscript
+        files again."""
+        SCons.Script.Main.progress_display("scons: The SConscript files changed; reading them again.")
+        self.close()
+        SCons.Script.Main._restart()
@@ -0,0 +1,515 @@
+"""SCons.Script.Snapshot
+
+This module saves the dependency graph that reading the SConscript
+files builds (the file system Nodes with their builders, executors and
+construction environments, plus the few module-level variables the
+SConscript files can set) and loads it back instead of reading the
+SConscript files again, as long as nothing they depend on has changed.
+
+A snapshot is only used if all of these are the same as when it was
+saved:  the SCons and Python versions, the command-line options and
+arguments, the current directory, the external environment (os.environ),
+the contents of every SConscript file read, the modification times of
+every Python module that was loaded, and where every program looked up
+in a search path (WhereIs(), Detect(), the Tool modules) was found, and
+its modification time.  Anything else an SConscript file reads directly
+(files it opens, commands it spawns itself) is not tracked; running
+with --config=force, or without --graph-snapshot, reads the SConscript
+files again.
+
+"""
+
+#
+# Copyright (c) 2001, 2002, 2003, 2004 The SCons Foundation
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY
+# KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+__revision__ = "/home/scons/scons/branch.0/branch.96/baseline/src/engine/SCons/Script/Snapshot.py 0.96.93.D001 2006/11/06 08:31:54 knight"
+
+import cPickle
+import marshal
+import new
+import os
+import os.path
+import pickle
+import stat
+import string
+import sys
+import types
+
+import SCons.Node
+import SCons.Node.Alias
+import SCons.Node.FS
+import SCons.Script
+import SCons.Sig.MD5
+import SCons.Util
+import SCons.Warnings
+
+# Bump this whenever what goes into a snapshot changes.
+snapshot_version = 1
+
+# The module-level variables that reading the SConscript files can set,
+# which get rebound to their saved values.
+saved_globals = [
+    ('SCons.Defaults', '_default_env'),
+    ('SCons.Environment', 'CleanTargets'),
+    ('SCons.Node', 'arg2nodes_lookups'),
+    ('SCons.Node.Alias', 'default_ans'),
+    ('SCons.Node.FS', 'default_fs'),
+    ('SCons.SConsign', 'DB_Module'),
+    ('SCons.SConsign', 'DB_Name'),
+    ('SCons.SConsign', 'ForDirectory'),
+    ('SCons.Script', '_Get_Default_Targets'),
+    ('SCons.Script', 'help_text'),
+]
+
+# The module-level lists that reading the SConscript files can change,
+# which get their saved contents put back in place (other modules hold
+# on to the list objects themselves).
+saved_lists = [
+    ('SCons.Script', 'BUILD_TARGETS'),
+    ('SCons.Script', 'DEFAULT_TARGETS'),
+    ('SCons.Script', '_build_plus_default'),
+]
+
+# Node attributes that hold what was found out about the Node while the
+# SConscript files were read (by configure tests, for example), rather
+# than how the Node gets built.  The Node finds them out again when it
+# needs them.
+transient_attributes = [
+    '_MeMoIZeR_Key',
+    '_calculated_sig',
+    '_proxy',
+    'binfo',
+    'ninfo',
+    'on_disk_entries',
+]
+
+transient_values = {
+    '_sconsign' : None,
+    'implicit' : None,
+    'includes' : None,
+    'ref_count' : 0,
+    'state' : SCons.Node.no_state,
+}
+
+transient_dicts = [
+    'waiting_parents',
+    'waiting_s_e',
+]
+
+def _module(name):
+    __import__(name)
+    return sys.modules[name]
+
+def _node(klass):
+    """Create a Node without initializing it; its state is set from
+    the snapshot afterwards."""
+    if type(klass) is types.ClassType:
+        return new.instance(klass)
+    return klass.__new__(klass)
+
+def _set_node_state(node, state):
+    try:
+        setstate = node.__setstate__
+    except AttributeError:
+        node.__dict__.update(state)
+    else:
+        setstate(state)
+
+def _function(code, module, globals, name, defaults):
+    """Re-create a function that was saved by value, with either the
+    dictionary of the module it was defined in or the (trimmed)
+    globals of the SConscript file that defined it."""
+    if module:
+        globals = _module_dict(module)
+    elif not globals.has_key('__builtins__'):
+        globals['__builtins__'] = __builtins__
+    return new.function(marshal.loads(code), globals, name, defaults)
+
+def _module_dict(name):
+    return _module(name).__dict__
+
+def _stream(name):
+    return getattr(sys, name)
+
+def _code_names(code):
+    """Return the global names a code object (and the code objects of
+    the functions and classes defined in it) can refer to."""
+    names = list(code.co_names)
+    for c in code.co_consts:
+        if type(c) is types.CodeType:
+            names.extend(_code_names(c))
+    return names
+
+def _node_state(node):
+    state = node.__getstate__()
+    for a in transient_attributes:
+        try:
+            del state[a]
+        except KeyError:
+            pass
+    for a, v in transient_values.items():
+        if state.has_key(a):
+            state[a] = v
+    for a in transient_dicts:
+        if state.has_key(a):
+            state[a] = {}
+    return state
+
+def all_nodes(fs):
+    """Return the file system Nodes under all the roots of fs, and
+    the Alias Nodes."""
+    result = []
+    stack = fs.Root.values()
+    while stack:
+        node = stack.pop()
+        result.append(node)
+        try:
+            entries = node.entries
+        except AttributeError:
+            continue
+        for name, entry in entries.items():
+            if name != '.' and name != '..':
+                stack.append(entry)
+    result.extend(SCons.Node.Alias.default_ans.values())
+    return result
+
+class _Pickler(pickle.Pickler):
+    """A Pickler for the dependency graph.
+
+    Nodes are pickled without their transient state.  Functions,
+    methods and modules, which the standard Pickler can't handle, are
+    pickled by reference where they can be imported by name, and by
+    value otherwise.  The standard streams are pickled by name, and
+    other open files as None.
+    """
+
+    dispatch = pickle.Pickler.dispatch.copy()
+
+    def __init__(self, file, streams, deferred):
+        pickle.Pickler.__init__(self, file, 2)
+        self.streams = streams
+        # Evaluating construction variables leaves __builtins__ in the
+        # dictionaries of construction environments, for one.
+        self.module_dicts = {}
+        for name, module in sys.modules.items():
+            if module:
+                self.module_dicts[id(module.__dict__)] = name
+        self.deferred = {}
+        for node in deferred:
+            self.deferred[id(node)] = 1
+
+    def save(self, obj):
+        i = id(obj)
+        if not self.memo.has_key(i):
+            if self.streams.has_key(i):
+                self.save_reduce(_stream, (self.streams[i],))
+                return
+            if self.module_dicts.has_key(i):
+                self.save_reduce(_module_dict, (self.module_dicts[i],))
+                return
+            if isinstance(obj, SCons.Node.Node):
+                # The deferred Nodes are saved first without their
+                # state, so that the rest of the graph (which can be
+                # very deep) only refers to them.
+                if self.deferred.has_key(i):
+                    state = None
+                else:
+                    state = _node_state(obj)
+                self.save_reduce(_node, (obj.__class__,), state, obj=obj)
+                return
+        pickle.Pickler.save(self, obj)
+
+    def save_reduce_once(self, func, args, obj):
+        """Like save_reduce(), for objects that can be reached again
+        (and so pickled) while their arguments are being pickled."""
+        self.save(func)
+        self.save(args)
+        i = id(obj)
+        if self.memo.has_key(i):
+            self.write(pickle.POP + pickle.POP + self.get(self.memo[i][0]))
+        else:
+            self.write(pickle.REDUCE)
+            self.memoize(obj)
+
+    def save_function(self, obj):
+        try:
+            return self.save_global(obj)
+        except pickle.PicklingError:
+            pass
+        if getattr(obj, 'func_closure', None):
+            raise pickle.PicklingError, \
+                  "Can't pickle %s: it refers to a nested scope" % repr(obj)
+        globals = obj.func_globals
+        module = sys.modules.get(globals.get('__name__'))
+        if module and module.__dict__ is globals:
+            module = module.__name__
+            globals = None
+        else:
+            module = None
+            g = {}
+            for n in _code_names(obj.func_code):
+                if globals.has_key(n):
+                    g[n] = globals[n]
+            globals = g
+        args = (marshal.dumps(obj.func_code), module, globals,
+                obj.func_name, obj.func_defaults)
+        self.save_reduce_once(_function, args, obj)
+    dispatch[types.FunctionType] = save_function
+
+    def save_method(self, obj):
+        self.save_reduce_once(getattr,
+                              (obj.im_self or obj.im_class, obj.__name__),
+                              obj)
+    dispatch[types.MethodType] = save_method
+
+    def save_builtin(self, obj):
+        if getattr(obj, '__self__', None) is None:
+            return self.save_global(obj)
+        self.save_reduce_once(getattr, (obj.__self__, obj.__name__), obj)
+    dispatch[types.BuiltinFunctionType] = save_builtin
+
+    def save_class(self, obj):
+        try:
+            return self.save_global(obj)
+        except pickle.PicklingError:
+            pass
+        # It may be defined inside another class (like Node.Attrs).
+        module = sys.modules.get(obj.__module__)
+        if module:
+            for outer in module.__dict__.values():
+                if type(outer) in [types.ClassType, types.TypeType] or \
+                   isinstance(outer, types.TypeType):
+                    if getattr(outer, obj.__name__, None) is obj:
+                        self.save_reduce(getattr, (outer, obj.__name__),
+                                         obj=obj)
+                        return
+        raise pickle.PicklingError, \
+              "Can't pickle %s: it's not found by name" % repr(obj)
+    dispatch[types.ClassType] = save_class
+    dispatch[types.TypeType] = save_class
+
+    def save_dict(self, obj):
+        # Evaluating construction variables leaves __builtins__ in an
+        # environment's dictionary, and Clone() copies that dictionary,
+        # __builtins__ and all, so the copy isn't a module's dictionary
+        # any more.  Pickle it by reference anyway (eval() would put
+        # the real one back in its place), rather than trying to
+        # pickle everything in it.
+        builtins = obj.get('__builtins__')
+        if type(builtins) is types.DictType and \
+           not self.module_dicts.has_key(id(builtins)):
+            self.module_dicts[id(builtins)] = '__builtin__'
+        pickle.Pickler.save_dict(self, obj)
+    dispatch[types.DictType] = save_dict
+
+    def save_module(self, obj):
+        self.save_reduce(_module, (obj.__name__,), obj=obj)
+    dispatch[types.ModuleType] = save_module
+
+    def save_file(self, obj):
+        self.save(None)
+    dispatch[types.FileType] = save_file
+
+class _Recorder:
+    """Copies what's written to a stream, so that what reading the
+    SConscript files printed can be printed again when the snapshot
+    is loaded."""
+    def __init__(self, file):
+        self.file = file
+        self.output = []
+    def write(self, s):
+        self.file.write(s)
+        self.output.append(s)
+    def __getattr__(self, attr):
+        return getattr(self.file, attr)
+
+def _source_file(file):
+    if string.lower(file[-4:]) in ['.pyc', '.pyo'] and \
+       os.path.exists(file[:-1]):
+        return file[:-1]
+    return file
+
+def _mtime(file):
+    try:
+        return os.stat(file)[stat.ST_MTIME]
+    except OSError:
+        return None
+
+def _contents_signature(file):
+    try:
+        return SCons.Sig.MD5.new_md5(open(file, 'rb').read()).hexdigest()
+    except IOError:
+        return None
+
+def dependencies():
+    """Return what the SConscript files that were read depend on: their
+    contents, and the modification times of all the modules loaded
+    while reading them.  Return None if there's no telling."""
+    result = []
+    for file in SCons.Script._SConscript.sconscript_files:
+        if file is None:
+            # Read from stdin, so there's no telling when it changes.
+            return None
+        result.append(('contents', file, _contents_signature(file)))
+    for module in sys.modules.values():
+        file = getattr(module, '__file__', None)
+        if file:
+            file = _source_file(file)
+            result.append(('mtime', file, _mtime(file)))
+    return result
+
+def programs():
+    """Return the programs WhereIs() looked up while reading the
+    SConscript files, and what it found."""
+    result = []
+    for key, found in SCons.Util._where_is_cache.items():
+        path, pathext, reject = key
+        names = found.keys()
+        found = map(lambda n, found=found: found[n], names)
+        mtimes = map(lambda f: f and _mtime(f), found)
+        result.append((path, pathext, reject, names, found, mtimes))
+    return result
+
+def is_current(dependencies):
+    for kind, file, sig in dependencies:
+        if kind == 'contents':
+            if _contents_signature(file) != sig:
+                return None
+        elif _mtime(file) != sig:
+            return None
+    return 1
+
+def programs_are_current(programs):
+    for path, pathext, reject, names, found, mtimes in programs:
+        f = SCons.Util.WhereIsAll(names, list(path), list(pathext),
+                                  list(reject))
+        if f != found:
+            return None
+        if map(lambda f: f and _mtime(f), found) != mtimes:
+            return None
+    return 1
+
+class Snapshot:
+    """A snapshot of the dependency graph, in the given file, for
+    this invocation's options and arguments."""
+
+    def __init__(self, path, options, args):
+        self.path = path
+        opts = options.__dict__.items()
+        opts.sort()
+        environ = os.environ.items()
+        environ.sort()
+        self.context = repr((snapshot_version, sys.version, os.getcwd(),
+                             opts, args, environ))
+        self.recorder = None
+
+    def record(self):
+        """Start copying what gets printed while the SConscript files
+        are read."""
+        self.recorder = sys.stdout = _Recorder(sys.stdout)
+
+    def save(self, fs, ssoptions):
+        """Save the graph that was read.  If it can't be saved (an
+        SConscript file keeps something that can't be pickled in it, for
+        example), warn and go on; the SConscript files just get read
+        again next time."""
+        output = ''
+        streams = {}
+        for name in ['stdin', 'stdout', 'stderr']:
+            streams[id(getattr(sys, name))] = name
+            streams[id(getattr(sys, '__%s__' % name))] = name
+        if self.recorder:
+            sys.stdout = self.recorder.file
+            output = string.join(self.recorder.output, '')
+            streams[id(self.recorder)] = 'stdout'
+
+        deps = dependencies()
+        if deps is None:
+            return
+
+        nodes = all_nodes(fs)
+        tmp = self.path + '.tmp'
+        try:
+            f = open(tmp, 'wb')
+            try:
+                cPickle.dump((self.context, deps, programs()),
+                             f, 1)
+                p = _Pickler(f, streams, nodes)
+                p.dump(nodes)
+                p.dump(map(_node_state, nodes))
+                p.dump((map(lambda g: apply(getattr, (_module(g[0]), g[1])),
+                            saved_globals),
+                        map(lambda l: list(getattr(_module(l[0]), l[1])),
+                            saved_lists),
+                        ssoptions.settable,
+                        output))
+            finally:
+                f.close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            os.rename(tmp, self.path)
+        except (pickle.PicklingError, TypeError, AttributeError,
+                RuntimeError, IOError, OSError), e:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            SCons.Warnings.warn(SCons.Warnings.SnapshotWarning,
+                                "Can't save the dependency graph in %s: %s" % (self.path, e))
+
+    def load(self, ssoptions):
+        """Load the saved graph, and return its file system, if it's
+        still current.  Return None if there's no current snapshot."""
+        try:
+            f = open(self.path, 'rb')
+        except IOError:
+            return None
+        try:
+            try:
+                u = cPickle.Unpickler(f)
+                context, dependencies, programs = u.load()
+                if context != self.context or \
+                   not is_current(dependencies) or \
+                   not programs_are_current(programs):
+                    return None
+                nodes = u.load()
+                states = u.load()
+                glob, lists, settable, output = u.load()
+            except (cPickle.UnpicklingError, EOFError, ImportError,
+                    AttributeError, TypeError, ValueError, IndexError,
+                    KeyError), e:
+                SCons.Warnings.warn(SCons.Warnings.SnapshotWarning,
+                                    "Ignoring unreadable dependency graph in %s: %s" % (self.path, e))
+                return None
+        finally:
+            f.close()
+
+        map(_set_node_state, nodes, states)
+        for (module, name), value in map(None, saved_globals, glob):
+            setattr(_module(module), name, value)
+        for (module, name), value in map(None, saved_lists, lists):
+            getattr(_module(module), name)[:] = value
+        for name, value in settable.items():
+            ssoptions.set(name, value)
+        sys.stdout.write(output)
+        return SCons.Node.FS.default_fs
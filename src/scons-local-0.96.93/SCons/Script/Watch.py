@@ -0,0 +1,300 @@
+"""SCons.Script.Watch
+
+This module implements "scons --watch":  build the targets, wait for
+something they depend on to change, and build them again, in the same
+process and from the same dependency graph.  Only the Nodes that depend
+on what changed are cleared; everything else keeps the state the last
+build left it in, so the Taskmaster passes over it without looking at
+the file system again.
+
+Changes are noticed through the Linux inotify interface (by way of
+ctypes), on the directories of all the files the last build looked at.
+If an SConscript file or an SCons module changes, the process starts
+over and reads the SConscript files again.
+
+A file that wasn't in the dependency graph appearing or disappearing
+only makes SCons list its directory again; a Node that would now find
+it (through an #include, say) is only scanned again when it changes.
+
+"""
+
+
+#
+# Copyright (c) 2001, 2002, 2003, 2004 The SCons Foundation
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY
+# KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+__revision__ = "/home/scons/scons/branch.0/branch.96/baseline/src/engine/SCons/Script/Watch.py 0.96.93.D001 2006/11/06 08:31:54 knight"
+
+import os
+import select
+import string
+import struct
+import sys
+
+import SCons.Errors
+import SCons.Node
+import SCons.Node.FS
+import SCons.Script.Main
+import SCons.Script.Snapshot
+import SCons.Util
+
+# The inotify(7) event bits.
+IN_MODIFY       = 0x00000002
+IN_ATTRIB       = 0x00000004
+IN_CLOSE_WRITE  = 0x00000008
+IN_MOVED_FROM   = 0x00000040
+IN_MOVED_TO     = 0x00000080
+IN_CREATE       = 0x00000100
+IN_DELETE       = 0x00000200
+IN_Q_OVERFLOW   = 0x00004000
+IN_IGNORED      = 0x00008000
+
+watch_mask = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | \
+             IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+event_header = 'iIII'
+event_header_size = struct.calcsize(event_header)
+
+# How long to keep collecting changes after the first one, so that
+# saving a handful of files starts one build, not several.
+settle_time = 0.2
+
+class Inotify:
+    """The directories being watched, and what changes in them."""
+
+    def __init__(self):
+        try:
+            import ctypes
+            import ctypes.util
+        except ImportError:
+            raise SCons.Errors.UserError, "--watch needs the ctypes module."
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'))
+            init = libc.inotify_init
+            self.add_watch = libc.inotify_add_watch
+        except (OSError, AttributeError):
+            raise SCons.Errors.UserError, "--watch is only supported on Linux."
+        self.fd = init()
+        if self.fd < 0:
+            raise SCons.Errors.UserError, "Can't watch for changes (inotify_init() failed)."
+        self.dirs = {}
+        self.descriptors = {}
+
+    def watch(self, dir):
+        path = dir.abspath
+        if self.descriptors.has_key(path):
+            return
+        wd = self.add_watch(self.fd, path, watch_mask)
+        if wd >= 0:
+            self.descriptors[path] = wd
+            self.dirs[wd] = dir
+
+    def read(self, timeout=None):
+        """Return the changes that come within timeout seconds, as
+        (directory Node, name) pairs.  A pair of Nones means too much
+        changed for the kernel to keep track of."""
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        data = os.read(self.fd, 65536)
+        result = []
+        while data:
+            wd, mask, cookie, length = \
+                struct.unpack(event_header, data[:event_header_size])
+            name = data[event_header_size:event_header_size+length]
+            data = data[event_header_size+length:]
+            if mask & IN_Q_OVERFLOW:
+                result.append((None, None))
+            elif mask & IN_IGNORED:
+                # The directory itself went away.
+                try:
+                    dir = self.dirs[wd]
+                except KeyError:
+                    pass
+                else:
+                    del self.dirs[wd]
+                    del self.descriptors[dir.abspath]
+            elif self.dirs.has_key(wd):
+                result.append((self.dirs[wd], string.split(name, '\0')[0]))
+        return result
+
+    def wait(self):
+        """Wait for changes, and return them once things settle down."""
+        changes = self.read()
+        while 1:
+            more = self.read(settle_time)
+            if not more:
+                return changes
+            changes.extend(more)
+
+# The states the last build leaves the targets it tried to build in.
+attempted_states = {
+    SCons.Node.executing : 1,
+    SCons.Node.executed : 1,
+    SCons.Node.failed : 1,
+}
+
+class Graph:
+    """What the last build looked at:  the Nodes it evaluated and
+    their children, and which of them depends on which."""
+
+    def __init__(self, fs):
+        self.nodes = SCons.Script.Snapshot.all_nodes(fs)
+        self.parents = {}
+        self.dirs = {}
+        for node in self.nodes:
+            if node.get_state() == SCons.Node.no_state:
+                continue
+            self.add_dir(node)
+            # A Node that was just built has forgotten its implicit
+            # dependencies, so they get scanned for again here.
+            for child in node.all_children():
+                self.add_parent(child, node)
+                self.add_dir(child)
+            try:
+                src = node.srcnode()
+            except AttributeError:
+                pass
+            else:
+                if not src is node:
+                    self.add_parent(src, node)
+                    self.add_dir(src)
+
+    def add_parent(self, node, parent):
+        try:
+            self.parents[id(node)].append(parent)
+        except KeyError:
+            self.parents[id(node)] = [parent]
+
+    def add_dir(self, node):
+        if isinstance(node, SCons.Node.FS.Dir):
+            self.dirs[node] = 1
+        else:
+            dir = getattr(node, 'dir', None)
+            if dir:
+                self.dirs[dir] = 1
+
+    def invalidate(self, node, cleared):
+        """Clear node, and everything that depends on it, so the next
+        build looks at them again."""
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if cleared.has_key(id(node)):
+                continue
+            cleared[id(node)] = 1
+            node.clear()
+            node.set_state(SCons.Node.no_state)
+            stack.extend(self.parents.get(id(node), []))
+            # Targets built by the same action go together.
+            try:
+                executor = node.get_executor(create=None)
+            except AttributeError:
+                pass
+            else:
+                stack.extend(executor.targets)
+
+    def invalidate_all(self, cleared):
+        for node in self.nodes:
+            self.invalidate(node, cleared)
+            try:
+                del node.on_disk_entries
+            except AttributeError:
+                pass
+
+    def built(self, change):
+        """Return whether the change was the last build writing one
+        of its targets."""
+        dir, name = change
+        if dir is None:
+            return None
+        node = dir.entries.get(SCons.Node.FS._my_normcase(name))
+        # A target whose build failed (or was cut short) can have been
+        # written or truncated too, and counting that as a change would
+        # start the same failing build over and over.  Failed is also
+        # the state of the targets left unbuilt because one of their
+        # children failed, but they weren't written at all.
+        return node and attempted_states.has_key(node.get_state())
+
+    def changed(self, changes):
+        """Clear what the changes affect, and return the number of
+        Nodes that need to be looked at again."""
+        cleared = {}
+        for dir, name in changes:
+            if dir is None:
+                self.invalidate_all(cleared)
+                break
+            # Whatever happened, the directory has to be listed again.
+            dir.clear()
+            try:
+                del dir.on_disk_entries
+            except AttributeError:
+                pass
+            node = dir.entries.get(SCons.Node.FS._my_normcase(name))
+            if node and (self.parents.has_key(id(node)) or
+                         node.get_state() != SCons.Node.no_state):
+                self.invalidate(node, cleared)
+        return len(cleared)
+
+def watch(fs, build):
+    """Call build() to build the targets, and again whenever something
+    they depend on changes, until interrupted."""
+    progress_display = SCons.Script.Main.progress_display
+    inotify = Inotify()
+    dependencies = SCons.Script.Snapshot.dependencies()
+    programs = SCons.Script.Snapshot.programs()
+    sconscripts = [fs.SConstruct_dir]
+    for file in SCons.Script._SConscript.sconscript_files:
+        if file:
+            sconscripts.append(fs.File(file).dir)
+    map(inotify.watch, sconscripts)
+
+    while 1:
+        SCons.Script.Main.exit_status = 0
+        try:
+            build()
+        except SCons.Errors.UserError, e:
+            sys.stderr.write("scons: *** %s\n" % e)
+
+        graph = Graph(fs)
+        map(inotify.watch, graph.dirs.keys())
+
+        # Pass over what the build itself wrote.
+        changes = []
+        while 1:
+            more = inotify.read(0)
+            if not more:
+                break
+            changes.extend(more)
+        changes = filter(lambda c, g=graph: not g.built(c), changes)
+
+        progress_display("scons: Watching for changes ...")
+        while not graph.changed(changes):
+            changes = inotify.wait()
+            # Look the programs up again, and everything the next
+            # build looks up too, in case they've been installed or
+            # removed while we waited.
+            SCons.Util.clear_where_is_cache()
+            if not dependencies is None and \
+               (not SCons.Script.Snapshot.is_current(dependencies) or
+                not SCons.Script.Snapshot.programs_are_current(programs)):
+                progress_display("scons: The SConscript files changed; reading them again.")
+                SCons.Script.Main._restart()
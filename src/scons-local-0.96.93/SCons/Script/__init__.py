@@ -44,8 +44,8 @@ import string
 import sys
 import UserList
 
-# Special chicken-and-egg handling of the "--debug=memoizer"
-# and "--debug=nomemoizer" flags:
+# Special chicken-and-egg handling of the "--debug=memoizer",
+# "--debug=nomemoizer" and "--memoizer-limit=" flags:
 #
 # SCons.Memoize contains a metaclass implementation that affects how
 # the other classes are instantiated.  The Memoizer handles optional
@@ -60,6 +60,8 @@ import UserList
 # functions.  So we have to use a special-case, up-front check for
 # the "--debug=memoizer" and "--debug=nomemoizer" flags and do what's
 # appropriate before we import any of the other modules that use it.
+# The same goes for bounding the lookup caches with --memoizer-limit
+# (given as --memoizer-limit=N or --memoizer-limit N).
 _args = sys.argv + string.split(os.environ.get('SCONSFLAGS', ''))
 if "--debug=memoizer" in _args:
     import SCons.Memoize
@@ -67,6 +69,23 @@ if "--debug=memoizer" in _args:
 if "--debug=nomemoizer" in _args:
     import SCons.Memoize
     SCons.Memoize.DisableMemoization()
+for _i in range(len(_args)):
+    if _args[_i][:17] == '--memoizer-limit=':
+        _limit = _args[_i][17:]
+    elif _args[_i] == '--memoizer-limit' and _i + 1 < len(_args):
+        _limit = _args[_i + 1]
+    else:
+        continue
+    try:
+        _limit = int(_limit)
+    except ValueError:
+        # Leave it for the option parser to complain about.
+        pass
+    else:
+        import SCons.Memoize
+        SCons.Memoize.SetLimit(_limit)
+    del _limit
+del _i
 del _args
 
 import SCons.Action
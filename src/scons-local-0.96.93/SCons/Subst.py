@@ -37,7 +37,7 @@ import UserList
 
 import SCons.Errors
 
-from SCons.Util import is_String, is_List, is_Tuple
+from SCons.Util import is_String, is_List, is_Tuple, is_Dict, to_String
 
 # Indexed by the SUBST_* constants below.
 _strconv = [SCons.Util.to_String,
@@ -323,148 +323,393 @@ _separate_args = re.compile(r'(%s|\s+|[^\s\$]+|\$)' % _dollar_exps_str)
 # space characters in the string result from the scons_subst() function.
 _space_sep = re.compile(r'[\t ]+(?![^{]*})')
 
-def scons_subst(strSubst, env, mode=SUBST_RAW, target=None, source=None, gvars={}, lvars={}, conv=None):
+# Opcodes for the "compiled" templates that we build from strings the
+# first time we see them, so we don't have to re-split and re-examine
+# every token each time we substitute the same $CXXCOM, $LINKCOM, etc.
+# for another target.
+_LITERAL     = 0        # plain text, used as-is
+_SPACE       = 1        # white space between words
+_NEWLINE     = 2        # white space that contains a newline
+_DOLLAR      = 3        # "$$"
+_OPEN_STRIP  = 4        # "$("
+_CLOSE_STRIP = 5        # "$)"
+_VARIABLE    = 6        # "$VARIABLE"
+_EXPRESSION  = 7        # "${any stuff}" or "$TARGET.attribute"
+
+def _compile_token(a):
+    """Turn a single token (as split out by one of the _dollar_exps
+    or _separate_args regular expressions) into an instruction for
+    the substitution "program."
+
+    Instructions are tuples of (opcode, token text, key, code, var),
+    where key is the variable name or expression to evaluate, code is
+    the pre-compiled code object for an expression (or None if it
+    wouldn't compile, in which case we let eval() report the error
+    at substitution time), and var is the variable name we null out
+    to prevent infinite recursion.
+    """
+    c = a[0]
+    if c in ' \t\n\r\f\v':
+        if '\n' in a:
+            return (_NEWLINE, a, None, None, None)
+        return (_SPACE, a, None, None, None)
+    if c != '$' or len(a) < 2:
+        return (_LITERAL, a, None, None, None)
+    c = a[1]
+    if c == '$':
+        return (_DOLLAR, a, None, None, None)
+    if c == '(':
+        return (_OPEN_STRIP, a, None, None, None)
+    if c == ')':
+        return (_CLOSE_STRIP, a, None, None, None)
+    key = a[1:]
+    if key[0] == '{' or string.find(key, '.') >= 0:
+        if key[0] == '{':
+            key = key[1:-1]
+        try:
+            code = compile(key, '<subst>', 'eval')
+        except SyntaxError:
+            code = None
+        return (_EXPRESSION, a, key, code, string.split(key, '.')[0])
+    return (_VARIABLE, a, key, None, key)
+
+# The compiled templates, indexed by the string from which they
+# were compiled.  We only cache real (non-Unicode) strings, and start
+# over if the cache gets unreasonably big, since substituted file
+# names and the like can end up in here, too.  A Unicode string would
+# find the program for an equal plain string, and its expansion would
+# come back as a plain string, so Unicode strings (and UserStrings)
+# are compiled every time with _list_program() or _string_program().
+_list_templates = {}
+_string_templates = {}
+_template_cache_limit = 10000
+
+def _list_program(s):
+    """Compile the string s for scons_subst_list() expansion."""
+    return tuple(map(_compile_token, _separate_args.findall(s)))
+
+def _string_program(s):
+    """Compile the string s for scons_subst() expansion.
+
+    The program is a tuple that alternates literal strings (at the
+    even indices) with instructions for the $-expansions between them
+    (at the odd indices).
+    """
+    program = _dollar_exps.split(s)
+    for i in range(1, len(program), 2):
+        program[i] = _compile_token(program[i])
+    return tuple(program)
+
+def _compile_list_template(s):
+    """Return the cached program for scons_subst_list() expansion of
+    the plain string s, compiling it if we haven't seen it before."""
+    try:
+        return _list_templates[s]
+    except KeyError:
+        pass
+    program = _list_program(s)
+    if len(_list_templates) >= _template_cache_limit:
+        _list_templates.clear()
+    _list_templates[s] = program
+    return program
+
+def _compile_string_template(s):
+    """Return the cached program for scons_subst() expansion of the
+    plain string s, compiling it if we haven't seen it before."""
+    try:
+        return _string_templates[s]
+    except KeyError:
+        pass
+    program = _string_program(s)
+    if len(_string_templates) >= _template_cache_limit:
+        _string_templates.clear()
+    _string_templates[s] = program
+    return program
+
+# The types of callables we trust to compute their results purely
+# from their arguments when they're called from an ${expression}.
+# Anything else (like the Variable_Method_Caller objects that go looking
+# for $TARGET on the stack) might depend on the target or source.
+_plain_function_types = (types.FunctionType, types.BuiltinFunctionType)
+
+def _note_expression(subber, code, lvars):
+    """Record the names used by an ${expression} we're about to
+    evaluate, and whether the result could depend on anything other
+    than the construction environment (that is, on the target, the
+    source, or any other local variable)."""
+    if code is None:
+        subber.dependent = subber.dependent + 1
+        return
+    gvars = subber.gvars
+    for name in code.co_names:
+        if lvars.has_key(name):
+            if name != '__env__':
+                subber.dependent = subber.dependent + 1
+        else:
+            v = gvars.get(name)
+            if callable(v) and not type(v) in _plain_function_types:
+                subber.dependent = subber.dependent + 1
+    subber.reads.extend(list(code.co_names))
+
+def _reads_ok(reads, lvars):
+    """Return true if none of the variable names that a cached expansion
+    read from the construction environment is shadowed by a local
+    variable in the current expansion (in practice, by the null string
+    we use to prevent infinite recursion)."""
+    for name in reads:
+        if lvars.has_key(name) and name != '__env__':
+            return None
+    return 1
+
+class _Missing:
+    """Stands in for a variable that isn't set in a snapshot."""
+    pass
+
+_missing = _Missing()
+
+def _snapshot(value):
+    """Return a copy of a construction variable value that can be
+    compared with == to a later snapshot, to tell whether the value
+    changed in between.  Lists, tuples and dictionaries (including
+    UserLists and UserDicts) are copied all the way down, since they
+    can be changed in place by anyone who holds them.  Anything else
+    is kept as is."""
+    if is_List(value) or is_Tuple(value):
+        return map(_snapshot, value)
+    if is_Dict(value):
+        result = {}
+        for k, v in value.items():
+            result[k] = _snapshot(v)
+        return result
+    return value
+
+def _snapshot_reads(reads, gvars):
+    """Return snapshots of the values of the variables that a cached
+    expansion read from the construction environment, by name."""
+    result = {}
+    for name in reads:
+        if not result.has_key(name):
+            result[name] = _snapshot(gvars.get(name, _missing))
+    return result
+
+def _values_ok(values, gvars):
+    """Return true if the variables that a cached expansion read from
+    the construction environment still have the values they had when
+    it was made.  The environment throws its cache away whenever it
+    sets a value, but values can also be changed in place through a
+    list or dictionary someone held on to, or by writing to the
+    environment's dictionary directly, so we check."""
+    for name, value in values.items():
+        if _snapshot(gvars.get(name, _missing)) != value:
+            return None
+    return 1
+
+def _eval_token(subber, token, lvars):
+    """Evaluate the value of a compiled _VARIABLE or _EXPRESSION
+    instruction.  Returns a tuple of (found, value) so callers can
+    tell the difference between a missing variable and one that
+    happens to be set to None."""
+    op, s, key, code, var = token
+    reads = subber.reads
+    if op == _VARIABLE:
+        if lvars.has_key(key):
+            subber.dependent = subber.dependent + 1
+            return 1, lvars[key]
+        if not reads is None:
+            reads.append(key)
+        if subber.gvars.has_key(key):
+            return 1, subber.gvars[key]
+        return None, None
+    if not reads is None:
+        _note_expression(subber, code, lvars)
+    if code is None:
+        code = key
+    try:
+        return 1, eval(code, subber.gvars, lvars)
+    except AttributeError, e:
+        raise SCons.Errors.UserError, \
+              "Error trying to evaluate `%s': %s" % (s, e)
+    except (IndexError, NameError, TypeError):
+        return None, None
+    except SyntaxError,e:
+        if subber.target:
+            raise SCons.Errors.BuildError, (subber.target[0], "Syntax error `%s' trying to evaluate `%s'" % (e,s))
+        else:
+            raise SCons.Errors.UserError, "Syntax error `%s' trying to evaluate `%s'" % (e,s)
+
+class StringSubber:
+    """A class to construct the results of a scons_subst() call.
+
+    This binds a specific construction environment, mode, target and
+    source with two methods (substitute() and expand()) that handle
+    the expansion.
+
+    If we're given a cache (a dictionary that belongs to the
+    construction environment, and that the environment throws away
+    whenever it's modified), we use it to remember the expansions of
+    variables that turn out not to depend on the target or source.
+    To tell, we count every lookup of a local variable ($TARGET,
+    $SOURCES, etc.) and every call of a callable in .dependent, and
+    keep track of the names we read from the environment in .reads.
+    """
+    def __init__(self, env, mode, target, source, conv, gvars, cache=None):
+        self.env = env
+        self.mode = mode
+        self.target = target
+        self.source = source
+        self.conv = conv
+        self.gvars = gvars
+        self.cache = cache
+        self.dependent = 0
+        if cache is None:
+            self.reads = None
+        else:
+            self.reads = []
+
+    def expand_token(self, token, lvars):
+        """Expand a single compiled instruction, returning an
+        appropriate string containing the expansion."""
+        op = token[0]
+        if op == _DOLLAR:
+            return '$'
+        elif op < _VARIABLE:
+            return token[1]
+        cache = self.cache
+        if not cache is None:
+            key = ('string', self.mode, token[1])
+            try:
+                result, reads, values = cache[key]
+            except KeyError:
+                pass
+            else:
+                if _reads_ok(reads, lvars) and \
+                   _values_ok(values, self.gvars):
+                    self.reads.extend(reads)
+                    return result
+            dependent = self.dependent
+            start = len(self.reads)
+        found, s = _eval_token(self, token, lvars)
+        if not found:
+            return ''
+
+        # Before re-expanding the result, handle
+        # recursive expansion by copying the local
+        # variable dictionary and overwriting a null
+        # string for the value of the variable name
+        # we just expanded.
+        #
+        # This could potentially be optimized by only
+        # copying lvars when s contains more expansions,
+        # but lvars is usually supposed to be pretty
+        # small, and deeply nested variable expansions
+        # are probably more the exception than the norm,
+        # so it should be tolerable for now.
+        lv = lvars.copy()
+        lv[token[4]] = ''
+        result = self.substitute(s, lv)
+        if not cache is None and self.dependent == dependent:
+            reads = self.reads[start:]
+            cache[key] = (result, reads, _snapshot_reads(reads, self.gvars))
+        return result
+
+    def expand(self, s, lvars):
+        """Expand a single "token" as necessary, returning an
+        appropriate string containing the expansion.
+
+        This handles expanding different types of things (strings,
+        lists, callables) appropriately.  It calls the wrapper
+        substitute() method to re-expand things as necessary, so that
+        the results of expansions of side-by-side strings still get
+        re-evaluated separately, not smushed together.
+        """
+        if is_String(s):
+            try:
+                s0, s1 = s[:2]
+            except (IndexError, ValueError):
+                return s
+            if s0 != '$':
+                return s
+            return self.expand_token(_compile_token(to_String(s)), lvars)
+        elif is_List(s) or is_Tuple(s):
+            def func(l, conv=self.conv, substitute=self.substitute, lvars=lvars):
+                return conv(substitute(l, lvars))
+            r = map(func, s)
+            return string.join(r)
+        elif callable(s):
+            self.dependent = self.dependent + 1
+            try:
+                s = s(target=self.target,
+                     source=self.source,
+                     env=self.env,
+                     for_signature=(self.mode != SUBST_CMD))
+            except TypeError:
+                # This probably indicates that it's a callable
+                # object that doesn't match our calling arguments
+                # (like an Action).
+                s = str(s)
+            return self.substitute(s, lvars)
+        elif s is None:
+            return ''
+        else:
+            return s
+
+    def substitute(self, args, lvars):
+        """Substitute expansions in an argument or list of arguments.
+
+        This serves as a wrapper for splitting up a string into
+        separate tokens.
+        """
+        if type(args) is types.StringType:
+            program = _compile_string_template(args)
+        elif is_String(args) and not isinstance(args, CmdStringHolder):
+            program = _string_program(to_String(args))
+        else:
+            return self.expand(args, lvars)
+
+        if len(program) == 1:
+            return program[0]
+        conv = self.conv
+        result = list(program)
+        for i in range(1, len(program), 2):
+            result[i] = conv(self.expand_token(program[i], lvars))
+        try:
+            return string.join(result, '')
+        except TypeError:
+            # If the internal conversion routine doesn't return
+            # strings (it could be overridden to return Nodes, for
+            # example), then we can't just join the pieces.  Back
+            # off to a slower, general-purpose algorithm that works
+            # for all data types.
+            args = _separate_args.findall(args)
+            result = []
+            for a in args:
+                result.append(self.conv(self.expand(a, lvars)))
+            try:
+                result = string.join(result, '')
+            except TypeError:
+                if len(result) == 1:
+                    result = result[0]
+            return result
+
+def scons_subst(strSubst, env, mode=SUBST_RAW, target=None, source=None, gvars={}, lvars={}, conv=None, cache=None):
     """Expand a string containing construction variable substitutions.
 
     This is the work-horse function for substitutions in file names
     and the like.  The companion scons_subst_list() function (below)
     handles separating command lines into lists of arguments, so see
     that function if that's what you're looking for.
+
+    The optional cache is a dictionary in which expansions that don't
+    depend on the target or source can be remembered.  It's only
+    used with the default conversion routine for the mode.
     """
     if type(strSubst) == types.StringType and string.find(strSubst, '$') < 0:
         return strSubst
 
-    class StringSubber:
-        """A class to construct the results of a scons_subst() call.
-
-        This binds a specific construction environment, mode, target and
-        source with two methods (substitute() and expand()) that handle
-        the expansion.
-        """
-        def __init__(self, env, mode, target, source, conv, gvars):
-            self.env = env
-            self.mode = mode
-            self.target = target
-            self.source = source
-            self.conv = conv
-            self.gvars = gvars
-
-        def expand(self, s, lvars):
-            """Expand a single "token" as necessary, returning an
-            appropriate string containing the expansion.
-
-            This handles expanding different types of things (strings,
-            lists, callables) appropriately.  It calls the wrapper
-            substitute() method to re-expand things as necessary, so that
-            the results of expansions of side-by-side strings still get
-            re-evaluated separately, not smushed together.
-            """
-            if is_String(s):
-                try:
-                    s0, s1 = s[:2]
-                except (IndexError, ValueError):
-                    return s
-                if s0 != '$':
-                    return s
-                if s1 == '$':
-                    return '$'
-                elif s1 in '()':
-                    return s
-                else:
-                    key = s[1:]
-                    if key[0] == '{' or string.find(key, '.') >= 0:
-                        if key[0] == '{':
-                            key = key[1:-1]
-                        try:
-                            s = eval(key, self.gvars, lvars)
-                        except AttributeError, e:
-                            raise SCons.Errors.UserError, \
-                                  "Error trying to evaluate `%s': %s" % (s, e)
-                        except (IndexError, NameError, TypeError):
-                            return ''
-                        except SyntaxError,e:
-                            if self.target:
-                                raise SCons.Errors.BuildError, (self.target[0], "Syntax error `%s' trying to evaluate `%s'" % (e,s))
-                            else:
-                                raise SCons.Errors.UserError, "Syntax error `%s' trying to evaluate `%s'" % (e,s)
-                    else:
-                        if lvars.has_key(key):
-                            s = lvars[key]
-                        elif self.gvars.has_key(key):
-                            s = self.gvars[key]
-                        else:
-                            return ''
-    
-                    # Before re-expanding the result, handle
-                    # recursive expansion by copying the local
-                    # variable dictionary and overwriting a null
-                    # string for the value of the variable name
-                    # we just expanded.
-                    #
-                    # This could potentially be optimized by only
-                    # copying lvars when s contains more expansions,
-                    # but lvars is usually supposed to be pretty
-                    # small, and deeply nested variable expansions
-                    # are probably more the exception than the norm,
-                    # so it should be tolerable for now.
-                    lv = lvars.copy()
-                    var = string.split(key, '.')[0]
-                    lv[var] = ''
-                    return self.substitute(s, lv)
-            elif is_List(s) or is_Tuple(s):
-                def func(l, conv=self.conv, substitute=self.substitute, lvars=lvars):
-                    return conv(substitute(l, lvars))
-                r = map(func, s)
-                return string.join(r)
-            elif callable(s):
-                try:
-                    s = s(target=self.target,
-                         source=self.source,
-                         env=self.env,
-                         for_signature=(self.mode != SUBST_CMD))
-                except TypeError:
-                    # This probably indicates that it's a callable
-                    # object that doesn't match our calling arguments
-                    # (like an Action).
-                    s = str(s)
-                return self.substitute(s, lvars)
-            elif s is None:
-                return ''
-            else:
-                return s
-
-        def substitute(self, args, lvars):
-            """Substitute expansions in an argument or list of arguments.
-
-            This serves as a wrapper for splitting up a string into
-            separate tokens.
-            """
-            if is_String(args) and not isinstance(args, CmdStringHolder):
-                try:
-                    def sub_match(match, conv=self.conv, expand=self.expand, lvars=lvars):
-                        return conv(expand(match.group(1), lvars))
-                    result = _dollar_exps.sub(sub_match, args)
-                except TypeError:
-                    # If the internal conversion routine doesn't return
-                    # strings (it could be overridden to return Nodes, for
-                    # example), then the 1.5.2 re module will throw this
-                    # exception.  Back off to a slower, general-purpose
-                    # algorithm that works for all data types.
-                    args = _separate_args.findall(args)
-                    result = []
-                    for a in args:
-                        result.append(self.conv(self.expand(a, lvars)))
-                    try:
-                        result = string.join(result, '')
-                    except TypeError:
-                        if len(result) == 1:
-                            result = result[0]
-                return result
-            else:
-                return self.expand(args, lvars)
-
     if conv is None:
         conv = _strconv[mode]
+    else:
+        cache = None
 
     # Doing this every time is a bit of a waste, since the Executor
     # has typically already populated the OverrideEnvironment with
@@ -488,7 +733,7 @@ def scons_subst(strSubst, env, mode=SUBST_RAW, target=None, source=None, gvars={
     # for expansion.
     gvars['__builtin__'] = __builtin__
 
-    ss = StringSubber(env, mode, target, source, conv, gvars)
+    ss = StringSubber(env, mode, target, source, conv, gvars, cache)
     result = ss.substitute(strSubst, lvars)
 
     try:
@@ -511,249 +756,383 @@ def scons_subst(strSubst, env, mode=SUBST_RAW, target=None, source=None, gvars={
 
 #Subst_List_Strings = {}
 
-def scons_subst_list(strSubst, env, mode=SUBST_RAW, target=None, source=None, gvars={}, lvars={}, conv=None):
-    """Substitute construction variables in a string (or list or other
-    object) and separate the arguments into a command list.
-
-    The companion scons_subst() function (above) handles basic
-    substitutions within strings, so see that function instead
-    if that's what you're looking for.
+class ListSubber(UserList.UserList):
+    """A class to construct the results of a scons_subst_list() call.
+
+    Like StringSubber, this class binds a specific construction
+    environment, mode, target and source with two methods
+    (substitute() and expand()) that handle the expansion.
+
+    In addition, however, this class is used to track the state of
+    the result(s) we're gathering so we can do the appropriate thing
+    whenever we have to append another word to the result--start a new
+    line, start a new word, append to the current word, etc.  We do
+    this by setting the "append" attribute to the right method so
+    that our wrapper methods only need ever call ListSubber.append(),
+    and the rest of the object takes care of doing the right thing
+    internally.
+
+    A cache of expansions works like it does for StringSubber, except
+    that what we remember for a variable is the list of lines and
+    words it expanded to (see _FragmentRecorder), which we then replay
+    into the result.
     """
-#    try:
-#        Subst_List_Strings[strSubst] = Subst_List_Strings[strSubst] + 1
-#    except KeyError:
-#        Subst_List_Strings[strSubst] = 1
-#    import SCons.Debug
-#    SCons.Debug.caller(1)
-    class ListSubber(UserList.UserList):
-        """A class to construct the results of a scons_subst_list() call.
-
-        Like StringSubber, this class binds a specific construction
-        environment, mode, target and source with two methods
-        (substitute() and expand()) that handle the expansion.
-
-        In addition, however, this class is used to track the state of
-        the result(s) we're gathering so we can do the appropriate thing
-        whenever we have to append another word to the result--start a new
-        line, start a new word, append to the current word, etc.  We do
-        this by setting the "append" attribute to the right method so
-        that our wrapper methods only need ever call ListSubber.append(),
-        and the rest of the object takes care of doing the right thing
-        internally.
-        """
-        def __init__(self, env, mode, target, source, conv, gvars):
-            UserList.UserList.__init__(self, [])
-            self.env = env
-            self.mode = mode
-            self.target = target
-            self.source = source
-            self.conv = conv
-            self.gvars = gvars
-
-            if self.mode == SUBST_RAW:
-                self.add_strip = lambda x, s=self: s.append(x)
-            else:
-                self.add_strip = lambda x, s=self: None
-            self.in_strip = None
-            self.next_line()
-
-        def expand(self, s, lvars, within_list):
-            """Expand a single "token" as necessary, appending the
-            expansion to the current result.
-
-            This handles expanding different types of things (strings,
-            lists, callables) appropriately.  It calls the wrapper
-            substitute() method to re-expand things as necessary, so that
-            the results of expansions of side-by-side strings still get
-            re-evaluated separately, not smushed together.
-            """
+    def __init__(self, env, mode, target, source, conv, gvars, cache=None):
+        UserList.UserList.__init__(self, [])
+        self.env = env
+        self.mode = mode
+        self.target = target
+        self.source = source
+        self.conv = conv
+        self.gvars = gvars
+        self.cache = cache
+        self.dependent = 0
+        if cache is None:
+            self.reads = None
+        else:
+            self.reads = []
 
-            if is_String(s):
-                try:
-                    s0, s1 = s[:2]
-                except (IndexError, ValueError):
-                    self.append(s)
-                    return
-                if s0 != '$':
-                    self.append(s)
-                    return
-                if s1 == '$':
-                    self.append('$')
-                elif s1 == '(':
-                    self.open_strip('$(')
-                elif s1 == ')':
-                    self.close_strip('$)')
+        if self.mode == SUBST_RAW:
+            self.add_strip = lambda x, s=self: s.append(x)
+        else:
+            self.add_strip = lambda x, s=self: None
+        self.in_strip = None
+        self.next_line()
+
+    def expand_token(self, token, lvars, within_list):
+        """Expand a single compiled instruction, appending the
+        expansion to the current result."""
+        op = token[0]
+        if op == _LITERAL:
+            self.append(token[1])
+        elif op == _DOLLAR:
+            self.append('$')
+        elif op == _OPEN_STRIP:
+            self.open_strip('$(')
+        elif op == _CLOSE_STRIP:
+            self.close_strip('$)')
+        else:
+            cache = self.cache
+            if not cache is None:
+                key = ('list', self.mode, self.in_strip, token[1])
+                fragment = cache.get(key, 0)
+                if fragment and _reads_ok(fragment[3], lvars):
+                    if _values_ok(fragment[4], self.gvars):
+                        self.replay(fragment)
+                        self.reads.extend(fragment[3])
+                        self.this_word()
+                        return
+                    # Something it read has changed, so make it again.
+                    fragment = 0
+                dependent = self.dependent
+
+            found, s = _eval_token(self, token, lvars)
+            if not found:
+                if not cache is None:
+                    cache[key] = None
+                return
+
+            # Before re-expanding the result, handle
+            # recursive expansion by copying the local
+            # variable dictionary and overwriting a null
+            # string for the value of the variable name
+            # we just expanded.
+            lv = lvars.copy()
+            lv[token[4]] = ''
+            self.substitute(s, lv, 0)
+            self.this_word()
+
+            if not cache is None and fragment is 0:
+                # We haven't expanded this variable in this environment
+                # before, or the values it read have changed since.  If
+                # it didn't depend on anything but the environment,
+                # expand it again on its own so we can replay it next
+                # time.  (We only do this after the fact so we never
+                # call a callable twice.)
+                if self.dependent == dependent:
+                    fragment = self.record_fragment(token, lvars)
                 else:
-                    key = s[1:]
-                    if key[0] == '{' or string.find(key, '.') >= 0:
-                        if key[0] == '{':
-                            key = key[1:-1]
-                        try:
-                            s = eval(key, self.gvars, lvars)
-                        except AttributeError, e:
-                            raise SCons.Errors.UserError, \
-                                  "Error trying to evaluate `%s': %s" % (s, e)
-                        except (IndexError, NameError, TypeError):
-                            return
-                        except SyntaxError,e:
-                            if self.target:
-                                raise SCons.Errors.BuildError, (self.target[0], "Syntax error `%s' trying to evaluate `%s'" % (e,s))
-                            else:
-                                raise SCons.Errors.UserError, "Syntax error `%s' trying to evaluate `%s'" % (e,s)
-                    else:
-                        if lvars.has_key(key):
-                            s = lvars[key]
-                        elif self.gvars.has_key(key):
-                            s = self.gvars[key]
-                        else:
-                            return
-
-                    # Before re-expanding the result, handle
-                    # recursive expansion by copying the local
-                    # variable dictionary and overwriting a null
-                    # string for the value of the variable name
-                    # we just expanded.
-                    lv = lvars.copy()
-                    var = string.split(key, '.')[0]
-                    lv[var] = ''
-                    self.substitute(s, lv, 0)
-                    self.this_word()
-            elif is_List(s) or is_Tuple(s):
-                for a in s:
-                    self.substitute(a, lvars, 1)
+                    fragment = None
+                cache[key] = fragment
+
+    def record_fragment(self, token, lvars):
+        """Expand a variable on its own and return the result in the
+        form we keep in the cache:  a tuple of the lines and words of
+        the expansion, how the first word attaches to the word before
+        it, the $( $) state at the end, the variable names that were
+        read from the environment, and snapshots of their values.
+        Returns None if the expansion turns out not to be cacheable
+        after all."""
+        r = _FragmentRecorder(self)
+        found, s = _eval_token(r, token, lvars)
+        if not found:
+            return None
+        lv = lvars.copy()
+        lv[token[4]] = ''
+        r.substitute(s, lv, 0)
+        if r.dependent:
+            return None
+        return (r.data, r.first_kind, r.in_strip, r.reads,
+                _snapshot_reads(r.reads, self.gvars))
+
+    def replay(self, fragment):
+        """Add the lines and words of a cached expansion to the result,
+        just as if we had expanded the variable here."""
+        lines, first_kind, in_strip = fragment[:3]
+        self.in_strip = None
+        rest = []
+        if lines:
+            rest = lines[0]
+            if rest:
+                if first_kind == _NEW_WORD:
                     self.next_word()
-            elif callable(s):
-                try:
-                    s = s(target=self.target,
-                         source=self.source,
-                         env=self.env,
-                         for_signature=(self.mode != SUBST_CMD))
-                except TypeError:
-                    # This probably indicates that it's a callable
-                    # object that doesn't match our calling arguments
-                    # (like an Action).
-                    s = str(s)
-                self.substitute(s, lvars, within_list)
-            elif s is None:
-                self.this_word()
-            else:
-                self.append(s)
-
-        def substitute(self, args, lvars, within_list):
-            """Substitute expansions in an argument or list of arguments.
-
-            This serves as a wrapper for splitting up a string into
-            separate tokens.
-            """
-
-            if is_String(args) and not isinstance(args, CmdStringHolder):
-                args = _separate_args.findall(args)
-                for a in args:
-                    if a[0] in ' \t\n\r\f\v':
-                        if '\n' in a:
-                            self.next_line()
-                        elif within_list:
-                            self.append(a)
-                        else:
-                            self.next_word()
-                    else:
-                        self.expand(a, lvars, within_list)
-            else:
-                self.expand(args, lvars, within_list)
-
-        def next_line(self):
-            """Arrange for the next word to start a new line.  This
-            is like starting a new word, except that we have to append
-            another line to the result."""
-            UserList.UserList.append(self, [])
+                elif first_kind == _THIS_WORD:
+                    self.this_word()
+                self.append(rest[0])
+                rest = rest[1:]
+        for word in rest:
             self.next_word()
+            self.append(word)
+        for line in lines[1:]:
+            self.next_line()
+            for word in line:
+                self.next_word()
+                self.append(word)
+        self.in_strip = in_strip
+
+    def expand(self, s, lvars, within_list):
+        """Expand a single "token" as necessary, appending the
+        expansion to the current result.
+
+        This handles expanding different types of things (strings,
+        lists, callables) appropriately.  It calls the wrapper
+        substitute() method to re-expand things as necessary, so that
+        the results of expansions of side-by-side strings still get
+        re-evaluated separately, not smushed together.
+        """
 
-        def this_word(self):
-            """Arrange for the next word to append to the end of the
-            current last word in the result."""
-            self.append = self.add_to_current_word
+        if is_String(s):
+            try:
+                s0, s1 = s[:2]
+            except (IndexError, ValueError):
+                self.append(s)
+                return
+            if s0 != '$':
+                self.append(s)
+                return
+            self.expand_token(_compile_token(to_String(s)), lvars, within_list)
+        elif is_List(s) or is_Tuple(s):
+            for a in s:
+                self.substitute(a, lvars, 1)
+                self.next_word()
+        elif callable(s):
+            self.dependent = self.dependent + 1
+            try:
+                s = s(target=self.target,
+                     source=self.source,
+                     env=self.env,
+                     for_signature=(self.mode != SUBST_CMD))
+            except TypeError:
+                # This probably indicates that it's a callable
+                # object that doesn't match our calling arguments
+                # (like an Action).
+                s = str(s)
+            self.substitute(s, lvars, within_list)
+        elif s is None:
+            self.this_word()
+        else:
+            self.append(s)
 
-        def next_word(self):
-            """Arrange for the next word to start a new word."""
-            self.append = self.add_new_word
+    def substitute(self, args, lvars, within_list):
+        """Substitute expansions in an argument or list of arguments.
 
-        def add_to_current_word(self, x):
-            """Append the string x to the end of the current last word
-            in the result.  If that is not possible, then just add
-            it as a new word.  Make sure the entire concatenated string
-            inherits the object attributes of x (in particular, the
-            escape function) by wrapping it as CmdStringHolder."""
+        This serves as a wrapper for splitting up a string into
+        separate tokens.
+        """
 
-            if not self.in_strip or self.mode != SUBST_SIG:
+        if type(args) is types.StringType:
+            program = _compile_list_template(args)
+        elif is_String(args) and not isinstance(args, CmdStringHolder):
+            program = _list_program(to_String(args))
+        else:
+            self.expand(args, lvars, within_list)
+            return
+
+        for token in program:
+            op = token[0]
+            if op == _SPACE:
+                if within_list:
+                    self.append(token[1])
+                else:
+                    self.next_word()
+            elif op == _NEWLINE:
+                self.next_line()
+            else:
+                self.expand_token(token, lvars, within_list)
+
+    def next_line(self):
+        """Arrange for the next word to start a new line.  This
+        is like starting a new word, except that we have to append
+        another line to the result."""
+        UserList.UserList.append(self, [])
+        self.next_word()
+
+    def this_word(self):
+        """Arrange for the next word to append to the end of the
+        current last word in the result."""
+        self.append = self.add_to_current_word
+
+    def next_word(self):
+        """Arrange for the next word to start a new word."""
+        self.append = self.add_new_word
+
+    def add_to_current_word(self, x):
+        """Append the string x to the end of the current last word
+        in the result.  If that is not possible, then just add
+        it as a new word.  Make sure the entire concatenated string
+        inherits the object attributes of x (in particular, the
+        escape function) by wrapping it as CmdStringHolder."""
+
+        if not self.in_strip or self.mode != SUBST_SIG:
+            try:
+                current_word = self[-1][-1]
+            except IndexError:
+                self.add_new_word(x)
+            else:
+                # All right, this is a hack and it should probably
+                # be refactored out of existence in the future.
+                # The issue is that we want to smoosh words together
+                # and make one file name that gets escaped if
+                # we're expanding something like foo$EXTENSION,
+                # but we don't want to smoosh them together if
+                # it's something like >$TARGET, because then we'll
+                # treat the '>' like it's part of the file name.
+                # So for now, just hard-code looking for the special
+                # command-line redirection characters...
                 try:
-                    current_word = self[-1][-1]
+                    last_char = str(current_word)[-1]
                 except IndexError:
+                    last_char = '\0'
+                if last_char in '<>|':
                     self.add_new_word(x)
                 else:
-                    # All right, this is a hack and it should probably
-                    # be refactored out of existence in the future.
-                    # The issue is that we want to smoosh words together
-                    # and make one file name that gets escaped if
-                    # we're expanding something like foo$EXTENSION,
-                    # but we don't want to smoosh them together if
-                    # it's something like >$TARGET, because then we'll
-                    # treat the '>' like it's part of the file name.
-                    # So for now, just hard-code looking for the special
-                    # command-line redirection characters...
-                    try:
-                        last_char = str(current_word)[-1]
-                    except IndexError:
-                        last_char = '\0'
-                    if last_char in '<>|':
-                        self.add_new_word(x)
-                    else:
-                        y = current_word + x
-
-                        # We used to treat a word appended to a literal
-                        # as a literal itself, but this caused problems
-                        # with interpreting quotes around space-separated
-                        # targets on command lines.  Removing this makes
-                        # none of the "substantive" end-to-end tests fail,
-                        # so we'll take this out but leave it commented
-                        # for now in case there's a problem not covered
-                        # by the test cases and we need to resurrect this.
-                        #literal1 = self.literal(self[-1][-1])
-                        #literal2 = self.literal(x)
-                        y = self.conv(y)
-                        if is_String(y):
-                            #y = CmdStringHolder(y, literal1 or literal2)
-                            y = CmdStringHolder(y, None)
-                        self[-1][-1] = y
-
-        def add_new_word(self, x):
-            if not self.in_strip or self.mode != SUBST_SIG:
+                    y = current_word + x
+
+                    # We used to treat a word appended to a literal
+                    # as a literal itself, but this caused problems
+                    # with interpreting quotes around space-separated
+                    # targets on command lines.  Removing this makes
+                    # none of the "substantive" end-to-end tests fail,
+                    # so we'll take this out but leave it commented
+                    # for now in case there's a problem not covered
+                    # by the test cases and we need to resurrect this.
+                    #literal1 = self.literal(self[-1][-1])
+                    #literal2 = self.literal(x)
+                    y = self.conv(y)
+                    if is_String(y):
+                        #y = CmdStringHolder(y, literal1 or literal2)
+                        y = CmdStringHolder(y, None)
+                    self[-1][-1] = y
+
+    def add_new_word(self, x):
+        if not self.in_strip or self.mode != SUBST_SIG:
+            # A CmdStringHolder (like the words of a cached expansion
+            # we replay) has already been converted.
+            if not isinstance(x, CmdStringHolder):
                 literal = self.literal(x)
                 x = self.conv(x)
                 if is_String(x):
                     x = CmdStringHolder(x, literal)
-                self[-1].append(x)
-            self.append = self.add_to_current_word
+            self[-1].append(x)
+        self.append = self.add_to_current_word
 
-        def literal(self, x):
-            try:
-                l = x.is_literal
-            except AttributeError:
-                return None
+    def literal(self, x):
+        try:
+            l = x.is_literal
+        except AttributeError:
+            return None
+        else:
+            return l()
+
+    def open_strip(self, x):
+        """Handle the "open strip" $( token."""
+        self.add_strip(x)
+        self.in_strip = 1
+
+    def close_strip(self, x):
+        """Handle the "close strip" $) token."""
+        self.add_strip(x)
+        self.in_strip = None
+
+# How the first word of an expansion attaches to the word before it:
+# by whatever the state was before we started expanding, as a new word,
+# or appended to the word in progress.
+_OUTER_WORD = 0
+_NEW_WORD   = 1
+_THIS_WORD  = 2
+
+class _FragmentRecorder(ListSubber):
+    """A ListSubber that expands a single variable on its own, for
+    later replay into other results by ListSubber.replay().
+
+    The words of the expansion come out the same no matter what
+    surrounds them, except for the first one, which might get glued on
+    to the word in progress.  So we keep track of the state that the
+    first word would have been added in.
+    """
+    first_kind = _OUTER_WORD
+    landed = None
+
+    def __init__(self, subber):
+        ListSubber.__init__(self, subber.env, subber.mode,
+                            subber.target, subber.source,
+                            subber.conv, subber.gvars, subber.cache)
+        self.in_strip = subber.in_strip
+        self.kind = _OUTER_WORD
+
+    def next_word(self):
+        if not self.landed:
+            self.kind = _NEW_WORD
+        ListSubber.next_word(self)
+
+    def this_word(self):
+        if not self.landed:
+            self.kind = _THIS_WORD
+        ListSubber.this_word(self)
+
+    def add_new_word(self, x):
+        if not self.landed:
+            if not self.in_strip or self.mode != SUBST_SIG:
+                self.landed = 1
+                self.first_kind = self.kind
+                # An object with its own signature string would
+                # contribute its plain string if it got glued on to
+                # a preceding word instead, so we can't reuse this.
+                if hasattr(x, 'for_signature') and not isinstance(x, Literal):
+                    self.dependent = self.dependent + 1
             else:
-                return l()
-
-        def open_strip(self, x):
-            """Handle the "open strip" $( token."""
-            self.add_strip(x)
-            self.in_strip = 1
+                self.kind = _THIS_WORD
+        ListSubber.add_new_word(self, x)
 
-        def close_strip(self, x):
-            """Handle the "close strip" $) token."""
-            self.add_strip(x)
-            self.in_strip = None
+def scons_subst_list(strSubst, env, mode=SUBST_RAW, target=None, source=None, gvars={}, lvars={}, conv=None, cache=None):
+    """Substitute construction variables in a string (or list or other
+    object) and separate the arguments into a command list.
 
+    The companion scons_subst() function (above) handles basic
+    substitutions within strings, so see that function instead
+    if that's what you're looking for.  The optional cache works
+    the same way, too.
+    """
+#    try:
+#        Subst_List_Strings[strSubst] = Subst_List_Strings[strSubst] + 1
+#    except KeyError:
+#        Subst_List_Strings[strSubst] = 1
+#    import SCons.Debug
+#    SCons.Debug.caller(1)
     if conv is None:
         conv = _strconv[mode]
+    else:
+        cache = None
 
     # Doing this every time is a bit of a waste, since the Executor
     # has typically already populated the OverrideEnvironment with
@@ -777,7 +1156,7 @@ def scons_subst_list(strSubst, env, mode=SUBST_RAW, target=None, source=None, gv
     # for expansion.
     gvars['__builtins__'] = __builtins__
 
-    ls = ListSubber(env, mode, target, source, conv, gvars)
+    ls = ListSubber(env, mode, target, source, conv, gvars, cache)
     ls.substitute(strSubst, lvars, 0)
 
     try:
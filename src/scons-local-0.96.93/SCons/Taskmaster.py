@@ -53,6 +53,7 @@ import string
 import sys
 import traceback
 
+import SCons.Debug
 import SCons.Node
 import SCons.Errors
 
@@ -154,6 +155,14 @@ class Task:
         """
         return self.node
 
+    def batch_key(self):
+        """Return a key shared by the tasks whose targets can all be
+        built by one run of a batch action (see the Batch class below),
+        or None if this one has to be executed by itself.  The last
+        element of the key is the largest number of tasks to put in
+        one batch."""
+        return None
+
     def execute(self):
         """Called to execute the task.
 
@@ -305,6 +314,82 @@ class Task:
         self.tm.exception_raise(self.exc_info())
 
 
+class Batch:
+    """A group of Tasks with the same batch key whose targets get built
+    by one run of their batch action (see SCons.Executor.execute_batch()).
+
+    The Job classes handle this like a single Task.  It gets prepared
+    and executed as one, but the results are handed back to each Task
+    separately, so a target whose output didn't show up fails (and
+    stops the build, or not) by itself, and every target that did
+    get built has its own signature information stored as usual.
+    """
+    def __init__(self, tasks):
+        self.tasks = tasks
+        self.errors = {}
+
+    def get_target(self):
+        return self.tasks[0].get_target()
+
+    def prepare(self):
+        for task in self.tasks:
+            task.prepare()
+
+    def execute(self):
+        import SCons.Executor
+        tasks = []
+        for task in self.tasks:
+            if not task.out_of_date:
+                # Nothing to build; see SCons.Job.gather().
+                task.execute()
+            elif not task.targets[0].retrieve_from_cache():
+                tasks.append(task)
+        if len(tasks) == 1:
+            try:
+                tasks[0].execute()
+            except KeyboardInterrupt:
+                raise
+            except:
+                self.errors[tasks[0]] = sys.exc_info()
+            return
+        if not tasks:
+            return
+        executors = map(lambda t: t.targets[0].get_executor(), tasks)
+        stat = SCons.Executor.execute_batch(executors)
+        for i in range(len(tasks)):
+            if stat[i]:
+                node = tasks[i].targets[0]
+                try:
+                    raise SCons.Errors.BuildError(node=node,
+                                                  errstr="Error %d" % stat[i])
+                except SCons.Errors.BuildError:
+                    self.errors[tasks[i]] = sys.exc_info()
+
+    def executed(self):
+        for task in self.tasks:
+            try:
+                exc = self.errors[task]
+            except KeyError:
+                task.executed()
+            else:
+                task.exception_set(exc)
+                task.failed()
+
+    def failed(self):
+        for task in self.tasks:
+            task.failed()
+
+    def postprocess(self):
+        for task in self.tasks:
+            task.postprocess()
+
+    def exception_set(self, exception=None):
+        if not exception:
+            exception = sys.exc_info()
+        for task in self.tasks:
+            task.exception_set(exception)
+
+
 def order(dependencies):
     """Re-order a list of dependencies (if we need to)."""
     return dependencies
@@ -369,6 +454,7 @@ class Taskmaster:
         self.ready_exc = None
 
         T = self.trace
+        R = SCons.Debug.tracer
 
         while 1:
             node = self.next_candidate()
@@ -389,6 +475,8 @@ class Taskmaster:
                 S = None
 
             if T: T.write('Taskmaster: %s:' % repr(str(node)))
+            if R: R.instant('consider', args={'node' : str(node),
+                                              'state' : StateString[state]})
 
             # Skip this node if it has already been evaluated:
             if state > SCons.Node.pending:
@@ -399,6 +487,7 @@ class Taskmaster:
             # Mark this node as being on the execution stack:
             node.set_state(SCons.Node.pending)
 
+            if R: scan_start = R.now()
             try:
                 children = node.children()
             except SystemExit:
@@ -422,6 +511,10 @@ class Taskmaster:
                 if T: T.write(' exception\n')
                 break
 
+            if R: R.complete('scan', scan_start,
+                             args={'node' : str(node),
+                                   'children' : len(children)})
+
             if T and children:
                 c = map(str, children)
                 c.sort()
@@ -535,6 +628,7 @@ class Taskmaster:
             self.ready = node
             if S: S.build = S.build + 1
             if T: T.write(' evaluating %s\n' % node)
+            if R: R.instant('ready', args={'node' : str(node)})
             break
 
     def next_task(self):
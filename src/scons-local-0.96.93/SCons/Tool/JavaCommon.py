@@ -34,6 +34,8 @@ import os.path
 import re
 import string
 
+import SCons.SConsign
+
 java_parsing = 1
 
 if java_parsing:
@@ -55,6 +57,42 @@ if java_parsing:
     _reToken = re.compile(r'(\n|\\\\|//|\\[\'"]|[\'"\{\}\;]|' +
                           r'[A-Za-z_][\w\.]*|/\*|\*/|\[\])')
 
+    # The same tokens, except that a whole comment or string literal
+    # (from the token that starts it through the token that ends it,
+    # or to the end of the file) comes back as one token, so the body
+    # of it doesn't have to be split up in Python only to be ignored.
+    # The bodies stop exactly where the token-by-token parse would
+    # find the end, so _reToken can split them up after all in the
+    # rare states that don't ignore them.
+    _reSkipToken = re.compile(r'(//[^\n]*\n?|' +
+                              r'/\*(?:[^*/]+|//|/\*|/|\*(?!/))*(?:\*/)?|' +
+                              r'"(?:[^"\\]+|\\[\\\'"]|\\)*"?|' +
+                              r"'(?:[^'\\]+|\\[\\'" + '"' + r"]|\\)*'?|" +
+                              r'\n|\\\\|\\[\'"]|[\{\}\;]|' +
+                              r'[A-Za-z_][\w\.]*|\*/|\[\])')
+
+    # The tokens (other than comments and string literals) that
+    # OuterState.parseToken() does something with.
+    _outerTokens = {
+        '{' : 1,
+        '}' : 1,
+        'new' : 1,
+        'class' : 1,
+        'interface' : 1,
+        'enum' : 1,
+        'package' : 1,
+    }
+
+    # The token that starts each kind of comment or string literal in
+    # _reSkipToken (the only tokens there that start with a slash or
+    # a quote), mapped to the token that ends it.
+    _skipEnd = {
+        '//' : '\n',
+        '/*' : '*/',
+        '"'  : '"',
+        "'"  : "'",
+    }
+
     class OuterState:
         """The initial state for parsing a Java file for classes,
         interfaces, and anonymous inner classes."""
@@ -211,11 +249,32 @@ if java_parsing:
         package = None
         initial = OuterState()
         currstate = initial
-        for token in _reToken.findall(contents):
+        for token in _reSkipToken.findall(contents):
             # The regex produces a bunch of groups, but only one will
             # have anything in it.
-            currstate = currstate.parseToken(token)
-            if trace: trace(token, currstate)
+            start = token[0]
+            if start == '/':
+                start = token[:2]
+            elif start != '"' and start != "'":
+                if currstate is initial and not _outerTokens.has_key(token):
+                    # Save a call for the many tokens (names, newlines
+                    # and so on) that don't mean anything to OuterState.
+                    continue
+                currstate = currstate.parseToken(token)
+                if trace: trace(token, currstate)
+                continue
+            # A comment or string literal:  hand over the token that
+            # starts it, and if that puts us in a state that ignores
+            # everything up to the token that ends it, we're done.
+            currstate = currstate.parseToken(start)
+            if trace: trace(start, currstate)
+            if currstate.__class__ is IgnoreState and \
+               currstate.ignore_until == _skipEnd[start]:
+                currstate = currstate.old_state
+                continue
+            for t in _reToken.findall(token[len(start):]):
+                currstate = currstate.parseToken(t)
+                if trace: trace(t, currstate)
         if initial.package:
             package = string.replace(initial.package, '.', os.sep)
         return (package, initial.listOutputs)
@@ -235,3 +294,11 @@ else:
         the path to the file is the same as the package name.
         """
         return os.path.split(file)
+
+def parse_java_node(node):
+    """Return what parse_java_file() does for a .java file Node.
+    The result is kept in the .sconsign file (see
+    SCons.SConsign.file_memo()), so a file is only parsed again
+    once its contents change."""
+    parse = lambda node: parse_java_file(node.get_abspath())
+    return SCons.SConsign.file_memo(node, 'java', parse)
@@ -40,6 +40,7 @@ __revision__ = "/home/scons/scons/branch.0/branch.96/baseline/src/engine/SCons/T
 
 import imp
 import sys
+import time
 
 import SCons.Errors
 import SCons.Scanner
@@ -66,6 +67,14 @@ IDLSuffixes = [".idl", ".IDL"]
 
 LaTeXSuffixes = [".tex", ".ltx", ".latex"]
 
+# How many different tool modules were imported, and how long finding
+# the modules for Tool objects took (for --debug=startup).  Most Tool
+# objects are for modules that an earlier one already imported, which
+# costs next to nothing, so only the first time counts.
+load_count = 0
+load_time = 0
+_loaded_modules = {}
+
 for suffix in CSuffixes:
     SourceFileScanner.add_scanner(suffix, CScanner)
 
@@ -82,7 +91,13 @@ class Tool:
         # remember these so we can merge them into the call
         self.init_kw = kw
 
+        global load_count, load_time
+        start_time = time.time()
         module = self._tool_module()
+        if not _loaded_modules.has_key(module):
+            _loaded_modules[module] = 1
+            load_count = load_count + 1
+        load_time = load_time + time.time() - start_time
         self.generate = module.generate
         self.exists = module.exists
 
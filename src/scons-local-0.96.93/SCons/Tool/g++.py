@@ -75,6 +75,13 @@ def generate(env):
         # Original line from Christian Engel added -DPIC:
         #env['SHCXXFLAGS'] = SCons.Util.CLVar('$CXXFLAGS -fPIC -DPIC')
         env['SHCXXFLAGS'] = SCons.Util.CLVar('$CXXFLAGS -fPIC')
+    # Batch compilation; see gcc.py.
+    env['_CCCOMBATCH'] = '$CPPFLAGS $_CPPDEFFLAGS $_CPPINCABSFLAGS'
+    if env['PLATFORM'] == 'darwin':
+        env['_CCCOMBATCH'] = env['_CCCOMBATCH'] + ' $_FRAMEWORKPATH'
+    env['CXXBATCHCOM'] = 'cd $BATCHDIR && $CXX -c $CXXFLAGS $_CCCOMBATCH ${SOURCES.abspath}'
+    env['SHCXXBATCHCOM'] = 'cd $BATCHDIR && $SHCXX -c $SHCXXFLAGS $_CCCOMBATCH ${SOURCES.abspath}'
+    env['BATCHOBJSUFFIX'] = '.o'
     # determine compiler version
     if env['CXX']:
         line = os.popen(env['CXX'] + ' --version').readline()
@@ -50,6 +50,15 @@ def generate(env):
         env['SHCCFLAGS'] = SCons.Util.CLVar('$CCFLAGS')
     else:
         env['SHCCFLAGS'] = SCons.Util.CLVar('$CCFLAGS -fPIC')
+    # Batch compilation (see $BATCHSIZE):  given several sources, gcc
+    # puts each object file in the current directory, so the command
+    # runs in a temporary directory and uses absolute paths.
+    env['_CCCOMBATCH'] = '$CPPFLAGS $_CPPDEFFLAGS $_CPPINCABSFLAGS'
+    if env['PLATFORM'] == 'darwin':
+        env['_CCCOMBATCH'] = env['_CCCOMBATCH'] + ' $_FRAMEWORKPATH'
+    env['CCBATCHCOM'] = 'cd $BATCHDIR && $CC -c $CCFLAGS $_CCCOMBATCH ${SOURCES.abspath}'
+    env['SHCCBATCHCOM'] = 'cd $BATCHDIR && $SHCC -c $SHCCFLAGS $_CCCOMBATCH ${SOURCES.abspath}'
+    env['BATCHOBJSUFFIX'] = '.o'
     # determine compiler version
     if env['CC']:
         line = os.popen(env['CC'] + ' --version').readline()
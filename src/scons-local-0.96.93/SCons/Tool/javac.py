@@ -40,7 +40,6 @@ import string
 import SCons.Action
 import SCons.Builder
 from SCons.Node.FS import _my_normcase
-from SCons.Tool.JavaCommon import parse_java_file
 import SCons.Util
 
 def classname(path):
@@ -69,9 +68,12 @@ def emit_java_classes(target, source, env):
             arg.extend(java_paths)
         os.path.walk(sdir.rdir().get_abspath(), visit, slist)
 
+    # Only load the Java parser once there's Java to parse.
+    from SCons.Tool.JavaCommon import parse_java_node
+
     tlist = []
     for f in slist:
-        pkg_dir, classes = parse_java_file(f.get_abspath())
+        pkg_dir, classes = parse_java_node(f)
         if pkg_dir:
             for c in classes:
                 t = target[0].Dir(pkg_dir).File(c+class_suffix)
@@ -43,7 +43,6 @@ import sys
 
 import SCons.Builder
 import SCons.Node.FS
-import SCons.Platform.win32
 import SCons.Script.SConscript
 import SCons.Util
 import SCons.Warnings
@@ -1164,6 +1163,8 @@ def get_visualstudio_versions():
     if not SCons.Util.can_read_reg:
         return []
 
+    from SCons.Platform.win32 import get_program_files_dir
+
     HLM = SCons.Util.HKEY_LOCAL_MACHINE
     KEYS = {
         r'Software\Microsoft\VisualStudio'      : '',
@@ -1210,7 +1211,7 @@ def get_visualstudio_versions():
                 # then we check the default locations.
                 # Note: The IDE's executable is not devenv.exe for VS8 Express.
                 if not id or not id[0]:
-                    files_dir = SCons.Platform.win32.get_program_files_dir()
+                    files_dir = get_program_files_dir()
                     version_num, suite = msvs_parse_version(p)
                     if version_num < 7.0:
                         vs = r'Microsoft Visual Studio\Common\MSDev98'
@@ -1323,6 +1324,8 @@ def get_msvs_install_dirs(version = None, vs8suite = None):
     if not SCons.Util.can_read_reg:
         return {}
 
+    from SCons.Platform.win32 import get_program_files_dir
+
     if not version:
         versions = get_visualstudio_versions()
         if versions:
@@ -1367,7 +1370,7 @@ def get_msvs_install_dirs(version = None, vs8suite = None):
             if rv.has_key('VCINSTALLDIR') and rv['VCINSTALLDIR']:
                 rv['VSINSTALLDIR'] = os.path.dirname(rv['VCINSTALLDIR'])
             else:
-                rv['VSINSTALLDIR'] = os.path.join(SCons.Platform.win32.get_program_files_dir(),'Microsoft Visual Studio')
+                rv['VSINSTALLDIR'] = os.path.join(get_program_files_dir(),'Microsoft Visual Studio')
     else:
         try:
             (rv['VSINSTALLDIR'], t) = SCons.Util.RegGetValue(SCons.Util.HKEY_LOCAL_MACHINE,
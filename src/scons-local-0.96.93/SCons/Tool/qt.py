@@ -41,6 +41,7 @@ import SCons.Action
 import SCons.Builder
 import SCons.Defaults
 import SCons.Scanner
+import SCons.SConsign
 import SCons.Tool
 import SCons.Util
 
@@ -74,6 +75,19 @@ def checkMocIncluded(target, source, env):
             "Generated moc file '%s' is not included by '%s'" %
             (str(moc), str(cpp)))
 
+# Q_OBJECT detection
+q_object_search = re.compile(r'[^A-Za-z0-9]Q_OBJECT[^A-Za-z0-9]')
+
+def search_q_object(node):
+    return not q_object_search.search(node.get_contents()) is None
+
+def has_q_object(node):
+    """Return whether a C++ source or header file Node has a Q_OBJECT
+    macro in it.  The answer is kept in the .sconsign file (see
+    SCons.SConsign.file_memo()), so a file is only searched again
+    once its contents change."""
+    return SCons.SConsign.file_memo(node, 'qt', search_q_object)
+
 def find_file(filename, paths, node_factory):
     retval = None
     for dir in paths:
@@ -111,8 +125,6 @@ class _Automoc:
         objBuilder = getattr(env, self.objBuilderName)
   
         # some regular expressions:
-        # Q_OBJECT detection
-        q_object_search = re.compile(r'[^A-Za-z0-9]Q_OBJECT[^A-Za-z0-9]') 
         # cxx and c comment 'eater'
         #comment = re.compile(r'(//.*)|(/\*(([^*])|(\*[^/]))*\*/)')
         # CW: something must be wrong with the regexp. See also bug #998222
@@ -140,7 +152,6 @@ class _Automoc:
                 # c or fortran source
                 continue
             #cpp_contents = comment.sub('', cpp.get_contents())
-            cpp_contents = cpp.get_contents()
             h=None
             for h_ext in header_extensions:
                 # try to find the header file in the corresponding source
@@ -151,11 +162,10 @@ class _Automoc:
                     if debug:
                         print "scons: qt: Scanning '%s' (header of '%s')" % (str(h), str(cpp))
                     #h_contents = comment.sub('', h.get_contents())
-                    h_contents = h.get_contents()
                     break
             if not h and debug:
                 print "scons: qt: no header for '%s'." % (str(cpp))
-            if h and q_object_search.search(h_contents):
+            if h and has_q_object(h):
                 # h file with the Q_OBJECT macro found -> add moc_cpp
                 moc_cpp = env.Moc(h)
                 moc_o = objBuilder(moc_cpp)
@@ -163,7 +173,7 @@ class _Automoc:
                 #moc_cpp.target_scanner = SCons.Defaults.CScan
                 if debug:
                     print "scons: qt: found Q_OBJECT macro in '%s', moc'ing to '%s'" % (str(h), str(moc_cpp))
-            if cpp and q_object_search.search(cpp_contents):
+            if cpp and has_q_object(cpp):
                 # cpp file with Q_OBJECT macro found -> add moc
                 # (to be included in cpp)
                 moc = env.Moc(cpp)
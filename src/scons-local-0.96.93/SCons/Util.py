@@ -280,114 +280,199 @@ class DisplayEngine:
         else:
             self.__call__ = self.dont_print
 
-def render_tree(root, child_func, prune=0, margin=[0], visited={}):
+IDX = lambda N: N and 1 or 0
+
+def walk_tree(root, child_func, visit, prune=0, maxdepth=None, visited=None):
     """
-    Render a tree of nodes into an ASCII tree view.
+    Walk a tree of nodes depth-first, calling visit() for each node.
+    This keeps its own stack instead of recursing, so deep dependency
+    graphs don't run into the Python recursion limit.
+
     root - the root node of the tree
     child_func - the function called to get the children of a node
+    visit - called as visit(node, name, margin, children) for each node,
+       where name is str(node), margin is as described for render_tree()
+       and children is the list of the node's children, or None if they
+       won't be walked because of maxdepth
     prune - don't visit the same node twice
-    margin - the format of the left margin to use for children of root.
-       1 results in a pipe, and 0 results in no pipe.
-    visited - a dictionary of visited nodes in the current branch if not prune,
-       or in the whole tree if prune.
+    maxdepth - don't walk the children of nodes this far below root
+    visited - a dictionary of nodes (by name) that shouldn't be visited
     """
-
-    rname = str(root)
-
-    if visited.has_key(rname):
-        return ""
-
-    children = child_func(root)
-    retval = ""
-    for pipe in margin[:-1]:
-        if pipe:
-            retval = retval + "| "
+    if visited is None:
+        visited = {}
+    # Without prune, only the nodes on the current branch are skipped
+    # (so a cycle can't loop forever); this maps them by name.
+    branch = {}
+    margin = [0]
+    # Each stack entry is [children, index of the next child, name of
+    # the parent node].
+    stack = [[[root], 0, None]]
+    while stack:
+        entry = stack[-1]
+        children = entry[0]
+        i = entry[1]
+        if i >= len(children):
+            del stack[-1]
+            del margin[-1]
+            if branch.has_key(entry[2]):
+                del branch[entry[2]]
+            continue
+        entry[1] = i + 1
+        margin[-1] = IDX(i < len(children) - 1)
+
+        node = children[i]
+        name = str(node)
+        if visited.has_key(name) or branch.has_key(name):
+            continue
+        if prune:
+            visited[name] = 1
+
+        if maxdepth is None or len(stack) <= maxdepth:
+            kids = child_func(node)
         else:
-            retval = retval + "  "
-
-    retval = retval + "+-" + rname + "\n"
-    if not prune:
-        visited = copy.copy(visited)
-    visited[rname] = 1
+            kids = None
+        visit(node, name, margin, kids)
 
-    for i in range(len(children)):
-        margin.append(i<len(children)-1)
-        retval = retval + render_tree(children[i], child_func, prune, margin, visited
-)
-        margin.pop()
+        if kids:
+            if not prune:
+                branch[name] = 1
+            stack.append([kids, 0, name])
+            margin.append(0)
 
-    return retval
-
-IDX = lambda N: N and 1 or 0
-
-def print_tree(root, child_func, prune=0, showtags=0, margin=[0], visited={}):
+def render_tree(root, child_func, prune=0, margin=[0], visited=None,
+                maxdepth=None):
     """
-    Print a tree of nodes.  This is like render_tree, except it prints
-    lines directly instead of creating a string representation in memory,
-    so that huge trees can be printed.
-
+    Render a tree of nodes into an ASCII tree view.
     root - the root node of the tree
     child_func - the function called to get the children of a node
     prune - don't visit the same node twice
-    showtags - print status information to the left of each node line
     margin - the format of the left margin to use for children of root.
        1 results in a pipe, and 0 results in no pipe.
     visited - a dictionary of visited nodes in the current branch if not prune,
        or in the whole tree if prune.
+    maxdepth - don't show the children of nodes this far below root
+    """
+    lines = []
+    prefix = map(lambda m: ["  ","| "][m], margin[:-1])
+    def visit(node, name, m, children, lines=lines, prefix=prefix):
+        margins = map(lambda m: ["  ","| "][m], m[:-1])
+        lines.append(string.join(prefix + margins + ['+-', name, '\n'], ''))
+    walk_tree(root, child_func, visit, prune, maxdepth, visited)
+    return string.join(lines, '')
+
+tree_legend = """\
+ E        = exists
+  R       = exists in repository only
+   b      = implicit builder
+   B      = explicit builder
+    S     = side effect
+     P    = precious
+      A   = always build
+       C  = current
+        N = no clean
+"""
+
+def tree_tags(node):
+    """Return the status flags that print_tree() shows for a node
+    (as described in tree_legend), without the brackets."""
+    return string.join([
+        ' E'[IDX(node.exists())],
+        ' R'[IDX(node.rexists() and not node.exists())],
+        ' BbB'[[0,1][IDX(node.has_explicit_builder())] +
+               [0,2][IDX(node.has_builder())]],
+        ' S'[IDX(node.side_effect)],
+        ' P'[IDX(node.precious)],
+        ' A'[IDX(node.always_build)],
+        ' C'[IDX(node.current())],
+        ' N'[IDX(node.noclean)],
+    ], '')
+
+def print_tree(root, child_func, prune=0, showtags=0, file=None,
+               maxdepth=None, visited=None):
     """
+    Print a tree of nodes.  This is like render_tree, except it writes
+    each line to the file as soon as it's known instead of creating a
+    string representation in memory, so that huge trees can be printed.
 
-    rname = str(root)
-
-    if visited.has_key(rname):
-        return
-
-    if showtags:
-
-        if showtags == 2:
-            print ' E        = exists'
-            print '  R       = exists in repository only'
-            print '   b      = implicit builder'
-            print '   B      = explicit builder'
-            print '    S     = side effect'
-            print '     P    = precious'
-            print '      A   = always build'
-            print '       C  = current'
-            print '        N = no clean'
-            print ''
-
-        tags = ['[']
-        tags.append(' E'[IDX(root.exists())])
-        tags.append(' R'[IDX(root.rexists() and not root.exists())])
-        tags.append(' BbB'[[0,1][IDX(root.has_explicit_builder())] +
-                           [0,2][IDX(root.has_builder())]])
-        tags.append(' S'[IDX(root.side_effect)])
-        tags.append(' P'[IDX(root.precious)])
-        tags.append(' A'[IDX(root.always_build)])
-        tags.append(' C'[IDX(root.current())])
-        tags.append(' N'[IDX(root.noclean)])
-        tags.append(']')
+    root - the root node of the tree
+    child_func - the function called to get the children of a node
+    prune - don't visit the same node twice
+    showtags - print status information to the left of each node line;
+       2 also prints a legend for it first
+    file - the file-like object to write to (default sys.stdout)
+    maxdepth - don't show the children of nodes this far below root
+    visited - a dictionary of visited nodes in the whole tree if prune
+    """
+    if file is None:
+        file = sys.stdout
 
-    else:
-        tags = []
+    if showtags == 2:
+        file.write(tree_legend + '\n')
 
-    def MMM(m):
-        return ["  ","| "][m]
-    margins = map(MMM, margin[:-1])
+    def visit(node, name, margin, children, write=file.write, showtags=showtags):
+        margins = map(lambda m: ["  ","| "][m], margin[:-1])
+        if showtags:
+            margins.insert(0, '[' + tree_tags(node) + ']')
+        write(string.join(margins + ['+-', name, '\n'], ''))
+    walk_tree(root, child_func, visit, prune, maxdepth, visited)
 
-    print string.join(tags + margins + ['+-', rname], '')
+def print_tree_graph(root, child_func, format='json', showtags=0, file=None,
+                     maxdepth=None):
+    """
+    Print a tree of nodes as a graph for other programs to read:  each
+    node is written once, with the names of its children, as it's
+    walked.  The format is either 'json' (an object with a "nodes"
+    list) or 'dot' (a Graphviz digraph).  A JSON tree is written all
+    on one line, so that the trees of several targets, written one
+    after the other, can be read back one line at a time.
 
-    if prune:
-        visited[rname] = 1
+    root - the root node of the tree
+    child_func - the function called to get the children of a node
+    format - 'json' or 'dot'
+    showtags - include the status flags shown by print_tree
+    file - the file-like object to write to (default sys.stdout)
+    maxdepth - don't list the children of nodes this far below root
+    """
+    import SCons.Debug
+    quote = SCons.Debug.json_string
+
+    if file is None:
+        file = sys.stdout
+
+    if format == 'json':
+        file.write('{"root": %s, "nodes": [' % quote(str(root)))
+        def visit(node, name, margin, children, write=file.write,
+                  quote=quote, showtags=showtags, first=[1]):
+            items = ['"name": ' + quote(name)]
+            if showtags:
+                items.append('"status": ' + quote(tree_tags(node)))
+            if not children is None:
+                kids = map(lambda c, q=quote: q(str(c)), children)
+                items.append('"children": [' + string.join(kids, ', ') + ']')
+            if first:
+                first[:] = []
+                sep = ''
+            else:
+                sep = ', '
+            write(sep + '{' + string.join(items, ', ') + '}')
+        end = ']}\n'
+    elif format == 'dot':
+        file.write('digraph %s {\n' % quote(str(root)))
+        def visit(node, name, margin, children, write=file.write,
+                  quote=quote, showtags=showtags):
+            qname = quote(name)
+            if showtags:
+                write('    %s [tooltip=%s];\n' % (qname, quote(tree_tags(node))))
+            else:
+                write('    %s;\n' % qname)
+            for c in children or []:
+                write('    %s -> %s;\n' % (qname, quote(str(c))))
+        end = '}\n'
+    else:
+        raise ValueError, "unknown tree format `%s'" % format
 
-    children = child_func(root)
-    if children:
-        margin.append(1)
-        map(lambda C, cf=child_func, p=prune, i=IDX(showtags), m=margin, v=visited:
-                   print_tree(C, cf, p, i, m, v),
-            children[:-1])
-        margin[-1] = 0
-        print_tree(children[-1], child_func, prune, IDX(showtags), margin, visited)
-        margin.pop()
+    walk_tree(root, child_func, visit, 1, maxdepth)
+    file.write(end)
 
 
 
@@ -485,6 +570,11 @@ class Proxy:
            attribute doesn't exist, AttributeError is raised"""
         return getattr(self.__subject, name)
 
+    def __setstate__(self, state):
+        """Restore an unpickled Proxy.  (Otherwise looking for this
+        method would look for the subject that isn't set yet.)"""
+        self.__dict__.update(state)
+
     def get(self):
         """Retrieve the entire wrapped object"""
         return self.__subject
@@ -561,14 +651,7 @@ if can_read_reg:
 
 if sys.platform == 'win32':
 
-    def WhereIs(file, path=None, pathext=None, reject=[]):
-        if path is None:
-            try:
-                path = os.environ['PATH']
-            except KeyError:
-                return None
-        if is_String(path):
-            path = string.split(path, os.pathsep)
+    def _program_extensions(pathext):
         if pathext is None:
             try:
                 pathext = os.environ['PATHEXT']
@@ -576,84 +659,145 @@ if sys.platform == 'win32':
                 pathext = '.COM;.EXE;.BAT;.CMD'
         if is_String(pathext):
             pathext = string.split(pathext, os.pathsep)
-        for ext in pathext:
-            if string.lower(ext) == string.lower(file[-len(ext):]):
-                pathext = ['']
-                break
-        if not is_List(reject) and not is_Tuple(reject):
-            reject = [reject]
-        for dir in path:
-            f = os.path.join(dir, file)
-            for ext in pathext:
-                fext = f + ext
-                if os.path.isfile(fext):
-                    try:
-                        reject.index(fext)
-                    except ValueError:
-                        return os.path.normpath(fext)
-                    continue
-        return None
+        return pathext
+
+    def _is_program(f):
+        return os.path.isfile(f)
 
 elif os.name == 'os2':
 
-    def WhereIs(file, path=None, pathext=None, reject=[]):
-        if path is None:
-            try:
-                path = os.environ['PATH']
-            except KeyError:
-                return None
-        if is_String(path):
-            path = string.split(path, os.pathsep)
+    def _program_extensions(pathext):
         if pathext is None:
             pathext = ['.exe', '.cmd']
-        for ext in pathext:
-            if string.lower(ext) == string.lower(file[-len(ext):]):
-                pathext = ['']
-                break
-        if not is_List(reject) and not is_Tuple(reject):
-            reject = [reject]
-        for dir in path:
-            f = os.path.join(dir, file)
-            for ext in pathext:
-                fext = f + ext
-                if os.path.isfile(fext):
-                    try:
-                        reject.index(fext)
-                    except ValueError:
-                        return os.path.normpath(fext)
-                    continue
-        return None
+        if is_String(pathext):
+            pathext = string.split(pathext, os.pathsep)
+        return pathext
+
+    def _is_program(f):
+        return os.path.isfile(f)
 
 else:
 
-    def WhereIs(file, path=None, pathext=None, reject=[]):
-        if path is None:
-            try:
-                path = os.environ['PATH']
-            except KeyError:
-                return None
-        if is_String(path):
-            path = string.split(path, os.pathsep)
-        if not is_List(reject) and not is_Tuple(reject):
-            reject = [reject]
-        for d in path:
-            f = os.path.join(d, file)
-            if os.path.isfile(f):
-                try:
-                    st = os.stat(f)
-                except OSError:
-                    # os.stat() raises OSError, not IOError if the file
-                    # doesn't exist, so in this case we let IOError get
-                    # raised so as to not mask possibly serious disk or
-                    # network issues.
+    def _program_extensions(pathext):
+        return ['']
+
+    def _is_program(f):
+        if not os.path.isfile(f):
+            return None
+        try:
+            st = os.stat(f)
+        except OSError:
+            # os.stat() raises OSError, not IOError if the file
+            # doesn't exist, so in this case we let IOError get
+            # raised so as to not mask possibly serious disk or
+            # network issues.
+            return None
+        return stat.S_IMODE(st[stat.ST_MODE]) & 0111
+
+# Where programs have been found, for every search path (and list of
+# extensions and rejected files) they have been looked up in, and the
+# names of the files in each directory on those search paths.  A search
+# path that differs in any way gets its own entry, so changing $PATH
+# doesn't need any special handling, but programs that get installed
+# (or removed) while SCons runs go unnoticed until the cache is cleared.
+_where_is_cache = {}
+_path_dir_names = {}
+
+def clear_where_is_cache():
+    """Forget where programs have been found."""
+    _where_is_cache.clear()
+    _path_dir_names.clear()
+
+def _dir_names(dir):
+    """Return a dictionary of the names of the files in a directory on
+    the search path (os.path.normcase()d), listing it only the first
+    time it gets searched."""
+    try:
+        return _path_dir_names[dir]
+    except KeyError:
+        names = {}
+        try:
+            entries = os.listdir(dir)
+        except OSError:
+            entries = []
+        for e in entries:
+            names[os.path.normcase(e)] = 1
+        _path_dir_names[dir] = names
+        return names
+
+def WhereIsAll(files, path=None, pathext=None, reject=[]):
+    """Look up a list of programs in the search path (by default, the
+    PATH of the SCons process), and return the list of their full paths,
+    with None for the ones that can't be found.  The search path is
+    only gone through once for all of them:  each directory in it gets
+    listed the first time it's searched, and after that only programs
+    whose names are in the listing are checked for being executable
+    files.  Where programs were found is remembered for the next time
+    they are looked up in the same search path."""
+    if path is None:
+        try:
+            path = os.environ['PATH']
+        except KeyError:
+            return [None] * len(files)
+    if is_String(path):
+        path = string.split(path, os.pathsep)
+    pathext = _program_extensions(pathext)
+    if not is_List(reject) and not is_Tuple(reject):
+        reject = [reject]
+
+    # What relative directories contain depends on the current
+    # directory, so don't remember anything about those.
+    cacheable = not filter(lambda d: not os.path.isabs(d), path)
+    if cacheable:
+        key = (tuple(path), tuple(pathext), tuple(reject))
+        try:
+            found = _where_is_cache[key]
+        except KeyError:
+            found = _where_is_cache[key] = {}
+    else:
+        found = {}
+
+    missing = []
+    for file in files:
+        if not found.has_key(file):
+            found[file] = None
+            exts = pathext
+            for ext in pathext:
+                if string.lower(ext) == string.lower(file[-len(ext):]):
+                    exts = ['']
+                    break
+            missing.append((file, exts))
+
+    for dir in path:
+        if not missing:
+            break
+        if cacheable:
+            names = _dir_names(dir)
+        still_missing = []
+        for file, exts in missing:
+            for ext in exts:
+                fext = file + ext
+                if cacheable and not os.path.dirname(fext) and \
+                   not names.has_key(os.path.normcase(fext)):
                     continue
-                if stat.S_IMODE(st[stat.ST_MODE]) & 0111:
+                f = os.path.join(dir, fext)
+                if _is_program(f):
                     try:
                         reject.index(f)
                     except ValueError:
-                        return os.path.normpath(f)
-                    continue
-        return None
+                        found[file] = os.path.normpath(f)
+                        break
+            else:
+                still_missing.append((file, exts))
+        missing = still_missing
+
+    return map(lambda file, found=found: found[file], files)
+
+def WhereIs(file, path=None, pathext=None, reject=[]):
+    """Return the full path of a program in the search path (by
+    default, the PATH of the SCons process), or None if it can't be
+    found.  See WhereIsAll()."""
+    return WhereIsAll([file], path, pathext, reject)[0]
 
 def PrependPath(oldpath, newpath, sep = os.pathsep):
     """This prepends newpath elements to the given oldpath.  Will only
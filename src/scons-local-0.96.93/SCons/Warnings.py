@@ -60,6 +60,9 @@ class NoParallelSupportWarning(Warning):
 class ReservedVariableWarning(Warning):
     pass
 
+class SnapshotWarning(Warning):
+    pass
+
 class MisleadingKeywordsWarning(Warning):
     pass
 
@@ -161,5 +161,12 @@ sys.path = libs + sys.path
 # END STANDARD SCons SCRIPT HEADER
 ##############################################################################
 
+# If "scons --server" is running here, it can do the build without
+# this process loading the build engine or reading the SConscript files.
+import SCons.Client
+status = SCons.Client.run(sys.argv[1:])
+if not status is None:
+    sys.exit(status)
+
 import SCons.Script
 SCons.Script.main()